@@ -1,10 +1,14 @@
 import asyncio
 
 from fastapi import APIRouter
-from lnbits.tasks import create_permanent_unique_task
+from lnbits.tasks import create_permanent_unique_task, create_unique_task
 from loguru import logger
 
 from .crud import db
+from .payouts import run_payout_worker
+from .poller import run_lamassu_poller
+from .scheduler import run_fixed_scheduler
+from .services import warm_caches
 from .tasks import wait_for_paid_invoices
 from .views import dca_admin_generic_router
 from .views_api import dca_admin_api_router
@@ -42,6 +46,16 @@ def dca_admin_stop():
 def dca_admin_start():
     task = create_permanent_unique_task("ext_dca_admin", wait_for_paid_invoices)
     scheduled_tasks.append(task)
+    scheduled_tasks.append(create_unique_task("ext_dca_admin_warmup", warm_caches()))
+    scheduled_tasks.append(
+        create_permanent_unique_task("ext_dca_admin_payouts", run_payout_worker)
+    )
+    scheduled_tasks.append(
+        create_permanent_unique_task("ext_dca_admin_fixed", run_fixed_scheduler)
+    )
+    scheduled_tasks.append(
+        create_permanent_unique_task("ext_dca_admin_poller", run_lamassu_poller)
+    )
 
 
 __all__ = [
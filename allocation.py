@@ -0,0 +1,241 @@
+# Description: DCA Admin Extension - In-memory allocation index for flow mode
+
+import heapq
+from array import array
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .models import CommissionRecipient, DCAClient, DCAMode
+
+CENT = Decimal("0.01")
+BASIS_POINTS = 10_000
+
+
+def to_cents(value) -> int:
+    """Fiat amount (Decimal, float or str) to integer centavos."""
+    amount = value if isinstance(value, Decimal) else Decimal(str(value))
+    return int(amount.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+
+def from_cents(cents: int) -> Decimal:
+    return (Decimal(cents) / 100).quantize(CENT)
+
+
+def largest_remainder(
+    amount: int, weights: Sequence[int], total: Optional[int] = None
+) -> List[int]:
+    """
+    Integer shares of `amount` in proportion weight / total. Every share is
+    floored, then the units the flooring lost go one each to the largest
+    remainders, earlier weights first on ties. The shares add up to exactly
+    amount * sum(weights) // total, i.e. all of `amount` when `total` is
+    left as sum(weights).
+    """
+    total_weight = sum(weights)
+    total = total_weight if total is None else total
+    if total <= 0 or amount <= 0:
+        return [0] * len(weights)
+    shares = []
+    remainders = []
+    for weight in weights:
+        share, remainder = divmod(weight * amount, total)
+        shares.append(share)
+        remainders.append(remainder)
+    leftover = amount * total_weight // total - sum(shares)
+    if leftover > 0:
+        largest = heapq.nlargest(
+            leftover, range(len(weights)), key=remainders.__getitem__
+        )
+        for i in largest:
+            shares[i] += 1
+    return shares
+
+
+def is_flow_eligible(client: DCAClient) -> bool:
+    return (
+        client.dca_mode == DCAMode.FLOW
+        and client.status == "active"
+        and client.current_balance > 0
+    )
+
+
+class FlowAllocationIndex:
+    """
+    Active flow clients and their balances, kept in memory so allocating a
+    transaction never has to scan dca_admin.clients.
+
+    Balances are integer centavos in a contiguous array alongside a running
+    total. crud.py keeps the index in step with client writes and
+    distributions; until `load` is called those hooks are no-ops.
+    """
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self.client_ids: List[str] = []
+        self.balances = array("q")
+        self.total = 0
+        self._position: Dict[str, int] = {}
+
+    def load(self, clients: Iterable[DCAClient]) -> None:
+        """Rebuild from the database's view of the clients."""
+        self.client_ids = []
+        self.balances = array("q")
+        self._position = {}
+        self.total = 0
+        self.loaded = True
+        for client in clients:
+            self.sync_client(client)
+
+    def clear(self) -> None:
+        """Forget everything, the next use reloads from the database."""
+        self.__init__()  # type: ignore[misc]
+
+    def __len__(self) -> int:
+        return len(self.client_ids)
+
+    def balance(self, client_id: str) -> int:
+        position = self._position.get(client_id)
+        return 0 if position is None else self.balances[position]
+
+    def upsert(self, client_id: str, balance_cents: int) -> None:
+        if balance_cents <= 0:
+            self.remove(client_id)
+            return
+        position = self._position.get(client_id)
+        if position is None:
+            self._position[client_id] = len(self.client_ids)
+            self.client_ids.append(client_id)
+            self.balances.append(balance_cents)
+        else:
+            self.total -= self.balances[position]
+            self.balances[position] = balance_cents
+        self.total += balance_cents
+
+    def remove(self, client_id: str) -> None:
+        """O(1) removal by moving the last slot into the freed one."""
+        position = self._position.pop(client_id, None)
+        if position is None:
+            return
+        self.total -= self.balances[position]
+        last_id = self.client_ids.pop()
+        last_balance = self.balances.pop()
+        if position < len(self.client_ids):
+            self.client_ids[position] = last_id
+            self.balances[position] = last_balance
+            self._position[last_id] = position
+
+    def sync_client(self, client: DCAClient) -> None:
+        """Insert, update or drop a client after it was written."""
+        if not self.loaded:
+            return
+        if is_flow_eligible(client):
+            self.upsert(client.id, to_cents(client.current_balance))
+        else:
+            self.remove(client.id)
+
+    def remove_client(self, client_id: str) -> None:
+        if self.loaded:
+            self.remove(client_id)
+
+    def apply_debits(self, debits: Iterable[Tuple[str, int]]) -> None:
+        """Subtract distributed centavos from client balances."""
+        if not self.loaded:
+            return
+        for client_id, cents in debits:
+            position = self._position.get(client_id)
+            if position is None:
+                continue
+            self.upsert(client_id, self.balances[position] - cents)
+
+    def allocate(self, amount_cents: int) -> List[Tuple[str, int]]:
+        """
+        Shares of `amount_cents` proportional to balance, capped at each
+        balance. Largest remainder rounding makes them add up to exactly
+        the amount, or to the total balance if that is smaller.
+        """
+        total = self.total
+        if total <= 0 or amount_cents <= 0:
+            return []
+        amount = min(amount_cents, total)
+        shares = largest_remainder(amount, self.balances, total)
+        return [
+            (cid, share) for cid, share in zip(self.client_ids, shares) if share > 0
+        ]
+
+
+def to_basis_points(percentage) -> int:
+    """Allocation percentage (0-100) to integer basis points."""
+    amount = percentage if isinstance(percentage, Decimal) else Decimal(str(percentage))
+    return int((amount * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+class CommissionSplitPlan:
+    """
+    How commissions are split among the active recipients, built once from
+    dca_admin.commission_recipients instead of on every cycle.
+
+    Recipients are ordered by weight, largest first, and each share is the
+    difference of two cumulative bounds, amount * cumulative // 10_000. The
+    shares add up to exactly amount * total // 10_000 and each is within a
+    unit of its exact value; the order decides who gets the odd unit. If the
+    weights come to less than 100% the rest stays undistributed. crud.py
+    clears the plan on recipient writes; `load` rebuilds it.
+    """
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self.recipients: List[CommissionRecipient] = []
+        self.basis_points: List[int] = []
+        self.cumulative: List[int] = []
+
+    def load(self, recipients: Iterable[CommissionRecipient]) -> None:
+        weighted = [
+            (to_basis_points(recipient.allocation_percentage), recipient)
+            for recipient in recipients
+        ]
+        weighted = [(bp, recipient) for bp, recipient in weighted if bp > 0]
+        weighted.sort(key=lambda item: (-item[0], item[1].id))
+        total = sum(bp for bp, _ in weighted)
+        if total > BASIS_POINTS:
+            raise ValueError(
+                f"Commission recipients are allocated {from_cents(total)}%, "
+                "more than 100%"
+            )
+        self.recipients = [recipient for _, recipient in weighted]
+        self.basis_points = [bp for bp, _ in weighted]
+        self.cumulative = []
+        running = 0
+        for bp in self.basis_points:
+            running += bp
+            self.cumulative.append(running)
+        self.loaded = True
+
+    def clear(self) -> None:
+        """Forget the recipients, the next use reloads them."""
+        self.__init__()  # type: ignore[misc]
+
+    @property
+    def total(self) -> int:
+        """Basis points distributed, 10_000 when recipients cover 100%."""
+        return self.cumulative[-1] if self.cumulative else 0
+
+    def split(self, amounts: Sequence[int]) -> List[List[int]]:
+        """
+        Split each of `amounts` at once, returning one row of shares per
+        amount in `recipients` order.
+        """
+        cumulative = self.cumulative
+        shares = []
+        for amount in amounts:
+            previous = 0
+            row = []
+            for bound in cumulative:
+                bound = amount * bound // BASIS_POINTS
+                row.append(bound - previous)
+                previous = bound
+            shares.append(row)
+        return shares
+
+
+flow_index = FlowAllocationIndex()
+commission_plan = CommissionSplitPlan()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Peak memory of the list-based vs streaming cash-out parsers
+
+Writes a synthetic positional cash_out_txs.csv and runs each parser in a
+fresh interpreter so the reported max RSS belongs to that parser alone.
+Run as a module from the directory holding the extension:
+
+    python -m dca_admin.benchmarks.bench_parse_memory --rows 1000000
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from .synthetic import write_synthetic_csv
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+MODES = {
+    "list": (
+        "txs = fetcher.parse_cash_out_transactions()\n"
+        "result = fetcher.filter_dca_transactions(txs)\n"
+    ),
+    "stream": ("result = fetcher.collect_dca_transactions()\n"),
+}
+
+RUNNER = """
+import resource, sys
+sys.path.insert(0, {repo_root!r})
+from transaction_fetcher import LamassuTransactionFetcher
+fetcher = LamassuTransactionFetcher({{
+    'server_ip': 'localhost',
+    'server_log_dir': {log_dir!r},
+    'old_server_log_dir': {log_dir!r},
+}})
+{body}
+print(len(result), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        write_synthetic_csv(
+            Path(log_dir) / "cash_out_txs.csv", args.rows, qualifying_ratio=0.05
+        )
+
+        for mode, body in MODES.items():
+            code = RUNNER.format(repo_root=str(REPO_ROOT), log_dir=log_dir, body=body)
+            out = subprocess.run(
+                [sys.executable, "-c", code], capture_output=True, text=True, check=True
+            ).stdout.split()
+            # ru_maxrss is KiB on Linux
+            peak = int(out[1]) / 1024
+            print(f"{mode:>6}: {out[0]} qualifying rows, peak RSS {peak:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Payout throughput: PayoutDispatcher.run_once on the invoice path vs the
+internal fast path
+
+Runs against a throwaway LNbits core database with the default fake funding
+source and a fixed fiat rate, and a dca_admin database holding one pending
+distribution per client wallet. The invoice path calls the funding source
+once per payout. With the fake wallet that is a local signature, so use
+--funding-latency-ms to model the RPC round-trip of a real node.
+
+    python benchmarks/bench_payouts.py --payouts 500 --funding-latency-ms 20
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+MODES = ("invoice", "internal")
+
+
+async def run(
+    mode: str,
+    payouts: int,
+    amount_sats: int,
+    funding_latency_ms: float,
+    concurrency: int,
+) -> None:
+    from lnbits.core.crud import create_wallet
+    from lnbits.core.helpers import migrate_databases
+    from lnbits.core.services import (
+        create_user_account,
+        payments,
+        update_wallet_balance,
+    )
+    from lnbits.wallets import get_funding_source, set_funding_source
+    from loguru import logger
+
+    logger.remove()
+
+    # Both paths record the wallet's fiat value of each payment, keep price
+    # feeds out of the measurement
+    async def fixed_rate(amount_sat, currency):
+        return amount_sat / 1_000
+
+    payments.satoshis_amount_as_fiat = fixed_rate
+
+    package = REPO_ROOT.name
+    crud = __import__(f"{package}.crud", fromlist=["crud"])
+    migrations = __import__(f"{package}.migrations", fromlist=["migrations"])
+    models = __import__(f"{package}.models", fromlist=["models"])
+    payouts_module = __import__(f"{package}.payouts", fromlist=["payouts"])
+
+    # LNbits starts with the same FakeWallet instance it uses for internal
+    # invoices, give the funding source its own so only it gets the latency
+    set_funding_source("FakeWallet")
+    funding_source = get_funding_source()
+    create_invoice = funding_source.create_invoice
+
+    async def slow_create_invoice(*args, **kwargs):
+        await asyncio.sleep(funding_latency_ms / 1000)
+        return await create_invoice(*args, **kwargs)
+
+    funding_source.create_invoice = slow_create_invoice  # type: ignore[method-assign]
+
+    await migrate_databases()
+    for name, migrate in sorted(vars(migrations).items()):
+        if re.match(r"m\d{3}_", name):
+            await migrate(crud.db)
+    user = await create_user_account()
+    source = await create_wallet(user_id=user.id, wallet_name="payouts")
+    await update_wallet_balance(source, payouts * amount_sats + 10_000)
+    now = datetime.utcnow()
+    for i in range(payouts):
+        wallet = await create_wallet(user_id=user.id, wallet_name=f"client {i}")
+        client = await crud.create_dca_client(
+            models.CreateDCAClientData(
+                user_id=f"user-{i}",
+                wallet_id=wallet.id,
+                initial_deposit=Decimal(1_000),
+            ),
+            "admin",
+        )
+        await crud.db.execute(
+            """
+            INSERT INTO dca_admin.distributions (
+                id, client_id, amount_fiat, amount_satoshis, exchange_rate,
+                distribution_type, status, created_at
+            ) VALUES (
+                :id, :client_id, 1, :sats, 1, 'flow', 'pending', :created_at
+            )
+            """,
+            {
+                "id": f"bench-{i}",
+                "client_id": client.id,
+                "sats": amount_sats,
+                "created_at": now,
+            },
+        )
+
+    internal_backend = (
+        payouts_module.InternalPayoutBackend() if mode == "internal" else None
+    )
+    dispatcher = payouts_module.PayoutDispatcher(
+        payouts_module.LNbitsPayoutBackend(),
+        source.id,
+        concurrency,
+        batch_size=payouts,
+        internal_backend=internal_backend,
+    )
+    start = time.perf_counter()
+    completed = await dispatcher.run_once()
+    print(time.perf_counter() - start)
+    assert completed == payouts, f"{completed} of {payouts} payouts completed"
+
+    # let payment notifications finish before the loop and database go away
+    pending = asyncio.all_tasks() - {asyncio.current_task()}
+    if pending:
+        await asyncio.wait(pending, timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--payouts", type=int, default=200)
+    parser.add_argument("--amount-sats", type=int, default=1_000)
+    parser.add_argument("--funding-latency-ms", type=float, default=0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        data_folder = tempfile.mkdtemp()
+        try:
+            # LNbits reads its settings on import
+            os.environ["LNBITS_DATA_FOLDER"] = data_folder
+            os.environ.pop("LNBITS_DATABASE_URL", None)
+            sys.path.insert(0, str(REPO_ROOT.parent))
+            asyncio.run(
+                run(
+                    args.mode,
+                    args.payouts,
+                    args.amount_sats,
+                    args.funding_latency_ms,
+                    args.concurrency,
+                )
+            )
+        finally:
+            shutil.rmtree(data_folder, ignore_errors=True)
+        return
+
+    print(
+        f"{args.payouts} payouts, funding latency {args.funding_latency_ms:g} ms,"
+        f" concurrency {args.concurrency}"
+    )
+    for mode in MODES:
+        # a fresh interpreter and database each, so neither run inherits the
+        # other's payments or background notification tasks
+        result = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                *("--mode", mode),
+                *("--payouts", str(args.payouts)),
+                *("--amount-sats", str(args.amount_sats)),
+                *("--funding-latency-ms", str(args.funding_latency_ms)),
+                *("--concurrency", str(args.concurrency)),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        seconds = float(result.stdout.strip().splitlines()[-1])
+        print(f"{mode:>9}: {seconds:7.2f} s  {args.payouts / seconds:8.1f} payouts/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+pytest-benchmark cases, kept out of the default `pytest` run
+
+    pytest benchmarks --benchmark-autosave
+    pytest benchmarks --benchmark-compare
+
+Every input comes from a fixed seed, so a saved run compares like for like
+with one from another commit. The 1M row CSV cases take minutes, set
+DCA_BENCH_LARGE=1 to include them.
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from ..tests.conftest import ssh_standin  # noqa: F401
+from ..transaction_fetcher import LamassuTransactionFetcher
+from .synthetic import SIZES, write_synthetic_csv
+
+CSV_SIZES = ["10k", "100k"]
+if os.getenv("DCA_BENCH_LARGE"):
+    CSV_SIZES.append("1M")
+
+
+@pytest.fixture(scope="session", params=CSV_SIZES)
+def cash_out_dir(request, tmp_path_factory) -> Path:
+    """A server_log_dir holding a synthetic cash_out_txs.csv."""
+    log_dir = tmp_path_factory.mktemp(f"lamassu_{request.param}")
+    write_synthetic_csv(log_dir / "cash_out_txs.csv", SIZES[request.param])
+    return log_dir
+
+
+@pytest.fixture
+def fetcher(cash_out_dir: Path) -> LamassuTransactionFetcher:
+    return LamassuTransactionFetcher(
+        {
+            "server_ip": "localhost",
+            "server_log_dir": str(cash_out_dir),
+            "old_server_log_dir": str(cash_out_dir / "old"),
+        }
+    )
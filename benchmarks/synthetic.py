@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Synthetic Lamassu cash-out CSV generator
+
+Writes positional cash_out_txs.csv rows in the layout the fetcher parses
+(33 columns, see CASH_OUT_COLUMNS in transaction_fetcher.py). Output only
+depends on `rows`, `qualifying_ratio` and `seed`, so runs on different
+commits parse byte-identical files.
+
+    python benchmarks/synthetic.py cash_out_txs.csv --rows 100000
+"""
+
+import argparse
+import random
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+COLUMNS = 33
+SIZES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+
+MACHINES = 8
+FIAT_AMOUNTS = [50, 100, 200, 300, 500, 1000, 2000, 4000]
+COMMISSION_PERCENTAGES = ["0.03000", "0.04500", "0.05500", "0.06000", "0.07000"]
+# Most cash-outs get no discount, some a promo code, a few are free
+DISCOUNT_PERCENTAGES = ["0", "0", "0", "0", "10", "25", "50", "90", "100"]
+START = datetime(2025, 1, 1)
+
+# How a non-qualifying row fails the DCA predicate:
+# (status, send, error_code, cancel_reason)
+NON_QUALIFYING = [
+    ("notSeen", "f", "", ""),
+    ("notSeen", "f", "", "operatorCancel"),
+    ("published", "t", "", ""),
+    ("authorized", "t", "", ""),
+    ("confirmed", "t", "", "customerCancel"),
+    ("rejected", "f", "InsufficientFunds", ""),
+    ("confirmed", "t", "dispenseFailed", ""),
+]
+
+
+def _timestamp(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f+00")
+
+
+def write_synthetic_csv(
+    path: Path, rows: int, qualifying_ratio: float = 0.5, seed: int = 42
+) -> None:
+    """Write `rows` cash-out rows, roughly `qualifying_ratio` of them DCA-eligible"""
+    rng = random.Random(seed)
+    machines = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(MACHINES)]
+    devices = [f"{rng.getrandbits(256):064x}" for _ in range(MACHINES)]
+    created = START
+    with open(path, "w", encoding="utf-8") as file:
+        for _ in range(rows):
+            machine = rng.randrange(MACHINES)
+            created += timedelta(
+                seconds=rng.randint(1, 120), microseconds=rng.randrange(1_000_000)
+            )
+            fiat_amount = rng.choice(FIAT_AMOUNTS)
+            commission = rng.choice(COMMISSION_PERCENTAGES)
+            exchange_rate = round(rng.uniform(780_000, 880_000), 5)
+            crypto_atoms = int(
+                fiat_amount * (1 - float(commission)) / exchange_rate * 100_000_000
+            )
+            if rng.random() < qualifying_ratio:
+                status, send, error_code, cancel_reason = "confirmed", "t", "", ""
+            else:
+                status, send, error_code, cancel_reason = rng.choice(NON_QUALIFYING)
+
+            row = [""] * COLUMNS
+            row[0] = str(uuid.UUID(int=rng.getrandbits(128)))
+            row[1] = devices[machine]
+            row[2] = f"bc1q{rng.getrandbits(160):040x}"
+            row[3] = str(crypto_atoms)
+            row[4] = "BTC"
+            row[5] = f"{fiat_amount}.00000"
+            row[6] = "GTQ"
+            row[7] = status
+            row[8] = send
+            row[9] = "f"
+            row[10] = "f"
+            row[11] = error_code
+            row[12] = _timestamp(created)
+            if status == "confirmed":
+                row[13] = _timestamp(created + timedelta(seconds=rng.randint(5, 600)))
+            row[18] = str(rng.randint(0, 6)) if send == "t" else "0"
+            row[19] = "0"
+            row[20] = rng.choice(DISCOUNT_PERCENTAGES)
+            row[22] = cancel_reason
+            row[23] = machines[machine]
+            row[24] = str(rng.randint(1, 500))
+            row[29] = commission
+            row[30] = f"{exchange_rate:.5f}"
+            row[31] = row[3] if status == "confirmed" and not error_code else "0"
+            file.write(",".join(row) + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--rows", type=int, default=SIZES["100k"])
+    parser.add_argument("--qualifying-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    write_synthetic_csv(args.path, args.rows, args.qualifying_ratio, args.seed)
+
+
+if __name__ == "__main__":
+    main()
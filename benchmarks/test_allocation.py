@@ -0,0 +1,81 @@
+import random
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from ..allocation import CommissionSplitPlan, FlowAllocationIndex
+from ..models import CommissionRecipient
+from ..services import compute_flow_cycle
+
+pytest.importorskip("pytest_benchmark")
+
+NOW = datetime(2025, 1, 1)
+
+
+@pytest.fixture(params=[10, 1_000, 10_000], ids=lambda n: f"{n}_clients")
+def index(request) -> FlowAllocationIndex:
+    rng = random.Random(42)
+    index = FlowAllocationIndex()
+    index.loaded = True
+    for i in range(request.param):
+        index.upsert(f"client-{i}", rng.randint(10_000, 2_000_000))
+    return index
+
+
+def _transactions(count: int):
+    return [
+        {
+            "id": f"tx-{i}",
+            "fiat_amount": 2000.0,
+            "crypto_atoms": 240_000,
+            "distribution_amount": 1945.0,
+            "actual_commission": 55.0,
+        }
+        for i in range(count)
+    ]
+
+
+def test_allocate(benchmark, index):
+    benchmark.group = "allocate one transaction"
+    shares = benchmark(index.allocate, 194_500)
+    assert sum(share for _, share in shares) <= 194_500
+
+
+@pytest.mark.parametrize("transactions", [1, 50], ids=lambda n: f"{n}_tx")
+def test_compute_flow_cycle(benchmark, index, transactions):
+    benchmark.group = f"flow cycle, {transactions} transactions"
+    plan = CommissionSplitPlan()
+    plan.load(
+        CommissionRecipient(
+            id=f"recipient-{i}",
+            wallet_id=f"wallet-{i}",
+            wallet_name=f"recipient {i}",
+            allocation_percentage=Decimal(share),
+            created_at=NOW,
+        )
+        for i, share in enumerate(["60", "40"])
+    )
+    processed, distributions, _ = benchmark(
+        compute_flow_cycle, _transactions(transactions), index, plan, NOW
+    )
+    assert len(processed) == transactions
+    assert 0 < len(distributions) <= len(index)
+
+
+def test_split_commissions(benchmark):
+    benchmark.group = "split 10k commissions"
+    plan = CommissionSplitPlan()
+    plan.load(
+        CommissionRecipient(
+            id=f"recipient-{i}",
+            wallet_id=f"wallet-{i}",
+            wallet_name=f"recipient {i}",
+            allocation_percentage=Decimal(share),
+            created_at=NOW,
+        )
+        for i, share in enumerate(["50", "30", "15", "5"])
+    )
+    amounts = [random.Random(i).randint(0, 50_000) for i in range(10_000)]
+    shares = benchmark(plan.split, amounts)
+    assert all(sum(row) == amount for row, amount in zip(shares, amounts))
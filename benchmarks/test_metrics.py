@@ -0,0 +1,122 @@
+import asyncio
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from lnbits.db import SQLITE, Database
+from lnbits.settings import settings
+
+from .. import crud
+from ..migrations import m009_add_daily_rollups
+from ..tests.conftest import run_migrations
+
+pytest.importorskip("pytest_benchmark")
+
+CLIENTS = 1_000
+TRANSACTIONS = 20_000
+DISTRIBUTIONS_PER_TRANSACTION = 10
+
+
+def _seed(path: str) -> None:
+    """Fill the tables with a deterministic month of flow activity."""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    start = now - timedelta(days=30)
+    step = (now - start) / TRANSACTIONS
+    clients = [f"client-{i}" for i in range(CLIENTS)]
+    with sqlite3.connect(path) as conn:
+        conn.executemany(
+            """
+            INSERT INTO clients (
+                id, user_id, wallet_id, initial_deposit, current_balance,
+                total_distributed, total_satoshis, dca_mode, status,
+                created_at, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                (
+                    client_id,
+                    f"user-{i}",
+                    f"wallet-{i}",
+                    20_000,
+                    rng.randint(0, 20_000),
+                    rng.randint(0, 20_000),
+                    rng.randint(0, 3_000_000),
+                    "fixed" if i % 10 == 0 else "flow",
+                    "inactive" if i % 25 == 0 else "active",
+                    int(start.timestamp()),
+                    int(start.timestamp()),
+                )
+                for i, client_id in enumerate(clients)
+            ),
+        )
+        processed = []
+        distributions: List[tuple] = []
+        for i in range(TRANSACTIONS):
+            timestamp = int((start + step * i).timestamp())
+            processed.append((f"pt-{i}", f"lamassu-{i}", timestamp, 1945, 55))
+            for client_id in rng.sample(clients, DISTRIBUTIONS_PER_TRANSACTION):
+                distributions.append(
+                    (f"d-{len(distributions)}", client_id, f"pt-{i}", timestamp)
+                )
+        conn.executemany(
+            """
+            INSERT INTO processed_transactions (
+                id, lamassu_transaction_id, processing_timestamp,
+                flow_distribution_amount, commission_amount, clients_affected
+            ) VALUES (?, ?, ?, ?, ?, 10)
+            """,
+            processed,
+        )
+        conn.executemany(
+            """
+            INSERT INTO distributions (
+                id, client_id, transaction_id, amount_fiat, amount_satoshis,
+                exchange_rate, distribution_type, status, created_at
+            ) VALUES (?, ?, ?, 194.5, 23000, 845000, 'flow', 'completed', ?)
+            """,
+            distributions,
+        )
+
+
+@pytest.fixture(scope="module")
+def seeded_db(tmp_path_factory):
+    """An event loop and a seeded SQLite database behind crud.db."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        folder = tmp_path_factory.mktemp("lnbits_data")
+        monkeypatch.setattr(settings, "lnbits_data_folder", str(folder))
+        database = Database("ext_dca_admin")
+        if database.type != SQLITE:
+            pytest.skip("seeds a throwaway SQLite database")
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run_migrations(database))
+        _seed(database.path)
+        # roll the seeded history up the way the migration backfills it
+        for table in ("daily_rollups", "daily_transaction_rollups"):
+            loop.run_until_complete(database.execute(f"DROP TABLE dca_admin.{table}"))
+        loop.run_until_complete(m009_add_daily_rollups(database))
+        monkeypatch.setattr(crud, "db", database)
+        yield loop
+        loop.run_until_complete(database.engine.dispose())
+        loop.close()
+
+
+def test_dca_metrics(benchmark, seeded_db):
+    benchmark.group = "metrics"
+
+    def uncached():
+        crud.invalidate_dca_metrics()
+        return seeded_db.run_until_complete(crud.get_dca_metrics("wallet"))
+
+    metrics = benchmark(uncached)
+    assert metrics.total_clients == CLIENTS
+
+
+def test_client_metrics(benchmark, seeded_db):
+    benchmark.group = "metrics"
+    metrics = benchmark(
+        lambda: seeded_db.run_until_complete(crud.get_client_metrics("client-7"))
+    )
+    assert metrics.distribution_count > 0
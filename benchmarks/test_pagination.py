@@ -0,0 +1,93 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+from lnbits.db import SQLITE, Database
+from lnbits.settings import settings
+
+from .. import crud
+from ..tests.conftest import run_migrations
+
+pytest.importorskip("pytest_benchmark")
+
+DEPTH = 100_000
+PAGE = 100
+# distributions sharing a created_at, as a flow cycle writes them
+TIE = 10
+
+
+def _id(i: int) -> str:
+    """Id of the i-th newest row, descending with i so ties keep that order."""
+    return f"d-{DEPTH + PAGE - i:06}"
+
+
+def _seed(path: str) -> datetime:
+    """DEPTH + PAGE distributions of one wallet's client, returns the newest time."""
+    now = datetime(2026, 10, 18, 12, 0)
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            """
+            INSERT INTO clients (
+                id, user_id, wallet_id, initial_deposit, dca_mode, created_at,
+                updated_at
+            ) VALUES ('client', 'user', 'wallet', 20000, 'flow', ?, ?)
+            """,
+            (int(now.timestamp()), int(now.timestamp())),
+        )
+        conn.executemany(
+            """
+            INSERT INTO distributions (
+                id, client_id, amount_fiat, amount_satoshis, exchange_rate,
+                distribution_type, status, created_at
+            ) VALUES (?, 'client', 19.45, 2300, 845000, 'flow', 'completed', ?)
+            """,
+            (
+                (_id(i), int((now - timedelta(seconds=i // TIE)).timestamp()))
+                for i in range(DEPTH + PAGE)
+            ),
+        )
+    return now
+
+
+@pytest.fixture(scope="module")
+def deep_db(tmp_path_factory):
+    """An event loop and crud.db seeded by _seed, with the cursor at DEPTH."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        folder = tmp_path_factory.mktemp("lnbits_data")
+        monkeypatch.setattr(settings, "lnbits_data_folder", str(folder))
+        database = Database("ext_dca_admin")
+        if database.type != SQLITE:
+            pytest.skip("seeds a throwaway SQLite database")
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(run_migrations(database))
+        now = _seed(database.path)
+        monkeypatch.setattr(crud, "db", database)
+        # the row a client walking pages of PAGE would have ended on
+        last = DEPTH - 1
+        cursor = crud.encode_cursor(now - timedelta(seconds=last // TIE), _id(last))
+        yield loop, cursor
+        loop.run_until_complete(database.engine.dispose())
+        loop.close()
+
+
+def test_keyset_page_at_depth(benchmark, deep_db):
+    benchmark.group = f"page at depth {DEPTH}"
+    loop, cursor = deep_db
+    page = benchmark(
+        lambda: loop.run_until_complete(
+            crud.get_dca_distributions_page("wallet", PAGE, cursor)
+        )
+    )
+    assert [d.id for d in page.data][:2] == [_id(DEPTH), _id(DEPTH + 1)]
+
+
+def test_offset_page_at_depth(benchmark, deep_db):
+    benchmark.group = f"page at depth {DEPTH}"
+    loop, _ = deep_db
+    rows = benchmark(
+        lambda: loop.run_until_complete(
+            crud.get_dca_distributions("wallet", PAGE, DEPTH)
+        )
+    )
+    assert len(rows) == PAGE
@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_parse_cash_out_transactions(benchmark, fetcher):
+    benchmark.group = "parse"
+    transactions = benchmark(fetcher.parse_cash_out_transactions)
+    assert transactions
+
+
+def test_filter_dca_transactions(benchmark, fetcher):
+    benchmark.group = "filter"
+    transactions = fetcher.parse_cash_out_transactions()
+    dca = benchmark(fetcher.filter_dca_transactions, transactions)
+    assert 0 < len(dca) < len(transactions)
+
+
+def test_collect_dca_transactions(benchmark, fetcher):
+    """The streaming parse + filter pass the poller uses."""
+    benchmark.group = "parse + filter (streaming)"
+    assert benchmark(fetcher.collect_dca_transactions)
@@ -0,0 +1,42 @@
+from typing import Iterator
+
+import pytest
+
+from ..transaction_fetcher import LamassuTransactionFetcher
+
+pytest.importorskip("pytest_benchmark")
+
+# Roughly a TCP + SSH key exchange to a server on another continent
+HANDSHAKE_SECONDS = 0.2
+
+
+@pytest.fixture
+def full_fetcher(
+    tmp_path, ssh_standin, monkeypatch
+) -> Iterator[LamassuTransactionFetcher]:
+    """A full-history fetcher talking to the sshd stand-in."""
+    monkeypatch.setenv("STANDIN_HANDSHAKE", str(HANDSHAKE_SECONDS))
+    fetcher = LamassuTransactionFetcher(
+        {
+            "server_ip": "localhost",
+            "server_log_dir": str(tmp_path / "logs"),
+            "old_server_log_dir": str(tmp_path / "logs" / "old"),
+            "fetch_mode": "full",
+        }
+    )
+    fetcher.remote_dir = str(ssh_standin.remote_dir)
+    yield fetcher
+    fetcher.close()
+
+
+def test_fetch_over_master_connection(benchmark, full_fetcher):
+    benchmark.group = "ssh fetch"
+    assert full_fetcher.fetch_remote_data()  # opens the master
+    assert benchmark(full_fetcher.fetch_remote_data)
+
+
+def test_fetch_without_master_connection(benchmark, full_fetcher, monkeypatch):
+    """Every ssh and scp pays the handshake, as before ControlMaster."""
+    benchmark.group = "ssh fetch"
+    monkeypatch.setattr(full_fetcher, "ssh_options", list)
+    assert benchmark(full_fetcher.fetch_remote_data)
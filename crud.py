@@ -1,12 +1,17 @@
 # Description: DCA Admin Extension - Database Operations
 
-from datetime import datetime
-from typing import List, Optional, Union
+import base64
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
 from decimal import Decimal
 
-from lnbits.db import Database
+from lnbits.db import Connection, Database
 from lnbits.helpers import urlsafe_short_hash
+from sqlalchemy import text
 
+from .allocation import commission_plan, flow_index, to_cents
 from .models import (
     CreateDCAClientData,
     DCAClient,
@@ -19,6 +24,9 @@ from .models import (
     ProcessedTransaction,
     DCADistribution,
     CommissionDistribution,
+    CursorPage,
+    DailyRollup,
+    PendingPayout,
 )
 
 db = Database("ext_dca_admin")
@@ -66,8 +74,11 @@ async def create_dca_client(data: CreateDCAClientData, wallet_id: str) -> DCACli
         """,
         client_data,
     )
+    invalidate_dca_metrics()
     
-    return DCAClient(**client_data)
+    client = DCAClient(**client_data)
+    flow_index.sync_client(client)
+    return client
 
 async def get_dca_client(client_id: str) -> Optional[DCAClient]:
     """Get a specific DCA client."""
@@ -106,8 +117,12 @@ async def update_dca_client(client_id: str, data: CreateDCAClientData) -> DCACli
             "updated_at": now,
         },
     )
+    invalidate_dca_metrics()
     
-    return await get_dca_client(client_id)
+    client = await get_dca_client(client_id)
+    if client:
+        flow_index.sync_client(client)
+    return client
 
 async def delete_dca_client(client_id: str) -> None:
     """Delete a DCA client."""
@@ -115,6 +130,36 @@ async def delete_dca_client(client_id: str) -> None:
         "DELETE FROM dca_admin.clients WHERE id = :id",
         {"id": client_id},
     )
+    invalidate_dca_metrics()
+    flow_index.remove_client(client_id)
+
+async def get_active_flow_clients() -> List[DCAClient]:
+    """Get all active flow mode clients that still have a balance."""
+    return await db.fetchall(
+        """
+        SELECT * FROM dca_admin.clients
+        WHERE dca_mode = 'flow' AND status = 'active' AND current_balance > 0
+        ORDER BY id
+        """,
+        model=DCAClient,
+    )
+
+async def get_active_fixed_clients() -> List[DCAClient]:
+    """Get all active fixed mode clients that still have a balance."""
+    return await db.fetchall(
+        """
+        SELECT * FROM dca_admin.clients
+        WHERE dca_mode = 'fixed' AND status = 'active' AND current_balance > 0
+        ORDER BY id
+        """,
+        model=DCAClient,
+    )
+
+# Start of a new day for fixed mode clients, one set-based UPDATE
+RESET_DAILY_DISTRIBUTED = """
+    UPDATE dca_admin.clients SET daily_distributed_today = 0
+    WHERE dca_mode = 'fixed' AND daily_distributed_today <> 0
+"""
 
 #######################################
 ##### COMMISSION RECIPIENT OPERATIONS #
@@ -147,6 +192,7 @@ async def create_commission_recipient(data: CreateCommissionRecipientData, walle
         """,
         recipient_data,
     )
+    commission_plan.clear()
     
     return CommissionRecipient(**recipient_data)
 
@@ -157,6 +203,13 @@ async def get_commission_recipients(wallet_id: str) -> List[CommissionRecipient]
         model=CommissionRecipient,
     )
 
+async def get_active_commission_recipients() -> List[CommissionRecipient]:
+    """Get the commission recipients that take part in splits."""
+    return await db.fetchall(
+        "SELECT * FROM dca_admin.commission_recipients WHERE status = 'active' ORDER BY id",
+        model=CommissionRecipient,
+    )
+
 async def update_commission_recipient(recipient_id: str, data: CreateCommissionRecipientData) -> CommissionRecipient:
     """Update a commission recipient."""
     await db.execute(
@@ -176,6 +229,7 @@ async def update_commission_recipient(recipient_id: str, data: CreateCommissionR
             "recipient_type": data.recipient_type,
         },
     )
+    commission_plan.clear()
     
     return await db.fetchone(
         "SELECT * FROM dca_admin.commission_recipients WHERE id = :id",
@@ -189,45 +243,118 @@ async def delete_commission_recipient(recipient_id: str) -> None:
         "DELETE FROM dca_admin.commission_recipients WHERE id = :id",
         {"id": recipient_id},
     )
+    commission_plan.clear()
 
 #######################################
 ##### SYSTEM CONFIG OPERATIONS #######
 #######################################
 
-async def get_system_config() -> Optional[SystemConfig]:
-    """Get system configuration."""
-    return await db.fetchone(
+# Every cycle, scheduler tick and page render reads the configuration, so it
+# is served from memory. Each write bumps system_config.version and swaps in
+# the new row; other workers notice the bump on their next version check,
+# at most CONFIG_VERSION_CHECK_SECONDS later. Treat the returned object as
+# read-only, it is shared.
+CONFIG_VERSION_CHECK_SECONDS = 5.0
+_config_cache: Optional[SystemConfig] = None
+_config_checked_at = 0.0
+
+def invalidate_system_config() -> None:
+    """Drop the cached configuration, the next read loads it again."""
+    global _config_cache
+    _config_cache = None
+
+async def _load_system_config() -> Optional[SystemConfig]:
+    global _config_cache, _config_checked_at
+    _config_cache = await db.fetchone(
         "SELECT * FROM dca_admin.system_config WHERE id = 'default'",
         model=SystemConfig,
     )
+    _config_checked_at = time.monotonic()
+    return _config_cache
+
+async def get_system_config() -> Optional[SystemConfig]:
+    """Get system configuration."""
+    global _config_checked_at
+    if _config_cache is None:
+        return await _load_system_config()
+    if time.monotonic() - _config_checked_at < CONFIG_VERSION_CHECK_SECONDS:
+        return _config_cache
+    
+    row = await db.fetchone(
+        "SELECT version FROM dca_admin.system_config WHERE id = 'default'"
+    )
+    if row and row["version"] == _config_cache.version:
+        _config_checked_at = time.monotonic()
+        return _config_cache
+    return await _load_system_config()
+
+def _fixed_slot_claim(previous: Optional[datetime], slot: datetime) -> Tuple[str, Dict]:
+    """
+    Compare-and-set of last_fixed_run_at from `previous` to `slot`. It matches
+    no row once another worker, or an earlier run, has moved it on.
+    """
+    if previous is None:
+        condition = "last_fixed_run_at IS NULL"
+    else:
+        condition = f"last_fixed_run_at = {db.timestamp_placeholder('previous')}"
+    return (
+        f"""
+        UPDATE dca_admin.system_config SET
+            last_fixed_run_at = :slot,
+            version = version + 1
+        WHERE id = 'default' AND {condition}
+        """,
+        {"slot": slot, "previous": previous},
+    )
+
+async def claim_fixed_slot(previous: Optional[datetime], slot: datetime) -> bool:
+    """
+    Record `slot` as the schedule slot the fixed mode scheduler last ran for,
+    unless the recorded one is no longer `previous`. Returns whether it did.
+    """
+    claimed = await _execute_statements([], _fixed_slot_claim(previous, slot))
+    await _load_system_config()
+    return claimed
+
+async def set_last_processed_timestamp(timestamp: datetime) -> None:
+    """Advance the Lamassu watermark the next fetch starts from."""
+    await db.execute(
+        """
+        UPDATE dca_admin.system_config SET
+            last_processed_timestamp = :timestamp,
+            version = version + 1
+        WHERE id = 'default'
+        """,
+        {"timestamp": timestamp},
+    )
+    await _load_system_config()
 
 async def update_system_config(data: UpdateSystemConfigData) -> SystemConfig:
     """Update system configuration."""
     now = datetime.utcnow()
     
-    # Get current config
-    current = await get_system_config()
-    if not current:
+    if not await get_system_config():
         # Create default config if it doesn't exist
-        config_id = "default"
         await db.execute(
             """
             INSERT INTO dca_admin.system_config (
-                id, created_at, updated_at
+                id, updates_channel, created_at, updated_at
             ) VALUES (
-                :id, :created_at, :updated_at
+                'default', :updates_channel, :created_at, :updated_at
             )
             """,
             {
-                "id": config_id,
+                "updates_channel": urlsafe_short_hash(),
                 "created_at": now,
                 "updated_at": now,
             },
         )
-        current = await get_system_config()
     
-    # Update with new values
-    update_data = data.dict(exclude_unset=True)
+    # Fields left out of the request keep their value
+    update_data: Dict[str, Any] = {
+        field: None for field in UpdateSystemConfigData.__fields__
+    }
+    update_data.update(data.dict(exclude_unset=True))
     update_data["updated_at"] = now
     
     await db.execute(
@@ -236,19 +363,25 @@ async def update_system_config(data: UpdateSystemConfigData) -> SystemConfig:
             lamassu_server_ip = COALESCE(:lamassu_server_ip, lamassu_server_ip),
             lamassu_ssh_user = COALESCE(:lamassu_ssh_user, lamassu_ssh_user),
             lamassu_log_dir = COALESCE(:lamassu_log_dir, lamassu_log_dir),
+            lamassu_database_url = COALESCE(:lamassu_database_url, lamassu_database_url),
             fixed_mode_schedule = COALESCE(:fixed_mode_schedule, fixed_mode_schedule),
             fixed_mode_time = COALESCE(:fixed_mode_time, fixed_mode_time),
             max_daily_fixed_amount = COALESCE(:max_daily_fixed_amount, max_daily_fixed_amount),
             processing_enabled = COALESCE(:processing_enabled, processing_enabled),
             nostr_relay = COALESCE(:nostr_relay, nostr_relay),
             notification_wallet = COALESCE(:notification_wallet, notification_wallet),
-            updated_at = :updated_at
+            payout_wallet = COALESCE(:payout_wallet, payout_wallet),
+            payout_concurrency = COALESCE(:payout_concurrency, payout_concurrency),
+            updated_at = :updated_at,
+            version = version + 1
         WHERE id = 'default'
         """,
         update_data,
     )
     
-    return await get_system_config()
+    config = await _load_system_config()
+    assert config, "System configuration missing after update"
+    return config
 
 #######################################
 ##### TRANSACTION OPERATIONS #########
@@ -266,6 +399,27 @@ async def get_processed_transactions(wallet_id: str, limit: int = 100, offset: i
         ProcessedTransaction,
     )
 
+async def get_processed_lamassu_ids(lamassu_ids: Optional[List[str]] = None) -> List[str]:
+    """Get the Lamassu ids already processed, all of them or those among `lamassu_ids`."""
+    if lamassu_ids is None:
+        rows = await db.fetchall(
+            "SELECT lamassu_transaction_id FROM dca_admin.processed_transactions"
+        )
+        return [row["lamassu_transaction_id"] for row in rows]
+
+    found: List[str] = []
+    for chunk in _chunks(lamassu_ids):
+        values = {f"id_{i}": lamassu_id for i, lamassu_id in enumerate(chunk)}
+        rows = await db.fetchall(
+            f"""
+            SELECT lamassu_transaction_id FROM dca_admin.processed_transactions
+            WHERE lamassu_transaction_id IN ({', '.join(f':{key}' for key in values)})
+            """,
+            values,
+        )
+        found.extend(row["lamassu_transaction_id"] for row in rows)
+    return found
+
 async def get_dca_distributions(wallet_id: str, limit: int = 100, offset: int = 0) -> List[DCADistribution]:
     """Get DCA distributions."""
     return await db.fetchall(
@@ -294,117 +448,667 @@ async def get_commission_distributions(wallet_id: str, limit: int = 100, offset:
         CommissionDistribution,
     )
 
-#######################################
-##### ANALYTICS OPERATIONS ###########
-#######################################
+def encode_cursor(timestamp: datetime, row_id: str) -> str:
+    """Opaque keyset cursor for the row a page ended on."""
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
 
-async def get_dca_metrics(wallet_id: str) -> DCAMetrics:
-    """Get system-wide DCA metrics."""
-    # Get total clients
-    total_clients = await db.fetchone(
-        "SELECT COUNT(*) as count FROM dca_admin.clients",
-        {"wallet_id": wallet_id},
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Raises ValueError for cursors not produced by encode_cursor."""
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), str(row_id)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
+async def _fetch_keyset_page(
+    query: str,
+    where: List[str],
+    values: Dict,
+    timestamp_column: str,
+    id_column: str,
+    model: type,
+    limit: int,
+    cursor: Optional[str],
+) -> CursorPage:
+    """
+    Newest-first page after `cursor`, seeking on (timestamp, id) instead of
+    OFFSET so deep pages cost the same as the first one. Raises ValueError
+    for a limit below 1 or an invalid cursor.
+    """
+    if limit < 1:
+        raise ValueError("Page limit must be at least 1")
+    values = {**values, "limit": limit + 1}
+    where = list(where)
+    if cursor:
+        cursor_ts, cursor_id = decode_cursor(cursor)
+        ts = db.timestamp_placeholder("cursor_ts")
+        where.append(
+            f"({timestamp_column} < {ts} OR "
+            f"({timestamp_column} = {ts} AND {id_column} < :cursor_id))"
+        )
+        values.update({"cursor_ts": cursor_ts, "cursor_id": cursor_id})
+    clause = f"WHERE {' AND '.join(where)}" if where else ""
+    rows = await db.fetchall(
+        f"""
+        {query}
+        {clause}
+        ORDER BY {timestamp_column} DESC, {id_column} DESC
+        LIMIT :limit
+        """,
+        values,
+        model,
     )
-    
-    # Get active clients
-    active_clients = await db.fetchone(
-        "SELECT COUNT(*) as count FROM dca_admin.clients WHERE status = 'active'",
-        {"wallet_id": wallet_id},
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        ts_field = timestamp_column.split(".")[-1]
+        next_cursor = encode_cursor(getattr(last, ts_field), last.id)
+    return CursorPage(data=rows, next_cursor=next_cursor)
+
+async def get_processed_transactions_page(
+    limit: int = 100, cursor: Optional[str] = None
+) -> CursorPage:
+    """
+    Get processed transactions, keyset paginated. Like
+    get_processed_transactions they are system-wide, not scoped to a wallet.
+    """
+    return await _fetch_keyset_page(
+        "SELECT * FROM dca_admin.processed_transactions",
+        [],
+        {},
+        "processing_timestamp",
+        "id",
+        ProcessedTransaction,
+        limit,
+        cursor,
     )
-    
-    # Get flow mode clients
-    flow_clients = await db.fetchone(
-        "SELECT COUNT(*) as count FROM dca_admin.clients WHERE dca_mode = 'flow'",
+
+async def get_dca_distributions_page(
+    wallet_id: str, limit: int = 100, cursor: Optional[str] = None
+) -> CursorPage:
+    """Get DCA distributions, keyset paginated."""
+    return await _fetch_keyset_page(
+        """
+        SELECT d.* FROM dca_admin.distributions d
+        JOIN dca_admin.clients c ON d.client_id = c.id
+        """,
+        ["c.wallet_id = :wallet_id"],
         {"wallet_id": wallet_id},
+        "d.created_at",
+        "d.id",
+        DCADistribution,
+        limit,
+        cursor,
     )
-    
-    # Get fixed mode clients
-    fixed_clients = await db.fetchone(
-        "SELECT COUNT(*) as count FROM dca_admin.clients WHERE dca_mode = 'fixed'",
+
+async def get_commission_distributions_page(
+    wallet_id: str, limit: int = 100, cursor: Optional[str] = None
+) -> CursorPage:
+    """Get commission distributions, keyset paginated."""
+    return await _fetch_keyset_page(
+        """
+        SELECT cd.* FROM dca_admin.commission_distributions cd
+        JOIN dca_admin.commission_recipients cr ON cd.recipient_id = cr.id
+        """,
+        ["cr.wallet_id = :wallet_id"],
         {"wallet_id": wallet_id},
+        "cd.created_at",
+        "cd.id",
+        CommissionDistribution,
+        limit,
+        cursor,
     )
-    
-    # Get total deposits and distributions
-    totals = await db.fetchone(
+
+#######################################
+##### DISTRIBUTION WRITE OPERATIONS ##
+#######################################
+
+# Rows per multi-row INSERT / CASE UPDATE, keeps the bound parameter count
+# well under SQLite's limit
+WRITE_BATCH_SIZE = 500
+
+DISTRIBUTION_COLUMNS = [
+    "id", "client_id", "transaction_id", "amount_fiat", "amount_satoshis",
+    "exchange_rate", "distribution_type", "payment_hash", "payment_request",
+    "status", "created_at", "completed_at", "notes", "cycle_id",
+]
+
+PROCESSED_TRANSACTION_COLUMNS = [
+    "id", "lamassu_transaction_id", "processing_timestamp",
+    "flow_distribution_amount", "commission_amount", "clients_affected", "status",
+    "undistributed_amount", "cycle_id",
+]
+
+COMMISSION_DISTRIBUTION_COLUMNS = [
+    "id", "transaction_id", "recipient_id", "amount_fiat", "amount_satoshis",
+    "exchange_rate", "payment_hash", "status", "created_at", "completed_at",
+    "cycle_id",
+]
+
+DAILY_ROLLUP_COLUMNS = [
+    "client_id", "day", "amount_fiat", "amount_satoshis",
+    "distribution_count", "last_distribution",
+]
+
+DAILY_TRANSACTION_ROLLUP_COLUMNS = [
+    "day", "transaction_count", "flow_distribution_amount",
+    "commission_amount", "last_transaction_time",
+]
+
+def _chunks(items: list, size: int = WRITE_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _multi_row_insert(table: str, columns: List[str], rows: List[Dict]) -> Tuple[str, Dict]:
+    """Build one INSERT with a VALUES tuple per row, params suffixed by row index."""
+    values = {}
+    tuples = []
+    for i, row in enumerate(rows):
+        tuples.append("(" + ", ".join(f":{column}_{i}" for column in columns) + ")")
+        values.update({f"{column}_{i}": row[column] for column in columns})
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join(tuples)}"
+    return query, values
+
+def _client_balance_update(
+    distributions: List[DCADistribution], now: datetime, count_daily: bool = False
+) -> Tuple[str, Dict]:
+    """
+    Build one UPDATE applying every client's fiat/sats delta via CASE. With
+    `count_daily` the fiat also counts towards daily_distributed_today.
+    """
+    values: Dict = {"now": now}
+    fiat_cases = []
+    sats_cases = []
+    ids = []
+    for i, d in enumerate(distributions):
+        values[f"id_{i}"] = d.client_id
+        values[f"fiat_{i}"] = d.amount_fiat
+        values[f"sats_{i}"] = d.amount_satoshis
+        fiat_cases.append(f"WHEN :id_{i} THEN :fiat_{i}")
+        sats_cases.append(f"WHEN :id_{i} THEN :sats_{i}")
+        ids.append(f":id_{i}")
+    fiat_case = f"CASE id {' '.join(fiat_cases)} ELSE 0 END"
+    sats_case = f"CASE id {' '.join(sats_cases)} ELSE 0 END"
+    daily = (
+        f"\n            daily_distributed_today = daily_distributed_today + {fiat_case},"
+        if count_daily
+        else ""
+    )
+    query = f"""
+        UPDATE dca_admin.clients SET
+            current_balance = current_balance - {fiat_case},
+            total_distributed = total_distributed + {fiat_case},
+            total_satoshis = total_satoshis + {sats_case},{daily}
+            distribution_count = COALESCE(distribution_count, 0) + 1,
+            last_distribution = :now,
+            updated_at = :now
+        WHERE id IN ({', '.join(ids)})
+    """
+    return query, values
+
+def _day(timestamp: datetime) -> str:
+    return timestamp.strftime("%Y-%m-%d")
+
+def _rollup_upsert(table: str, columns: List[str], key: List[str], rows: List[Dict]) -> Tuple[str, Dict]:
+    """
+    Multi-row INSERT that adds onto existing rollup rows instead of failing
+    on `key`. Timestamp columns keep the later value, every other column is
+    a total. Rows must not repeat a key.
+    """
+    query, values = _multi_row_insert(f"{table} AS r", columns, rows)
+    updates = [
+        f"{column} = CASE WHEN excluded.{column} > r.{column}"
+        f" THEN excluded.{column} ELSE r.{column} END"
+        if column.startswith("last_")
+        else f"{column} = r.{column} + excluded.{column}"
+        for column in columns
+        if column not in key
+    ]
+    query += f" ON CONFLICT ({', '.join(key)}) DO UPDATE SET {', '.join(updates)}"
+    return query, values
+
+def _daily_rollup_upsert(distributions: List[DCADistribution]) -> Tuple[str, Dict]:
+    """Add a chunk of distributions onto dca_admin.daily_rollups."""
+    rows = [
+        {
+            "client_id": d.client_id,
+            "day": _day(d.created_at),
+            "amount_fiat": d.amount_fiat,
+            "amount_satoshis": d.amount_satoshis,
+            "distribution_count": 1,
+            "last_distribution": d.created_at,
+        }
+        for d in distributions
+    ]
+    return _rollup_upsert(
+        "dca_admin.daily_rollups", DAILY_ROLLUP_COLUMNS, ["client_id", "day"], rows
+    )
+
+def _daily_transaction_rollup_upsert(processed: List[ProcessedTransaction]) -> Tuple[str, Dict]:
+    """Add processed transactions onto dca_admin.daily_transaction_rollups."""
+    days: Dict[str, Dict] = {}
+    for p in processed:
+        day = _day(p.processing_timestamp)
+        row = days.setdefault(
+            day,
+            {
+                "day": day,
+                "transaction_count": 0,
+                "flow_distribution_amount": Decimal("0"),
+                "commission_amount": Decimal("0"),
+                "last_transaction_time": p.processing_timestamp,
+            },
+        )
+        row["transaction_count"] += 1
+        row["flow_distribution_amount"] += p.flow_distribution_amount
+        row["commission_amount"] += p.commission_amount
+        row["last_transaction_time"] = max(row["last_transaction_time"], p.processing_timestamp)
+    return _rollup_upsert(
+        "dca_admin.daily_transaction_rollups",
+        DAILY_TRANSACTION_ROLLUP_COLUMNS,
+        ["day"],
+        list(days.values()),
+    )
+
+async def _execute_statements(
+    statements: List[Tuple[str, Dict]], claim: Optional[Tuple[str, Dict]] = None
+) -> bool:
+    """
+    Run statements in order as one transaction: either all of them are
+    written or, if any fails, none. lnbits' Connection.execute commits after
+    every statement, so they go through the SQLAlchemy connection it wraps
+    instead. A `claim` UPDATE runs first; when it matches no row the work
+    was already done, nothing is written and False is returned.
+    """
+    async with db.connect() as conn:
+        if conn.conn.in_transaction():
+            await conn.conn.commit()
+        transaction = await conn.conn.begin()
+        try:
+            if claim:
+                result = await _execute_in_transaction(conn, *claim)
+                if result.rowcount != 1:
+                    await transaction.rollback()
+                    return False
+            for query, values in statements:
+                await _execute_in_transaction(conn, query, values)
+        except BaseException:
+            await transaction.rollback()
+            raise
+        await transaction.commit()
+    return True
+
+async def _execute_in_transaction(conn: Connection, query: str, values: Dict):
+    """Connection.execute without its commit."""
+    return await conn.conn.execute(
+        text(conn.rewrite_query(query)), conn.rewrite_values(values)
+    )
+
+async def create_flow_distributions(
+    processed: ProcessedTransaction, distributions: List[DCADistribution]
+) -> ProcessedTransaction:
+    """Persist one Lamassu transaction's flow distributions, see create_flow_cycle."""
+    await create_flow_cycle([processed], distributions)
+    return processed
+
+async def create_flow_cycle(
+    processed: List[ProcessedTransaction],
+    distributions: List[DCADistribution],
+    commission_distributions: Optional[List[CommissionDistribution]] = None,
+) -> List[ProcessedTransaction]:
+    """
+    Persist a processing cycle in one transaction: multi-row INSERTs of
+    processed_transactions, distributions and commission_distributions, a
+    CASE-based UPDATE of client balances and the daily rollup upserts, each
+    chunked by WRITE_BATCH_SIZE. If any of them fails nothing is written, so
+    a transaction another worker already claimed fails the whole cycle and
+    it can be filtered and retried. Each client may appear at most once in
+    `distributions`.
+    """
+    if not processed:
+        return processed
+    now = processed[-1].processing_timestamp
+    statements: List[Tuple[str, Dict]] = []
+    for chunk in _chunks(processed):
+        statements.append(
+            _multi_row_insert(
+                "dca_admin.processed_transactions",
+                PROCESSED_TRANSACTION_COLUMNS,
+                [p.dict() for p in chunk],
+            )
+        )
+    statements.append(_daily_transaction_rollup_upsert(processed))
+    for chunk in _chunks(distributions):
+        statements.append(
+            _multi_row_insert(
+                "dca_admin.distributions",
+                DISTRIBUTION_COLUMNS,
+                [d.dict() for d in chunk],
+            )
+        )
+        statements.append(_client_balance_update(chunk, now))
+        statements.append(_daily_rollup_upsert(chunk))
+    for chunk in _chunks(commission_distributions or []):
+        statements.append(
+            _multi_row_insert(
+                "dca_admin.commission_distributions",
+                COMMISSION_DISTRIBUTION_COLUMNS,
+                [c.dict() for c in chunk],
+            )
+        )
+
+    await _execute_statements(statements)
+    invalidate_dca_metrics()
+    flow_index.apply_debits(
+        (d.client_id, to_cents(d.amount_fiat)) for d in distributions
+    )
+
+    return processed
+
+async def create_fixed_distributions(
+    distributions: List[DCADistribution],
+    now: datetime,
+    slot: datetime,
+    previous_slot: Optional[datetime],
+    new_day: bool = False,
+) -> bool:
+    """
+    Persist one fixed-mode slot in one transaction: the claim of `slot` (see
+    claim_fixed_slot), on a `new_day` the reset of daily totals, then
+    multi-row INSERTs of distributions, a CASE-based UPDATE of client
+    balances and daily totals, and the daily rollup upsert. Returns False,
+    having written nothing, if the slot was already claimed. Each client
+    may appear at most once in `distributions`.
+    """
+    statements: List[Tuple[str, Dict]] = []
+    if new_day:
+        statements.append((RESET_DAILY_DISTRIBUTED, {}))
+    for chunk in _chunks(distributions):
+        statements.append(
+            _multi_row_insert(
+                "dca_admin.distributions",
+                DISTRIBUTION_COLUMNS,
+                [d.dict() for d in chunk],
+            )
+        )
+        statements.append(_client_balance_update(chunk, now, count_daily=True))
+        statements.append(_daily_rollup_upsert(chunk))
+
+    claimed = await _execute_statements(
+        statements, _fixed_slot_claim(previous_slot, slot)
+    )
+    await _load_system_config()
+    if claimed:
+        invalidate_dca_metrics()
+    return claimed
+
+#######################################
+##### PAYOUT QUEUE OPERATIONS ########
+#######################################
+
+PAYOUT_CLAIM_TIMEOUT_SECONDS = 600
+
+async def get_due_payouts(now: datetime, limit: int = WRITE_BATCH_SIZE) -> List[PendingPayout]:
+    """
+    Get distributions waiting to be paid, oldest first: pending ones, ones left
+    processing by a restart, and failed ones whose retry time has come. A
+    client's payouts wait behind an earlier one that is still backing off.
+    """
+    now_placeholder = db.timestamp_placeholder("now")
+    return await db.fetchall(
+        f"""
+        SELECT d.*, c.wallet_id FROM dca_admin.distributions d
+        JOIN dca_admin.clients c ON c.id = d.client_id
+        WHERE (
+            d.status IN ('pending', 'processing')
+            OR (d.status = 'failed' AND d.next_attempt_at <= {now_placeholder})
+        )
+        AND NOT EXISTS (
+            SELECT 1 FROM dca_admin.distributions f
+            WHERE f.client_id = d.client_id
+            AND f.status = 'failed' AND f.next_attempt_at > {now_placeholder}
+            AND (f.created_at < d.created_at OR (f.created_at = d.created_at AND f.id < d.id))
+        )
+        ORDER BY d.created_at, d.id
+        LIMIT :limit
+        """,
+        {"now": now, "limit": limit},
+        PendingPayout,
+    )
+
+async def get_distribution_by_payment_hash(payment_hash: str) -> Optional[DCADistribution]:
+    """The distribution paid out through the invoice with `payment_hash`."""
+    return await db.fetchone(
+        "SELECT * FROM dca_admin.distributions WHERE payment_hash = :payment_hash",
+        {"payment_hash": payment_hash},
+        DCADistribution,
+    )
+
+async def claim_distribution(distribution_id: str, now: datetime) -> bool:
+    """
+    Move a due distribution to `processing` before paying it, a
+    compare-and-set that matches no row once another worker claimed it.
+    A claim older than PAYOUT_CLAIM_TIMEOUT_SECONDS, left by a worker that
+    died, can be taken over. Returns whether this call claimed it.
+    """
+    now_placeholder = db.timestamp_placeholder("now")
+    stale_placeholder = db.timestamp_placeholder("stale")
+    result = await db.execute(
+        f"""
+        UPDATE dca_admin.distributions SET
+            status = 'processing',
+            claimed_at = :now
+        WHERE id = :id AND (
+            status = 'pending'
+            OR (status = 'failed' AND next_attempt_at <= {now_placeholder})
+            OR (
+                status = 'processing'
+                AND (claimed_at IS NULL OR claimed_at <= {stale_placeholder})
+            )
+        )
+        """,
+        {
+            "id": distribution_id,
+            "now": now,
+            "stale": now - timedelta(seconds=PAYOUT_CLAIM_TIMEOUT_SECONDS),
+        },
+    )
+    return result.rowcount == 1
+
+async def release_distribution(distribution_id: str, status: str) -> None:
+    """Give up a claim without an attempt, back to `status`, claimable again."""
+    await db.execute(
         """
-        SELECT 
-            SUM(initial_deposit) as total_deposits,
-            SUM(total_distributed) as total_distributed,
-            SUM(total_satoshis) as total_satoshis
-        FROM dca_admin.clients
+        UPDATE dca_admin.distributions SET
+            status = :status,
+            claimed_at = NULL
+        WHERE id = :id
         """,
-        {"wallet_id": wallet_id},
+        {"id": distribution_id, "status": status},
     )
-    
-    # Get today's transactions
-    today_transactions = await db.fetchone(
+
+async def mark_distribution_invoiced(distribution_id: str, payment_hash: str, payment_request: str) -> None:
+    """Record the invoice a distribution is about to be paid through."""
+    await db.execute(
+        """
+        UPDATE dca_admin.distributions SET
+            status = 'processing',
+            payment_hash = :payment_hash,
+            payment_request = :payment_request
+        WHERE id = :id
+        """,
+        {"id": distribution_id, "payment_hash": payment_hash, "payment_request": payment_request},
+    )
+
+async def complete_distribution(distribution_id: str, now: datetime) -> None:
+    """Mark a distribution as paid."""
+    await db.execute(
         """
-        SELECT COUNT(*) as count
-        FROM dca_admin.processed_transactions
-        WHERE DATE(processing_timestamp) = CURRENT_DATE
+        UPDATE dca_admin.distributions SET
+            status = 'completed',
+            completed_at = :now,
+            next_attempt_at = NULL
+        WHERE id = :id
         """,
-        {"wallet_id": wallet_id},
+        {"id": distribution_id, "now": now},
+    )
+
+async def fail_distribution(
+    distribution_id: str, attempts: int, next_attempt_at: Optional[datetime]
+) -> None:
+    """Mark a payout attempt as failed, retried at `next_attempt_at` unless None."""
+    await db.execute(
+        """
+        UPDATE dca_admin.distributions SET
+            status = 'failed',
+            attempts = :attempts,
+            next_attempt_at = :next_attempt_at
+        WHERE id = :id
+        """,
+        {"id": distribution_id, "attempts": attempts, "next_attempt_at": next_attempt_at},
     )
+
+async def get_payout_queue_depth() -> int:
+    """Count distributions not yet paid or given up on."""
+    row = await db.fetchone(
+        """
+        SELECT COUNT(*) AS depth FROM dca_admin.distributions
+        WHERE status IN ('pending', 'processing')
+        OR (status = 'failed' AND next_attempt_at IS NOT NULL)
+        """
+    )
+    return row["depth"] if row else 0
+
+async def get_cycle_unpaid_count(cycle_id: str) -> int:
+    """
+    Count a flow cycle's distributions the payout worker is still paying.
+    Failed ones backing off until their retry don't count.
+    """
+    row: Optional[dict] = await db.fetchone(
+        """
+        SELECT COUNT(*) AS unpaid FROM dca_admin.distributions
+        WHERE cycle_id = :cycle_id AND status IN ('pending', 'processing')
+        """,
+        {"cycle_id": cycle_id},
+    )
+    return row["unpaid"] if row else 0
+
+#######################################
+##### ANALYTICS OPERATIONS ###########
+#######################################
+
+# The dashboard polls metrics, serve repeats from memory for a few seconds.
+# Writes that change the numbers call invalidate_dca_metrics().
+METRICS_CACHE_TTL = 10.0
+_metrics_cache: Optional[Tuple[float, DCAMetrics]] = None
+
+def invalidate_dca_metrics() -> None:
+    """Drop the cached system-wide metrics."""
+    global _metrics_cache
+    _metrics_cache = None
+
+def _average_rate(fiat, satoshis) -> Decimal:
+    """Volume weighted fiat per BTC of `fiat` buying `satoshis`."""
+    if not fiat or not satoshis:
+        return Decimal("0")
+    return (Decimal(str(fiat)) * 100_000_000 / satoshis).quantize(Decimal("0.01"))
+
+async def get_dca_metrics(wallet_id: str) -> DCAMetrics:
+    """Get system-wide DCA metrics."""
+    global _metrics_cache
+    if _metrics_cache and time.monotonic() - _metrics_cache[0] < METRICS_CACHE_TTL:
+        return _metrics_cache[1]
     
-    # Get last transaction time
-    last_transaction = await db.fetchone(
+    row = await db.fetchone(
         """
-        SELECT processing_timestamp
-        FROM dca_admin.processed_transactions
-        ORDER BY processing_timestamp DESC
-        LIMIT 1
+        SELECT
+            COUNT(*) as total_clients,
+            COALESCE(SUM(CASE WHEN status = 'active' THEN 1 ELSE 0 END), 0) as active_clients,
+            COALESCE(SUM(CASE WHEN dca_mode = 'flow' THEN 1 ELSE 0 END), 0) as flow_clients,
+            COALESCE(SUM(CASE WHEN dca_mode = 'fixed' THEN 1 ELSE 0 END), 0) as fixed_clients,
+            SUM(initial_deposit) as total_deposits,
+            SUM(total_distributed) as total_distributed,
+            SUM(total_satoshis) as total_satoshis,
+            (
+                SELECT transaction_count FROM dca_admin.daily_transaction_rollups
+                WHERE day = :today
+            ) as transactions_today,
+            (
+                SELECT last_transaction_time FROM dca_admin.daily_transaction_rollups
+                ORDER BY day DESC LIMIT 1
+            ) as last_transaction_time
+        FROM dca_admin.clients
         """,
-        {"wallet_id": wallet_id},
+        {"today": _day(datetime.utcnow())},
     )
     
-    return DCAMetrics(
-        total_clients=total_clients["count"] if total_clients else 0,
-        active_clients=active_clients["count"] if active_clients else 0,
-        flow_mode_clients=flow_clients["count"] if flow_clients else 0,
-        fixed_mode_clients=fixed_clients["count"] if fixed_clients else 0,
-        total_deposits=totals["total_deposits"] if totals else Decimal("0"),
-        total_distributed=totals["total_distributed"] if totals else Decimal("0"),
-        total_satoshis_distributed=totals["total_satoshis"] if totals else 0,
-        average_dca_rate=Decimal("0"),  # TODO: Calculate from historical data
-        transactions_processed_today=today_transactions["count"] if today_transactions else 0,
-        last_transaction_time=last_transaction["processing_timestamp"] if last_transaction else None,
-    )
-
-async def get_client_metrics(client_id: str) -> ClientMetrics:
-    """Get metrics for a specific client."""
-    # Get client data
+    metrics = DCAMetrics(
+        total_clients=row["total_clients"],
+        active_clients=row["active_clients"],
+        flow_mode_clients=row["flow_clients"],
+        fixed_mode_clients=row["fixed_clients"],
+        total_deposits=row["total_deposits"] or Decimal("0"),
+        total_distributed=row["total_distributed"] or Decimal("0"),
+        total_satoshis_distributed=row["total_satoshis"] or 0,
+        average_dca_rate=_average_rate(row["total_distributed"], row["total_satoshis"]),
+        transactions_processed_today=row["transactions_today"] or 0,
+        last_transaction_time=row["last_transaction_time"],
+        system_health="healthy",
+    )
+    _metrics_cache = (time.monotonic(), metrics)
+    return metrics
+
+async def get_client_metrics(client_id: str, spot_price: Optional[Decimal] = None) -> ClientMetrics:
+    """
+    Get metrics for a specific client, from its daily rollups. With the
+    current `spot_price` performance_vs_spot is the percentage the bought
+    sats gained over what was paid for them.
+    """
     client = await get_dca_client(client_id)
     if not client:
         raise ValueError("Client not found")
     
-    # Get distribution count
-    distribution_count = await db.fetchone(
-        """
-        SELECT COUNT(*) as count
-        FROM dca_admin.distributions
-        WHERE client_id = :client_id
-        """,
-        {"client_id": client_id},
-    )
-    
-    # Get last distribution
-    last_distribution = await db.fetchone(
+    row = await db.fetchone(
         """
-        SELECT created_at
-        FROM dca_admin.distributions
+        SELECT
+            COALESCE(SUM(distribution_count), 0) as count,
+            SUM(amount_fiat) as amount_fiat,
+            SUM(amount_satoshis) as amount_satoshis,
+            MAX(last_distribution) as last_distribution
+        FROM dca_admin.daily_rollups
         WHERE client_id = :client_id
-        ORDER BY created_at DESC
-        LIMIT 1
         """,
         {"client_id": client_id},
     )
+    average_rate = _average_rate(row["amount_fiat"], row["amount_satoshis"])
+    performance = Decimal("0")
+    if spot_price and average_rate:
+        performance = ((spot_price / average_rate - 1) * 100).quantize(Decimal("0.01"))
     
     return ClientMetrics(
         client_id=client_id,
         total_invested=client.initial_deposit,
         total_satoshis=client.total_satoshis,
-        average_rate=client.average_rate if hasattr(client, "average_rate") else Decimal("0"),
-        distribution_count=distribution_count["count"] if distribution_count else 0,
-        last_distribution=last_distribution["created_at"] if last_distribution else None,
-        performance_vs_spot=Decimal("0"),  # TODO: Calculate from historical data
+        average_rate=average_rate,
+        distribution_count=row["count"],
+        last_distribution=row["last_distribution"],
+        performance_vs_spot=performance,
+    )
+
+async def get_client_history(client_id: str, days: int = 90) -> List[DailyRollup]:
+    """A client's daily rollups, newest day first."""
+    rollups = await db.fetchall(
+        """
+        SELECT * FROM dca_admin.daily_rollups
+        WHERE client_id = :client_id
+        ORDER BY day DESC
+        LIMIT :days
+        """,
+        {"client_id": client_id, "days": days},
+        DailyRollup,
     )
+    for rollup in rollups:
+        rollup.average_rate = _average_rate(rollup.amount_fiat, rollup.amount_satoshis)
+    return rollups
@@ -0,0 +1,51 @@
+# Description: DCA Admin Extension - In-memory index of processed Lamassu ids
+
+from typing import Iterable, List, Set
+
+
+class ProcessedIdIndex:
+    """
+    Lamassu transaction ids this process knows were already processed.
+
+    A hit is final, the unique constraint on
+    processed_transactions.lamassu_transaction_id guarantees the row exists,
+    so the transaction is dropped without a query. A miss only means
+    "probably new": another worker may have processed it since the index was
+    warmed, so misses are still confirmed against the database and the
+    unique constraint stays the last line of defence.
+    """
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self._ids: Set[str] = set()
+
+    def load(self, lamassu_ids: Iterable[str]) -> None:
+        self._ids = set(lamassu_ids)
+        self.loaded = True
+
+    def clear(self) -> None:
+        self.loaded = False
+        self._ids = set()
+
+    def __contains__(self, lamassu_id: str) -> bool:
+        return lamassu_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add_many(self, lamassu_ids: Iterable[str]) -> None:
+        self._ids.update(lamassu_ids)
+
+    def unknown(self, lamassu_ids: Iterable[str]) -> List[str]:
+        """Ids not in the index, in order and without repeats."""
+        seen: Set[str] = set()
+        result = []
+        for lamassu_id in lamassu_ids:
+            if lamassu_id in self._ids or lamassu_id in seen:
+                continue
+            seen.add(lamassu_id)
+            result.append(lamassu_id)
+        return result
+
+
+processed_ids = ProcessedIdIndex()
@@ -0,0 +1,192 @@
+# Description: DCA Admin Extension - Processing cycle instrumentation
+#
+# Each stage of a cycle (fetch, parse, filter, dedup, allocate, persist, pay)
+# is timed with `span()` and counted with the rows and bytes it handled. The
+# totals are served in the Prometheus text format from
+# /api/v1/internal/metrics, and every span is also logged as one JSON line
+# when DCA_ADMIN_JSON_TIMINGS is set.
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Histogram buckets in seconds, from a cached dedup lookup to a slow scp
+BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+# Per-stage series besides the histogram: name, type, help, StageStats field
+STAGE_COUNTERS = (
+    ("stage_last_duration_seconds", "gauge", "Latest run time", "last_seconds"),
+    ("stage_rows_total", "counter", "Rows handled", "rows"),
+    ("stage_bytes_total", "counter", "Bytes transferred", "bytes"),
+    ("stage_errors_total", "counter", "Runs that failed", "errors"),
+)
+
+
+class Span:
+    """
+    One timed stage run. Code inside `span()` fills in rows and bytes, and
+    sets `failed` for failures reported without raising.
+    """
+
+    __slots__ = ("stage", "seconds", "rows", "bytes", "failed")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.failed = False
+
+
+class StageStats:
+    __slots__ = (
+        "count",
+        "errors",
+        "seconds",
+        "rows",
+        "bytes",
+        "last_seconds",
+        "buckets",
+    )
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.last_seconds = 0.0
+        # cumulative, as Prometheus histograms expect
+        self.buckets = [0] * len(BUCKETS)
+
+
+class StageMetrics:
+    """Per-stage totals since start. Safe to record from worker threads."""
+
+    def __init__(self, json_logs: bool = False):
+        self.json_logs = json_logs
+        self._stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, span: Span, error: bool = False) -> None:
+        error = error or span.failed
+        with self._lock:
+            stats = self._stages.setdefault(span.stage, StageStats())
+            stats.count += 1
+            stats.errors += error
+            stats.seconds += span.seconds
+            stats.rows += span.rows
+            stats.bytes += span.bytes
+            stats.last_seconds = span.seconds
+            for i, bound in enumerate(BUCKETS):
+                if span.seconds <= bound:
+                    stats.buckets[i] += 1
+        if self.json_logs:
+            # only needed for the JSON lines, the fetcher also runs standalone
+            from loguru import logger
+
+            logger.info(
+                json.dumps(
+                    {
+                        "event": "dca_admin_stage",
+                        "stage": span.stage,
+                        "seconds": round(span.seconds, 6),
+                        "rows": span.rows,
+                        "bytes": span.bytes,
+                        "error": error,
+                    }
+                )
+            )
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[Span]:
+        """Time the enclosed block as one run of `stage`."""
+        current = Span(stage)
+        start = time.perf_counter()
+        error = False
+        try:
+            yield current
+        except BaseException:
+            error = True
+            raise
+        finally:
+            current.seconds = time.perf_counter() - start
+            self.record(current, error)
+
+    def timed(self, items: Iterable[T], span: Span) -> Iterator[T]:
+        """
+        Pass `items` through, adding the time spent producing each one to
+        `span` and counting them. Lets a streaming pipeline attribute its
+        time to the generator stage that spent it.
+        """
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                span.seconds += time.perf_counter() - start
+                return
+            span.seconds += time.perf_counter() - start
+            span.rows += 1
+            yield item
+
+    def snapshot(self) -> Dict[str, StageStats]:
+        with self._lock:
+            return {stage: _copy(stats) for stage, stats in self._stages.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+    def render(self, gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+        """
+        Prometheus text exposition of every stage, plus `gauges` given as
+        name -> (help, value).
+        """
+        stages = sorted(self.snapshot().items())
+        histogram = "dca_admin_stage_duration_seconds"
+        lines: List[str] = [
+            f"# HELP {histogram} Time spent in each processing stage",
+            f"# TYPE {histogram} histogram",
+        ]
+        for stage, stats in stages:
+            label = f'stage="{stage}"'
+            for bound, count in zip(BUCKETS, stats.buckets):
+                lines.append(f'{histogram}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{histogram}_bucket{{{label},le="+Inf"}} {stats.count}')
+            lines.append(f"{histogram}_sum{{{label}}} {stats.seconds}")
+            lines.append(f"{histogram}_count{{{label}}} {stats.count}")
+
+        for name, kind, help_text, attr in STAGE_COUNTERS:
+            lines.append(f"# HELP dca_admin_{name} {help_text}")
+            lines.append(f"# TYPE dca_admin_{name} {kind}")
+            for stage, stats in stages:
+                lines.append(
+                    f'dca_admin_{name}{{stage="{stage}"}} {getattr(stats, attr)}'
+                )
+
+        for name, (help_text, value) in (gauges or {}).items():
+            lines.append(f"# HELP dca_admin_{name} {help_text}")
+            lines.append(f"# TYPE dca_admin_{name} gauge")
+            lines.append(f"dca_admin_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _copy(stats: StageStats) -> StageStats:
+    copy = StageStats()
+    for attr in StageStats.__slots__:
+        value = getattr(stats, attr)
+        setattr(copy, attr, list(value) if isinstance(value, list) else value)
+    return copy
+
+
+stage_metrics = StageMetrics(
+    json_logs=os.getenv("DCA_ADMIN_JSON_TIMINGS", "").lower() in ("1", "true", "yes")
+)
+span = stage_metrics.span
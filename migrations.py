@@ -4,6 +4,39 @@
 
 # DCA Admin Extension - Database Migrations
 
+from lnbits.db import SQLITE
+from lnbits.helpers import urlsafe_short_hash
+
+
+class _SQLiteCompatibleDDL:
+    """
+    m001 and m002 shipped with schema-qualified REFERENCES and CREATE INDEX
+    targets, which Postgres accepts and SQLite rejects. Shipped migrations
+    are never edited, so on SQLite their statements are rewritten on the
+    way to the database instead. Postgres runs them unchanged.
+    """
+
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    async def execute(self, query, values=None):
+        query = query.replace("REFERENCES dca_admin.", "REFERENCES ")
+        query = query.replace(" ON dca_admin.", " ON ")
+        return await self._db.execute(query, values)
+
+
+def _sqlite_compatible(migrate):
+    async def run(db):
+        await migrate(_SQLiteCompatibleDDL(db) if db.type == SQLITE else db)
+
+    run.__name__ = migrate.__name__
+    run.__doc__ = migrate.__doc__
+    return run
+
+
 async def m001_initial_tables(db):
     """
     Creates the initial tables for the DCA admin extension.
@@ -168,6 +201,10 @@ async def m002_add_wallet_constraints(db):
     await db.execute("CREATE INDEX idx_distributions_daily ON dca_admin.distributions (client_id, created_at);")
     
 
+m001_initial_tables = _sqlite_compatible(m001_initial_tables)
+m002_add_wallet_constraints = _sqlite_compatible(m002_add_wallet_constraints)
+
+
 async def m003_add_transaction_metadata(db):
     """
     Add additional fields for enhanced transaction tracking.
@@ -192,3 +229,232 @@ async def m004_cleanup_old_tables(db):
         await db.execute("DROP TABLE IF EXISTS dca_admin.maintable;")
     except Exception:
         pass  # Table might not exist
+
+
+async def m005_drop_redundant_lamassu_id_index(db):
+    """
+    lamassu_transaction_id is declared UNIQUE in m001, which already gives it
+    a unique index. Drop the plain index on the same column, it only adds
+    write cost. Duplicate inserts keep failing on the unique constraint.
+    """
+    await db.execute("DROP INDEX IF EXISTS dca_admin.idx_processed_transactions_lamassu_id;")
+
+
+async def m006_add_payout_queue(db):
+    """
+    Track payout attempts so failed distributions are retried with backoff,
+    and configure the wallet payouts are paid from.
+    """
+    await db.execute("ALTER TABLE dca_admin.distributions ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;")
+    await db.execute("ALTER TABLE dca_admin.distributions ADD COLUMN next_attempt_at TIMESTAMP;")
+    await db.execute(f"CREATE INDEX idx_distributions_payout_queue ON {db.references_schema}distributions (status, next_attempt_at);")
+
+    await db.execute("ALTER TABLE dca_admin.system_config ADD COLUMN payout_wallet TEXT;")
+    await db.execute("ALTER TABLE dca_admin.system_config ADD COLUMN payout_concurrency INTEGER NOT NULL DEFAULT 8;")
+
+
+async def m007_add_fixed_schedule_state(db):
+    """
+    Remember the last schedule slot the fixed mode scheduler ran for, so runs
+    missed while LNbits was down can be caught up.
+    """
+    await db.execute("ALTER TABLE dca_admin.system_config ADD COLUMN last_fixed_run_at TIMESTAMP;")
+
+
+async def m008_add_system_config_version(db):
+    """
+    Bumped on every system_config write, so workers serving the configuration
+    from memory can tell their copy is stale with a primary key lookup.
+    """
+    await db.execute("ALTER TABLE dca_admin.system_config ADD COLUMN version INTEGER NOT NULL DEFAULT 0;")
+
+
+async def m009_add_daily_rollups(db):
+    """
+    Per client per day totals of the distributions, and per day totals of the
+    processed Lamassu transactions, kept up to date by the writes that insert
+    them. Metrics and history charts read these instead of the raw rows.
+    Backfilled from the existing history.
+    """
+    await db.execute(
+        """
+        CREATE TABLE dca_admin.daily_rollups (
+            client_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            amount_fiat DECIMAL(15,2) NOT NULL DEFAULT 0,
+            amount_satoshis INTEGER NOT NULL DEFAULT 0,
+            distribution_count INTEGER NOT NULL DEFAULT 0,
+            last_distribution TIMESTAMP,
+            PRIMARY KEY (client_id, day)
+        );
+        """
+    )
+    await db.execute(
+        """
+        CREATE TABLE dca_admin.daily_transaction_rollups (
+            day TEXT PRIMARY KEY,
+            transaction_count INTEGER NOT NULL DEFAULT 0,
+            flow_distribution_amount DECIMAL(15,2) NOT NULL DEFAULT 0,
+            commission_amount DECIMAL(15,2) NOT NULL DEFAULT 0,
+            last_transaction_time TIMESTAMP
+        );
+        """
+    )
+
+    def day_of(column: str) -> str:
+        if db.type == SQLITE:
+            return f"strftime('%Y-%m-%d', {column}, 'unixepoch')"
+        return f"to_char({column}, 'YYYY-MM-DD')"
+
+    await db.execute(
+        f"""
+        INSERT INTO dca_admin.daily_rollups (
+            client_id, day, amount_fiat, amount_satoshis,
+            distribution_count, last_distribution
+        )
+        SELECT client_id, {day_of("created_at")}, SUM(amount_fiat),
+            SUM(amount_satoshis), COUNT(*), MAX(created_at)
+        FROM dca_admin.distributions
+        GROUP BY client_id, {day_of("created_at")};
+        """
+    )
+    await db.execute(
+        f"""
+        INSERT INTO dca_admin.daily_transaction_rollups (
+            day, transaction_count, flow_distribution_amount,
+            commission_amount, last_transaction_time
+        )
+        SELECT {day_of("processing_timestamp")}, COUNT(*),
+            SUM(flow_distribution_amount), SUM(commission_amount),
+            MAX(processing_timestamp)
+        FROM dca_admin.processed_transactions
+        GROUP BY {day_of("processing_timestamp")};
+        """
+    )
+
+
+async def m010_add_query_shaped_indexes(db):
+    """
+    Replace single-column indexes with composite ones that match how crud.py
+    actually filters and sorts, and drop the ones a composite index already
+    covers as its leading column, they only add write cost.
+    """
+    # get_dca_clients: WHERE wallet_id ORDER BY created_at
+    await db.execute(f"CREATE INDEX idx_clients_wallet_created ON {db.references_schema}clients (wallet_id, created_at);")
+    await db.execute("DROP INDEX IF EXISTS dca_admin.idx_clients_wallet_id;")
+    # get_active_flow_clients / get_active_fixed_clients and the daily reset
+    await db.execute(f"CREATE INDEX idx_clients_mode_status ON {db.references_schema}clients (dca_mode, status, current_balance);")
+    await db.execute("DROP INDEX IF EXISTS dca_admin.idx_clients_dca_mode;")
+    await db.execute("DROP INDEX IF EXISTS dca_admin.idx_clients_status;")
+
+    # Keyset pages seek on (timestamp, id)
+    await db.execute(f"CREATE INDEX idx_processed_transactions_keyset ON {db.references_schema}processed_transactions (processing_timestamp, id);")
+    await db.execute("DROP INDEX IF EXISTS dca_admin.idx_processed_transactions_timestamp;")
+    await db.execute(f"CREATE INDEX idx_distributions_keyset ON {db.references_schema}distributions (created_at, id);")
+    await db.execute("DROP INDEX IF EXISTS dca_admin.idx_distributions_created_at;")
+
+    # get_due_payouts: a client's failed payouts still backing off
+    await db.execute(f"CREATE INDEX idx_distributions_client_backoff ON {db.references_schema}distributions (client_id, status, next_attempt_at);")
+    # Covered by idx_distributions_daily (client_id, created_at) and
+    # idx_distributions_payout_queue (status, next_attempt_at)
+    await db.execute("DROP INDEX IF EXISTS dca_admin.idx_distributions_client_id;")
+    await db.execute("DROP INDEX IF EXISTS dca_admin.idx_distributions_status;")
+
+    # get_commission_distributions: the wallet's recipients, then their rows
+    await db.execute(f"CREATE INDEX idx_commission_recipients_wallet_id ON {db.references_schema}commission_recipients (wallet_id);")
+    await db.execute(f"CREATE INDEX idx_commission_distributions_recipient_created ON {db.references_schema}commission_distributions (recipient_id, created_at);")
+    await db.execute("DROP INDEX IF EXISTS dca_admin.idx_commission_distributions_recipient_id;")
+
+
+async def m011_add_distribution_payment_hash_index(db):
+    """
+    The invoice listener finds the distribution a paid invoice belongs to by
+    its payment hash.
+    """
+    await db.execute(f"CREATE INDEX idx_distributions_payment_hash ON {db.references_schema}distributions (payment_hash);")
+
+
+async def m012_add_lamassu_database_url(db):
+    """
+    A read-only Lamassu Postgres URL; when set the poller queries
+    cash_out_txs directly instead of exporting CSV over SSH.
+    """
+    await db.execute("ALTER TABLE dca_admin.system_config ADD COLUMN lamassu_database_url TEXT;")
+
+
+async def m013_add_flow_cycle_links(db):
+    """
+    A flow cycle pays each client once for all the transactions it covered.
+    cycle_id ties its processed transactions, distributions and commission
+    distributions together, and undistributed_amount keeps what a
+    transaction could not distribute because the clients' balances ran out.
+    """
+    await db.execute(
+        "ALTER TABLE dca_admin.processed_transactions ADD COLUMN cycle_id TEXT;"
+    )
+    await db.execute(
+        "ALTER TABLE dca_admin.processed_transactions "
+        "ADD COLUMN undistributed_amount DECIMAL(15,2) NOT NULL DEFAULT 0;"
+    )
+    await db.execute("ALTER TABLE dca_admin.distributions ADD COLUMN cycle_id TEXT;")
+    await db.execute(
+        "ALTER TABLE dca_admin.commission_distributions ADD COLUMN cycle_id TEXT;"
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_processed_transactions_cycle_id "
+        f"ON {db.references_schema}processed_transactions (cycle_id);"
+    )
+
+
+async def m014_add_updates_channel(db):
+    """
+    The websocket id live client deltas are pushed to. It is random and only
+    readable with an admin key, unlike the client ids they used to go to.
+    """
+    await db.execute(
+        "ALTER TABLE dca_admin.system_config ADD COLUMN updates_channel TEXT;"
+    )
+    await db.execute(
+        "UPDATE dca_admin.system_config SET updates_channel = :channel "
+        "WHERE updates_channel IS NULL",
+        {"channel": urlsafe_short_hash()},
+    )
+
+
+async def m015_add_distribution_claims(db):
+    """
+    When a payout worker claimed a distribution. A worker only pays a row it
+    moved to `processing` itself, so two workers never pay the same one.
+    """
+    await db.execute(
+        "ALTER TABLE dca_admin.distributions ADD COLUMN claimed_at TIMESTAMP;"
+    )
+
+
+async def m016_add_distribution_cycle_index(db):
+    """
+    The poller waits for the previous flow cycle's distributions to be paid,
+    and looks them up by cycle_id.
+    """
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_distributions_cycle_id "
+        f"ON {db.references_schema}distributions (cycle_id, status);"
+    )
+
+
+async def m017_fix_sqlite_config_timestamps(db):
+    """
+    m001 inserted the default configuration with CURRENT_TIMESTAMP, which
+    SQLite stores as text while every other timestamp is an integer, and
+    the configuration then fails to load. Rewrite them as integers.
+    """
+    if db.type != SQLITE:
+        return
+    await db.execute(
+        """
+        UPDATE dca_admin.system_config SET
+            created_at = CAST(strftime('%s', created_at) AS INTEGER),
+            updated_at = CAST(strftime('%s', updated_at) AS INTEGER)
+        WHERE typeof(created_at) = 'text' OR typeof(updated_at) = 'text'
+        """
+    )
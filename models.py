@@ -1,6 +1,6 @@
 # Description: Pydantic data models dictate what is passed between frontend and backend.
 
-from typing import Optional, List
+from typing import Any, Optional, List
 from datetime import datetime
 from decimal import Decimal
 from enum import Enum
@@ -138,6 +138,8 @@ class ProcessedTransaction(BaseModel):
     commission_amount: Decimal  # Commission amount distributed separately
     clients_affected: int  # Number of flow mode clients affected
     status: str = "completed"  # completed, failed, partial
+    undistributed_amount: Decimal = Decimal("0")  # What balances couldn't take
+    cycle_id: Optional[str] = None  # Flow cycle that processed it
 
 
 # ============ DISTRIBUTION MODELS ============
@@ -157,6 +159,15 @@ class DCADistribution(BaseModel):
     created_at: datetime
     completed_at: Optional[datetime]
     notes: Optional[str]
+    attempts: int = 0  # Failed payout attempts so far
+    next_attempt_at: Optional[datetime] = None  # When a failed payout is retried
+    claimed_at: Optional[datetime] = None  # When a payout worker took the row
+    cycle_id: Optional[str] = None  # Flow cycle whose transactions it pays for
+
+
+class PendingPayout(DCADistribution):
+    """A distribution waiting to be paid, with the client's wallet"""
+    wallet_id: str
 
 
 class CreateDistributionData(BaseModel):
@@ -200,6 +211,15 @@ class CommissionDistribution(BaseModel):
     status: str = "pending"
     created_at: datetime
     completed_at: Optional[datetime]
+    cycle_id: Optional[str] = None  # Flow cycle whose commissions it pays
+
+
+# ============ PAGINATION MODELS ============
+
+class CursorPage(BaseModel):
+    """One page of a keyset-paginated listing"""
+    data: List[Any]
+    next_cursor: Optional[str] = None  # Pass back as `cursor` for the next page, None on the last page
 
 
 # ============ SYSTEM CONFIGURATION MODELS ============
@@ -210,13 +230,19 @@ class SystemConfig(BaseModel):
     lamassu_server_ip: Optional[str] = None
     lamassu_ssh_user: str = "root"
     lamassu_log_dir: str = "./lamassu_logs"
+    lamassu_database_url: Optional[str] = None  # Read-only Postgres URL, used instead of SSH when set
     last_processed_timestamp: Optional[datetime] = None
     fixed_mode_schedule: str = "daily"  # daily, twice_daily, custom
-    fixed_mode_time: str = "09:00"  # UTC time for fixed distributions
+    fixed_mode_time: str = "09:00"  # UTC time for fixed distributions, comma-separated times for custom
     max_daily_fixed_amount: Decimal = Field(default=2000, description="Maximum daily fixed amount per client")
     processing_enabled: bool = True
     nostr_relay: Optional[str] = None  # For error notifications
     notification_wallet: Optional[str] = None  # Wallet for system notifications
+    payout_wallet: Optional[str] = None  # Wallet distributions are paid from
+    payout_concurrency: int = 8  # Wallets paid out in parallel
+    last_fixed_run_at: Optional[datetime] = None  # Last fixed mode slot that ran
+    updates_channel: Optional[str] = None  # Secret websocket id live deltas go to
+    version: int = 0  # Bumped on every write, for cache invalidation
     created_at: datetime
     updated_at: datetime
 
@@ -226,12 +252,15 @@ class UpdateSystemConfigData(BaseModel):
     lamassu_server_ip: Optional[str] = None
     lamassu_ssh_user: Optional[str] = None
     lamassu_log_dir: Optional[str] = None
+    lamassu_database_url: Optional[str] = None
     fixed_mode_schedule: Optional[str] = None
     fixed_mode_time: Optional[str] = None
     max_daily_fixed_amount: Optional[Decimal] = None
     processing_enabled: Optional[bool] = None
     nostr_relay: Optional[str] = None
     notification_wallet: Optional[str] = None
+    payout_wallet: Optional[str] = None
+    payout_concurrency: Optional[int] = Field(None, ge=1, le=64)
 
 
 # ============ ANALYTICS MODELS ============
@@ -260,3 +289,28 @@ class ClientMetrics(BaseModel):
     distribution_count: int
     last_distribution: Optional[datetime]
     performance_vs_spot: Decimal  # Performance compared to spot price
+
+
+class DailyRollup(BaseModel):
+    """One client's distributions on one UTC day"""
+    client_id: str
+    day: str  # YYYY-MM-DD
+    amount_fiat: Decimal
+    amount_satoshis: int
+    distribution_count: int
+    last_distribution: Optional[datetime]
+    average_rate: Decimal = Decimal("0")  # Volume weighted fiat per BTC
+
+
+class PollerStatus(BaseModel):
+    """Lamassu polling task state, for tuning the poll interval"""
+    running: bool = False
+    interval_seconds: float = 0  # Wait before the next poll
+    transaction_rate: float = 0  # Smoothed DCA transactions per hour
+    last_poll_at: Optional[datetime] = None
+    last_cycle_seconds: Optional[float] = None  # Fetch + distribute duration
+    last_cycle_transactions: int = 0
+    queue_depth: int = 0  # Distributions waiting for payout at the last poll
+    cycles: int = 0
+    skipped_cycles: int = 0  # Polls skipped while the previous cycle was paid out
+    failed_cycles: int = 0
@@ -0,0 +1,273 @@
+# Description: DCA Admin Extension - Lightning payout dispatcher
+#
+# dca_admin.distributions is the payout queue: rows are paid while
+# `pending`, a worker claims them by moving them to `processing` before it
+# creates their invoice, and they go to `completed` or `failed`. Failed rows
+# come back after an exponential backoff, and a restart resumes from
+# whatever the table says.
+
+import asyncio
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from lnbits.core.crud import get_standalone_payment, get_wallet
+from lnbits.core.services import create_invoice, pay_invoice
+from loguru import logger
+
+from .crud import (
+    claim_distribution,
+    complete_distribution,
+    fail_distribution,
+    get_due_payouts,
+    get_system_config,
+    mark_distribution_invoiced,
+    release_distribution,
+)
+from .instrumentation import span
+from .models import PendingPayout
+
+MAX_ATTEMPTS = 10
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+PAYOUT_INTERVAL_SECONDS = 30
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    """Delay before retry number `attempts`: 30s, 60s, 120s... capped at an hour."""
+    seconds = BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, BACKOFF_MAX_SECONDS))
+
+
+class PayoutBackend(ABC):
+    """How payouts reach a wallet. Tests swap in a mock."""
+
+    @abstractmethod
+    async def create_invoice(
+        self, wallet_id: str, amount_sats: int, memo: str
+    ) -> Tuple[str, str]:
+        """Create an invoice on the client's wallet, (payment_hash, bolt11)."""
+
+    @abstractmethod
+    async def pay(self, wallet_id: str, payment_request: str, amount_sats: int) -> None:
+        """Pay from `wallet_id`, raise if the payment did not succeed."""
+
+    @abstractmethod
+    async def payment_status(
+        self, payment_hash: str, source_wallet: str
+    ) -> Optional[str]:
+        """
+        Where an earlier attempt's invoice stands: "success" once it is paid,
+        "pending" while a payment of it from `source_wallet` is in flight,
+        None if it can be given up for a new one.
+        """
+
+
+class LNbitsPayoutBackend(PayoutBackend):
+    """Invoice the client's LNbits wallet and pay it from the payout wallet."""
+
+    async def create_invoice(
+        self, wallet_id: str, amount_sats: int, memo: str
+    ) -> Tuple[str, str]:
+        payment = await create_invoice(
+            wallet_id=wallet_id,
+            amount=amount_sats,
+            memo=memo,
+            extra={"tag": "dca_admin"},
+        )
+        return payment.payment_hash, payment.bolt11
+
+    async def pay(self, wallet_id: str, payment_request: str, amount_sats: int) -> None:
+        payment = await pay_invoice(
+            wallet_id=wallet_id,
+            payment_request=payment_request,
+            max_sat=amount_sats,
+            description="DCA distribution",
+            extra={"tag": "dca_admin"},
+        )
+        if not payment.success:
+            raise RuntimeError(f"payment {payment.payment_hash} is {payment.status}")
+
+    async def payment_status(
+        self, payment_hash: str, source_wallet: str
+    ) -> Optional[str]:
+        incoming = await get_standalone_payment(payment_hash, incoming=True)
+        if incoming and incoming.success:
+            return "success"
+        outgoing = await get_standalone_payment(payment_hash, wallet_id=source_wallet)
+        if outgoing and outgoing.amount < 0 and outgoing.pending:
+            return "pending"
+        return None
+
+
+class InternalPayoutBackend(LNbitsPayoutBackend):
+    """
+    Fast path for wallets on this LNbits instance, which every DCA client
+    wallet normally is. Each payout is still one invoice and one
+    pay_invoice, but the invoice comes from the fake wallet LNbits uses for
+    internal invoices, so the funding source is never called, and paying
+    it settles inside the LNbits ledger. Every call takes its own short
+    core database connection, so other LNbits requests never wait behind
+    more than one ledger write.
+    """
+
+    def __init__(self) -> None:
+        self._local: Set[str] = set()
+
+    async def local_wallets(self, wallet_ids: Iterable[str]) -> Set[str]:
+        """The subset of `wallet_ids` that live on this instance."""
+        local = set()
+        for wallet_id in wallet_ids:
+            if wallet_id not in self._local:
+                if not await get_wallet(wallet_id):
+                    continue
+                self._local.add(wallet_id)
+            local.add(wallet_id)
+        return local
+
+    async def create_invoice(
+        self, wallet_id: str, amount_sats: int, memo: str
+    ) -> Tuple[str, str]:
+        payment = await create_invoice(
+            wallet_id=wallet_id,
+            amount=amount_sats,
+            memo=memo,
+            extra={"tag": "dca_admin"},
+            internal=True,
+        )
+        return payment.payment_hash, payment.bolt11
+
+
+class PayoutDispatcher:
+    """
+    Pays due distributions with at most `concurrency` wallets in flight.
+
+    Each wallet's payouts are paid one after another, oldest first, and a
+    failure stops that wallet until its retry is due, so a client never
+    receives a later distribution before an earlier one.
+
+    With an `internal_backend`, payouts to wallets on this instance go
+    through it instead, under the same `concurrency` limit.
+    """
+
+    def __init__(
+        self,
+        backend: PayoutBackend,
+        source_wallet: str,
+        concurrency: int = 8,
+        batch_size: int = 500,
+        internal_backend: Optional[InternalPayoutBackend] = None,
+    ):
+        self.backend = backend
+        self.source_wallet = source_wallet
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.internal_backend = internal_backend
+
+    async def group_by_wallet(
+        self, due: List[PendingPayout]
+    ) -> Tuple[Dict[str, List[PendingPayout]], Dict[str, List[PendingPayout]]]:
+        """Payouts per wallet, (external, internal), oldest first within each."""
+        by_wallet: Dict[str, List[PendingPayout]] = {}
+        for payout in due:
+            by_wallet.setdefault(payout.wallet_id, []).append(payout)
+
+        internal: Dict[str, List[PendingPayout]] = {}
+        if self.internal_backend:
+            for wallet_id in await self.internal_backend.local_wallets(by_wallet):
+                internal[wallet_id] = by_wallet.pop(wallet_id)
+        return by_wallet, internal
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        """Pay one batch of due distributions, returns how many were completed."""
+        now = now or datetime.utcnow()
+        due = await get_due_payouts(now, self.batch_size)
+        if not due:
+            return 0
+        by_wallet, internal = await self.group_by_wallet(due)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def drain(payouts: List[PendingPayout], backend: PayoutBackend) -> int:
+            completed = 0
+            async with semaphore:
+                for payout in payouts:
+                    if not await self.pay(payout, now, backend):
+                        break
+                    completed += 1
+            return completed
+
+        internal_backend = self.internal_backend or self.backend
+        with span("pay") as paying:
+            results = await asyncio.gather(
+                *(drain(p, self.backend) for p in by_wallet.values()),
+                *(drain(p, internal_backend) for p in internal.values()),
+            )
+            paying.rows = sum(results)
+            paying.failed = paying.rows < len(due)
+        return paying.rows
+
+    async def pay(
+        self,
+        payout: PendingPayout,
+        now: datetime,
+        backend: Optional[PayoutBackend] = None,
+    ) -> bool:
+        backend = backend or self.backend
+        if not await claim_distribution(payout.id, now):
+            # another worker is paying it, its wallet waits for that one
+            return False
+        try:
+            # A previous attempt may have gone through before a crash/timeout,
+            # or still be in flight, then paying a new invoice would pay twice
+            if payout.payment_hash:
+                status = await backend.payment_status(
+                    payout.payment_hash, self.source_wallet
+                )
+                if status == "success":
+                    await complete_distribution(payout.id, now)
+                    return True
+                if status == "pending":
+                    await release_distribution(payout.id, payout.status)
+                    logger.info(
+                        f"DCA payout {payout.id} still in flight, checking later"
+                    )
+                    return False
+            if payout.amount_satoshis > 0:
+                payment_hash, payment_request = await backend.create_invoice(
+                    payout.wallet_id,
+                    payout.amount_satoshis,
+                    f"DCA distribution {payout.id}",
+                )
+                await mark_distribution_invoiced(
+                    payout.id, payment_hash, payment_request
+                )
+                await backend.pay(
+                    self.source_wallet, payment_request, payout.amount_satoshis
+                )
+            await complete_distribution(payout.id, datetime.utcnow())
+            return True
+        except Exception as exc:
+            attempts = payout.attempts + 1
+            next_attempt_at = (
+                now + backoff_delay(attempts) if attempts < MAX_ATTEMPTS else None
+            )
+            await fail_distribution(payout.id, attempts, next_attempt_at)
+            logger.warning(f"DCA payout {payout.id} failed (attempt {attempts}): {exc}")
+            return False
+
+
+async def run_payout_worker() -> None:
+    """Permanent task paying due distributions from the configured payout wallet."""
+    backend = LNbitsPayoutBackend()
+    internal_backend = InternalPayoutBackend()
+    while True:
+        config = await get_system_config()
+        if config and config.processing_enabled and config.payout_wallet:
+            dispatcher = PayoutDispatcher(
+                backend,
+                config.payout_wallet,
+                config.payout_concurrency,
+                internal_backend=internal_backend,
+            )
+            await dispatcher.run_once()
+        await asyncio.sleep(PAYOUT_INTERVAL_SECONDS)
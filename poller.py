@@ -0,0 +1,192 @@
+# Description: DCA Admin Extension - Lamassu polling task
+#
+# Fetches new cash-out transactions from the Lamassu server and runs them
+# through process_flow_cycle. The interval follows the observed transaction
+# rate, short while machines are busy and long overnight, and a poll is
+# skipped while the payout worker is still paying the previous cycle's
+# distributions. Nothing is lost by skipping, the watermark stays where it
+# is and the next poll fetches everything since.
+
+import asyncio
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from loguru import logger
+
+from .crud import (
+    get_cycle_unpaid_count,
+    get_payout_queue_depth,
+    get_system_config,
+    set_last_processed_timestamp,
+)
+from .models import PollerStatus, SystemConfig
+from .services import process_flow_cycle
+from .transaction_fetcher import AsyncFetcher, as_utc, create_async_fetcher
+
+MIN_POLL_SECONDS = 30
+MAX_POLL_SECONDS = 900
+# Poll often enough to pick up about this many transactions each time
+TARGET_TRANSACTIONS_PER_POLL = 2
+# Weight of the newest sample in the smoothed transaction rate
+RATE_SMOOTHING = 0.3
+# Re-read the configuration this often while polling is disabled
+CONFIG_POLL_SECONDS = 60
+
+poller_status = PollerStatus()
+
+
+class AdaptiveInterval:
+    """Poll interval from an exponentially smoothed transaction rate."""
+
+    def __init__(
+        self,
+        minimum: float = MIN_POLL_SECONDS,
+        maximum: float = MAX_POLL_SECONDS,
+        target: float = TARGET_TRANSACTIONS_PER_POLL,
+        smoothing: float = RATE_SMOOTHING,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.smoothing = smoothing
+        self.rate = 0.0  # transactions per second
+        self.interval = minimum
+
+    def observe(self, transactions: int, elapsed: float) -> float:
+        """Record `transactions` seen over `elapsed` seconds, returns the next wait."""
+        if elapsed > 0:
+            sample = transactions / elapsed
+            self.rate = self.smoothing * sample + (1 - self.smoothing) * self.rate
+        if self.rate > 0:
+            self.interval = min(
+                max(self.target / self.rate, self.minimum), self.maximum
+            )
+        else:
+            self.interval = self.maximum
+        return self.interval
+
+
+def fetcher_config(config: SystemConfig) -> Dict[str, str]:
+    log_dir = Path(config.lamassu_log_dir)
+    return {
+        "database_url": config.lamassu_database_url or "",
+        "server_ip": config.lamassu_server_ip or "",
+        "server_log_dir": str(log_dir),
+        "old_server_log_dir": str(log_dir / "old"),
+        "ssh_user": config.lamassu_ssh_user,
+    }
+
+
+def lamassu_configured(config: SystemConfig) -> bool:
+    return bool(config.lamassu_database_url or config.lamassu_server_ip)
+
+
+class LamassuPoller:
+    """
+    One poll per `poll_once` call. The fetcher, and with it the SSH master
+    or Postgres connection, is kept between polls until the Lamassu settings
+    change.
+    """
+
+    def __init__(
+        self,
+        status: PollerStatus = poller_status,
+        fetcher_factory=create_async_fetcher,
+    ):
+        self.status = status
+        self.fetcher_factory = fetcher_factory
+        self.interval = AdaptiveInterval()
+        self.fetcher: Optional[AsyncFetcher] = None
+        self._fetcher_config: Optional[Dict[str, str]] = None
+        self._last_poll: Optional[float] = None
+        # The last cycle that distributed anything
+        self._cycle_id: Optional[str] = None
+
+    async def get_fetcher(self, config: SystemConfig) -> AsyncFetcher:
+        settings = fetcher_config(config)
+        if self.fetcher is None or settings != self._fetcher_config:
+            await self.close()
+            self.fetcher = self.fetcher_factory(settings)
+            self._fetcher_config = settings
+        return self.fetcher
+
+    async def close(self) -> None:
+        if self.fetcher is not None:
+            await self.fetcher.close()
+        self.fetcher = None
+
+    async def poll_once(self, config: SystemConfig) -> bool:
+        """
+        Fetch and distribute new transactions, returns False if the poll was
+        skipped or failed.
+        """
+        status = self.status
+        status.queue_depth = await get_payout_queue_depth()
+        # Without a payout wallet nothing is paid, there is nothing to wait for
+        if self._cycle_id and config.payout_wallet:
+            unpaid = await get_cycle_unpaid_count(self._cycle_id)
+            if unpaid:
+                status.skipped_cycles += 1
+                logger.info(
+                    f"DCA poll skipped, {unpaid} distributions of the previous "
+                    "cycle waiting for payout"
+                )
+                return False
+            self._cycle_id = None
+
+        started = time.monotonic()
+        try:
+            fetcher = await self.get_fetcher(config)
+            ok, transactions = await fetcher.fetch_and_process(
+                config.last_processed_timestamp
+            )
+            if not ok:
+                raise RuntimeError("Lamassu fetch failed")
+            processed = await process_flow_cycle(transactions)
+            if processed:
+                self._cycle_id = processed[0].cycle_id
+            # Held back while a fetched transaction may still be confirmed
+            if fetcher.watermark:
+                watermark = as_utc(fetcher.watermark).replace(tzinfo=None)
+                await set_last_processed_timestamp(watermark)
+        except Exception as exc:
+            status.failed_cycles += 1
+            logger.error(f"DCA poll failed: {exc}")
+            return False
+
+        if self._last_poll is not None:
+            # Re-fetched rows behind the watermark are not new activity
+            self.interval.observe(len(processed), started - self._last_poll)
+        self._last_poll = started
+        status.cycles += 1
+        status.last_poll_at = datetime.utcnow()
+        status.last_cycle_seconds = time.monotonic() - started
+        status.last_cycle_transactions = len(processed)
+        status.transaction_rate = self.interval.rate * 3600
+        logger.info(
+            f"DCA poll distributed {len(processed)} transactions "
+            f"in {status.last_cycle_seconds:.1f}s"
+        )
+        return True
+
+
+async def run_lamassu_poller() -> None:
+    """Permanent task polling Lamassu while processing is enabled."""
+    poller = LamassuPoller()
+    poller_status.running = True
+    try:
+        while True:
+            config = await get_system_config()
+            if config and config.processing_enabled and lamassu_configured(config):
+                await poller.poll_once(config)
+                delay = poller.interval.interval
+            else:
+                await poller.close()
+                delay = CONFIG_POLL_SECONDS
+            poller_status.interval_seconds = delay
+            await asyncio.sleep(delay)
+    finally:
+        poller_status.running = False
+        await poller.close()
@@ -0,0 +1,124 @@
+# Description: DCA Admin Extension - Fixed mode distribution scheduler
+#
+# Wakes at the configured UTC times (fixed_mode_schedule/fixed_mode_time),
+# queues every fixed mode client's share for the payout worker and records
+# the slot in system_config.last_fixed_run_at. Slots missed while LNbits was
+# down are run on the next start, oldest first.
+
+import asyncio
+import random
+from datetime import datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import List, Optional
+
+from lnbits.utils.exchange_rates import btc_price
+from loguru import logger
+
+from .crud import claim_fixed_slot, get_system_config
+from .models import SystemConfig
+from .services import process_fixed_slot
+
+FIAT_CURRENCY = "GTQ"
+# Spread wake-ups so many instances don't hit price feeds on the same second
+JITTER_SECONDS = 60
+# Upper bound on catch-up after a long outage: a week of twice daily slots,
+# two weeks of daily ones
+MAX_CATCH_UP_SLOTS = 14
+# Re-read the configuration at least this often
+CONFIG_POLL_SECONDS = 300
+
+
+def schedule_times(config: SystemConfig) -> List[time]:
+    """
+    Slot times of day: `daily` runs at fixed_mode_time, `twice_daily` also
+    twelve hours later, `custom` at each comma-separated fixed_mode_time.
+    """
+    times = []
+    for value in config.fixed_mode_time.split(","):
+        hours, minutes = value.strip().split(":")
+        times.append(time(int(hours), int(minutes)))
+        if config.fixed_mode_schedule != "custom":
+            break
+    if config.fixed_mode_schedule == "twice_daily":
+        first = times[0]
+        times.append(time((first.hour + 12) % 24, first.minute))
+    return sorted(set(times))
+
+
+def slots_between(start: datetime, end: datetime, times: List[time]) -> List[datetime]:
+    """Slots after `start` up to and including `end`, oldest first."""
+    slots = []
+    day = start.date()
+    while day <= end.date():
+        for slot_time in times:
+            slot = datetime.combine(day, slot_time)
+            if start < slot <= end:
+                slots.append(slot)
+        day += timedelta(days=1)
+    return slots
+
+
+def next_slot(after: datetime, times: List[time]) -> datetime:
+    return slots_between(after, after + timedelta(days=1), times)[0]
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def run_due_slots(config: SystemConfig, now: Optional[datetime] = None) -> int:
+    """
+    Run every slot since the last recorded one, returns how many ran. A
+    fresh install starts from the next slot instead of catching up. Each slot
+    is claimed with a compare-and-set on last_fixed_run_at in the same write
+    as its distributions, so a slot another worker (or a stale `config`)
+    already ran is not paid again and stops the catch-up.
+    """
+    now = now or datetime.utcnow()
+    times = schedule_times(config)
+    if not config.last_fixed_run_at:
+        await claim_fixed_slot(None, now.replace(microsecond=0))
+        return 0
+
+    last = _naive_utc(config.last_fixed_run_at)
+    due = slots_between(last, now, times)
+    if len(due) > MAX_CATCH_UP_SLOTS:
+        skipped = len(due) - MAX_CATCH_UP_SLOTS
+        logger.warning(f"DCA fixed mode skipping {skipped} missed slots")
+        due = due[-MAX_CATCH_UP_SLOTS:]
+    if not due:
+        return 0
+
+    price = Decimal(str(await btc_price(FIAT_CURRENCY)))
+    previous = config.last_fixed_run_at
+    ran = 0
+    for slot in due:
+        distributions = await process_fixed_slot(
+            config.max_daily_fixed_amount, len(times), price, slot, previous
+        )
+        if distributions is None:
+            logger.info(f"DCA fixed mode slot {slot:%Y-%m-%d %H:%M} already ran")
+            break
+        previous = slot
+        ran += 1
+        logger.info(
+            f"DCA fixed mode slot {slot:%Y-%m-%d %H:%M} queued "
+            f"{len(distributions)} distributions"
+        )
+    return ran
+
+
+async def run_fixed_scheduler() -> None:
+    """Permanent task running fixed mode distributions on schedule."""
+    while True:
+        config = await get_system_config()
+        delay: float = CONFIG_POLL_SECONDS
+        if config and config.processing_enabled:
+            await run_due_slots(config)
+            now = datetime.utcnow()
+            wake = next_slot(now, schedule_times(config))
+            wake += timedelta(seconds=random.uniform(0, JITTER_SECONDS))
+            delay = min((wake - now).total_seconds(), CONFIG_POLL_SECONDS)
+        await asyncio.sleep(delay)
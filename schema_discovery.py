@@ -4,13 +4,15 @@ Database Schema Discovery Script for Lamassu ATM
 This script connects to the Postgres database and exports the schema information
 """
 
-import psycopg2
 import json
 import csv
 from datetime import datetime
 
 def connect_to_database(host, port, database, username, password):
     """Connect to the Postgres database"""
+    # Imported here so loading this module does not pull in the driver
+    import psycopg2
+    
     try:
         conn = psycopg2.connect(
             host=host,
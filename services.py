@@ -0,0 +1,382 @@
+# Description: DCA Admin Extension - Distribution logic sitting between the
+# Lamassu fetcher and crud.py
+
+import asyncio
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from lnbits.helpers import urlsafe_short_hash
+from lnbits.utils.exchange_rates import btc_price
+from loguru import logger
+from sqlalchemy.exc import IntegrityError
+
+from .allocation import (
+    CENT,
+    CommissionSplitPlan,
+    FlowAllocationIndex,
+    commission_plan,
+    flow_index,
+    from_cents,
+    largest_remainder,
+    to_cents,
+)
+from .crud import (
+    create_fixed_distributions,
+    create_flow_cycle,
+    get_active_commission_recipients,
+    get_active_fixed_clients,
+    get_active_flow_clients,
+    get_processed_lamassu_ids,
+)
+from .dedup import ProcessedIdIndex, processed_ids
+from .instrumentation import span
+from .models import (
+    CommissionDistribution,
+    DCAClient,
+    DCADistribution,
+    DistributionType,
+    ProcessedTransaction,
+)
+from .updates import publish_distributions
+
+SATS_PER_BTC = 100_000_000
+
+# Client metrics value holdings at the spot price. Dashboards poll them, so
+# the price is fetched at most once per SPOT_PRICE_TTL seconds per currency,
+# and a price feed that fails or hangs gives no valuation for that long
+# instead of failing the request.
+SPOT_PRICE_TTL = 60.0
+SPOT_PRICE_TIMEOUT = 5.0
+_spot_prices: Dict[str, Tuple[float, Optional[Decimal]]] = {}
+_spot_price_lock = asyncio.Lock()
+
+
+async def get_spot_price(currency: str) -> Optional[Decimal]:
+    """BTC price in `currency` from a short-lived cache, None if unavailable."""
+    async with _spot_price_lock:
+        cached = _spot_prices.get(currency)
+        if cached and time.monotonic() - cached[0] < SPOT_PRICE_TTL:
+            return cached[1]
+        price: Optional[Decimal] = None
+        try:
+            price = Decimal(
+                str(await asyncio.wait_for(btc_price(currency), SPOT_PRICE_TIMEOUT))
+            )
+        except Exception as exc:
+            logger.warning(f"No BTC price in {currency}: {exc}")
+        _spot_prices[currency] = (time.monotonic(), price)
+        return price
+
+
+def _effective_rate(cents: int, sats: int) -> Decimal:
+    """Fiat per BTC actually paid, for rows that aggregate several rates."""
+    if sats <= 0:
+        return Decimal("0")
+    return (Decimal(cents) * SATS_PER_BTC / 100 / sats).quantize(CENT)
+
+
+def _tx_cents(tx: Dict, cents_key: str, amount_key: str) -> int:
+    """A transaction field in centavos, from the fetcher's integer key if set."""
+    cents = tx.get(cents_key)
+    if cents is None:
+        return to_cents(tx.get(amount_key) or 0)
+    return int(cents)
+
+
+async def get_flow_index() -> FlowAllocationIndex:
+    """The allocation index, loaded from the database on first use."""
+    if not flow_index.loaded:
+        flow_index.load(await get_active_flow_clients())
+    return flow_index
+
+
+async def get_commission_plan() -> CommissionSplitPlan:
+    """The commission split plan, built from the active recipients on first use."""
+    if not commission_plan.loaded:
+        commission_plan.load(await get_active_commission_recipients())
+    return commission_plan
+
+
+async def get_processed_ids() -> ProcessedIdIndex:
+    """The processed-id index, loaded from the database on first use."""
+    if not processed_ids.loaded:
+        processed_ids.load(await get_processed_lamassu_ids())
+    return processed_ids
+
+
+async def warm_caches() -> None:
+    """Load the in-memory indexes at startup instead of on the first cycle."""
+    await get_processed_ids()
+    await get_flow_index()
+    await get_commission_plan()
+
+
+async def filter_new_transactions(
+    transactions: List[Dict], index: Optional[ProcessedIdIndex] = None
+) -> List[Dict]:
+    """
+    Drop transactions that were already processed. Ids the index knows are
+    rejected without a query; the remaining ones are checked with a single
+    batched query, whose hits are added to the index.
+    """
+    if index is None:
+        index = await get_processed_ids()
+    candidates = index.unknown(tx["id"] for tx in transactions)
+    if not candidates:
+        return []
+    known = await get_processed_lamassu_ids(candidates)
+    index.add_many(known)
+    new_ids = set(candidates).difference(known)
+    new = []
+    for tx in transactions:
+        if tx["id"] in new_ids:
+            new_ids.discard(tx["id"])
+            new.append(tx)
+    return new
+
+
+def compute_flow_cycle(
+    transactions: List[Dict],
+    index: FlowAllocationIndex,
+    plan: CommissionSplitPlan,
+    now: Optional[datetime] = None,
+) -> Tuple[
+    List[ProcessedTransaction], List[DCADistribution], List[CommissionDistribution]
+]:
+    """
+    Allocate a whole fetch of Lamassu transactions at once.
+
+    A client's share of every transaction is proportional to the same cached
+    balance, so the cycle's total distribution_amount is split over the
+    balances once, and so are the sats each transaction bought at its own
+    crypto_atoms / fiat_amount rate. Largest remainder rounding makes the
+    client rows add up to exactly those totals. The cycle yields one
+    distribution (one payment) per client and one commission distribution
+    per recipient, however many transactions it covered, all sharing the
+    cycle_id of its processed transactions.
+
+    A transaction the remaining balances can't fully take is recorded as
+    "partial", with what was left over in undistributed_amount.
+    """
+    now = now or datetime.utcnow()
+    cycle_id = urlsafe_short_hash()
+    remaining = index.total
+    # (transaction, distributed cents, undistributed cents, commission cents)
+    rows: List[Tuple[Dict, int, int, int]] = []
+    cycle_cents = 0
+    cycle_sats = 0
+    commission_cents = 0
+    commission_sats = 0
+    for tx in transactions:
+        fiat_cents = _tx_cents(tx, "fiat_cents", "fiat_amount")
+        crypto_atoms = int(tx["crypto_atoms"])
+        tx_commission = _tx_cents(tx, "commission_cents", "actual_commission")
+        wanted = cents = 0
+        if fiat_cents > 0:
+            # capped at what is left of the clients' balances
+            wanted = max(_tx_cents(tx, "distribution_cents", "distribution_amount"), 0)
+            cents = min(wanted, remaining)
+            remaining -= cents
+            cycle_cents += cents
+            cycle_sats += cents * crypto_atoms // fiat_cents
+            commission_cents += tx_commission
+            commission_sats += tx_commission * crypto_atoms // fiat_cents
+        rows.append((tx, cents, wanted - cents, tx_commission))
+
+    shares = index.allocate(cycle_cents)
+    client_sats = largest_remainder(cycle_sats, [cents for _, cents in shares])
+
+    processed = [
+        ProcessedTransaction(
+            id=urlsafe_short_hash(),
+            lamassu_transaction_id=tx["id"],
+            processing_timestamp=now,
+            flow_distribution_amount=from_cents(cents),
+            commission_amount=from_cents(tx_commission),
+            clients_affected=len(shares) if cents else 0,
+            status="partial" if undistributed else "completed",
+            undistributed_amount=from_cents(undistributed),
+            cycle_id=cycle_id,
+        )
+        for tx, cents, undistributed, tx_commission in rows
+    ]
+
+    notes = f"Flow cycle of {len(transactions)} transaction(s)"
+    distributions = [
+        DCADistribution(
+            id=urlsafe_short_hash(),
+            client_id=client_id,
+            # one row pays for several transactions, cycle_id links them all
+            transaction_id=processed[0].id if len(processed) == 1 else None,
+            amount_fiat=from_cents(cents),
+            amount_satoshis=sats,
+            exchange_rate=_effective_rate(cents, sats),
+            distribution_type=DistributionType.FLOW,
+            payment_hash=None,
+            payment_request=None,
+            status="pending",
+            created_at=now,
+            completed_at=None,
+            notes=notes,
+            cycle_id=cycle_id,
+        )
+        for (client_id, cents), sats in zip(shares, client_sats)
+    ]
+
+    commissions: List[CommissionDistribution] = []
+    if processed and commission_cents > 0:
+        recipient_cents, recipient_sats = plan.split(
+            [commission_cents, commission_sats]
+        )
+        for recipient, cents, sats in zip(
+            plan.recipients, recipient_cents, recipient_sats
+        ):
+            if cents <= 0:
+                continue
+            commissions.append(
+                CommissionDistribution(
+                    id=urlsafe_short_hash(),
+                    # transaction_id is required, it names the cycle's
+                    # first transaction and cycle_id links the others
+                    transaction_id=processed[0].id,
+                    recipient_id=recipient.id,
+                    amount_fiat=from_cents(cents),
+                    amount_satoshis=sats,
+                    exchange_rate=_effective_rate(cents, sats),
+                    payment_hash=None,
+                    status="pending",
+                    created_at=now,
+                    completed_at=None,
+                    cycle_id=cycle_id,
+                )
+            )
+
+    return processed, distributions, commissions
+
+
+async def process_flow_cycle(
+    transactions: List[Dict], index: Optional[ProcessedIdIndex] = None
+) -> List[ProcessedTransaction]:
+    """
+    Allocate and persist everything one fetch_and_process call returned,
+    skipping transactions that were already processed. If another worker
+    commits one of them first the unique constraint rejects the whole
+    cycle, which is then filtered again and retried once.
+    """
+    if index is None:
+        index = await get_processed_ids()
+    for attempt in range(2):
+        with span("dedup") as dedup:
+            new = await filter_new_transactions(transactions, index)
+            dedup.rows = len(new)
+        if not new:
+            return []
+        with span("allocate") as allocating:
+            flow = await get_flow_index()
+            plan = await get_commission_plan()
+            processed, distributions, commissions = compute_flow_cycle(new, flow, plan)
+            allocating.rows = len(distributions)
+        try:
+            with span("persist") as persisting:
+                await create_flow_cycle(processed, distributions, commissions)
+                persisting.rows = len(processed) + len(distributions) + len(commissions)
+        except IntegrityError:
+            if attempt:
+                raise
+            logger.info("DCA cycle raced another worker, filtering again")
+            continue
+        index.add_many(p.lamassu_transaction_id for p in processed)
+        await publish_distributions(distributions)
+        return processed
+    return []
+
+
+async def process_flow_transaction(tx: Dict) -> Optional[ProcessedTransaction]:
+    """
+    Allocate one Lamassu transaction to all flow clients, None if it was
+    already processed.
+    """
+    processed = await process_flow_cycle([tx])
+    return processed[0] if processed else None
+
+
+def compute_fixed_distributions(
+    clients: List[DCAClient],
+    max_daily_amount: Decimal,
+    slots_per_day: int,
+    btc_price: Decimal,
+    now: Optional[datetime] = None,
+) -> List[DCADistribution]:
+    """
+    One schedule slot's fixed mode distributions. Each client gets its daily
+    limit (never above the system maximum) spread over the day's slots,
+    capped by what is left of today's allowance and by its balance.
+    """
+    now = now or datetime.utcnow()
+    if btc_price <= 0 or slots_per_day <= 0:
+        return []
+    max_cents = to_cents(max_daily_amount)
+    distributions = []
+    for client in clients:
+        daily_cents = min(
+            to_cents(client.fixed_daily_limit or max_daily_amount), max_cents
+        )
+        cents = min(
+            daily_cents // slots_per_day,
+            daily_cents - to_cents(client.daily_distributed_today),
+            to_cents(client.current_balance),
+        )
+        if cents <= 0:
+            continue
+        distributions.append(
+            DCADistribution(
+                id=urlsafe_short_hash(),
+                client_id=client.id,
+                transaction_id=None,
+                amount_fiat=from_cents(cents),
+                amount_satoshis=int(Decimal(cents) * SATS_PER_BTC / 100 / btc_price),
+                exchange_rate=btc_price,
+                distribution_type=DistributionType.FIXED,
+                payment_hash=None,
+                payment_request=None,
+                status="pending",
+                created_at=now,
+                completed_at=None,
+                notes=None,
+            )
+        )
+    return distributions
+
+
+async def process_fixed_slot(
+    max_daily_amount: Decimal,
+    slots_per_day: int,
+    btc_price: Decimal,
+    slot: datetime,
+    previous_slot: Optional[datetime],
+) -> Optional[List[DCADistribution]]:
+    """
+    Queue one schedule slot's fixed mode distributions for the payout worker,
+    claiming `slot` in the same write. Returns None if `previous_slot` was no
+    longer the last one run, i.e. another worker or an earlier run got there.
+    """
+    now = datetime.utcnow()
+    new_day = previous_slot is None or slot.date() != previous_slot.date()
+    clients = await get_active_fixed_clients()
+    if new_day:
+        # the write resets the daily totals before adding this slot's
+        clients = [
+            client.copy(update={"daily_distributed_today": Decimal(0)})
+            for client in clients
+        ]
+    distributions = compute_fixed_distributions(
+        clients, max_daily_amount, slots_per_day, btc_price, now
+    )
+    if not await create_fixed_distributions(
+        distributions, now, slot, previous_slot, new_day
+    ):
+        return None
+    await publish_distributions(distributions)
+    return distributions
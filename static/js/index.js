@@ -2,241 +2,109 @@ window.app = Vue.createApp({
   el: '#vue',
   mixins: [windowMixin],
   delimiters: ['${', '}'],
-  data: function () {
+
+  data() {
     return {
-      invoiceAmount: 10,
-      qrValue: 'lnurlpay',
-      myex: [],
-      myexTable: {
-        columns: [
-          {name: 'id', align: 'left', label: 'ID', field: 'id'},
-          {name: 'name', align: 'left', label: 'Name', field: 'name'},
-          {
-            name: 'wallet',
-            align: 'left',
-            label: 'Wallet',
-            field: 'wallet'
-          },
-          {
-            name: 'total',
-            align: 'left',
-            label: 'Total sent/received',
-            field: 'total'
-          }
-        ],
-        pagination: {
-          rowsPerPage: 10
-        }
-      },
-      formDialog: {
-        show: false,
-        data: {},
-        advanced: {}
-      },
-      urlDialog: {
-        show: false,
-        data: {}
-      }
+      loading: false,
+      processingEnabled: false,
+      lastTransactionTime: null,
+      transactionsProcessedToday: 0,
+      metrics: {},
+      recentTransactions: [],
+      clientSummary: [],
+      connection: null
     }
   },
 
-  ///////////////////////////////////////////////////
-  ////////////////METHODS FUNCTIONS//////////////////
-  ///////////////////////////////////////////////////
-
   methods: {
-    async closeFormDialog() {
-      this.formDialog.show = false
-      this.formDialog.data = {}
-    },
-    async getSatoshiMachines() {
-      await LNbits.api
-        .request(
-          'GET',
-          '/dca_admin/api/v1/myex',
-          this.g.user.wallets[0].inkey
-        )
-        .then(response => {
-          this.myex = response.data
-        })
-        .catch(err => {
-          LNbits.utils.notifyApiError(err)
-        })
-    },
-    async sendSatoshiMachineData() {
-      const data = {
-        name: this.formDialog.data.name,
-        lnurlwithdrawamount: this.formDialog.data.lnurlwithdrawamount,
-        lnurlpayamount: this.formDialog.data.lnurlpayamount
-      }
-      const wallet = _.findWhere(this.g.user.wallets, {
-        id: this.formDialog.data.wallet
-      })
-      if (this.formDialog.data.id) {
-        data.id = this.formDialog.data.id
-        data.total = this.formDialog.data.total
-        await this.updateSatoshiMachine(wallet, data)
-      } else {
-        await this.createSatoshiMachine(wallet, data)
-      }
+    adminkey() {
+      return this.g.user.wallets[0].adminkey
     },
 
-    async updateSatoshiMachineForm(tempId) {
-      const dca_admin = _.findWhere(this.myex, {id: tempId})
-      this.formDialog.data = {
-        ...dca_admin
-      }
-      if (this.formDialog.data.tip_wallet != '') {
-        this.formDialog.advanced.tips = true
-      }
-      if (this.formDialog.data.withdrawlimit >= 1) {
-        this.formDialog.advanced.otc = true
+    async loadDashboard() {
+      this.loading = true
+      try {
+        const [metrics, clients, transactions] = await Promise.all([
+          LNbits.api.request('GET', '/dca_admin/api/v1/metrics', this.adminkey()),
+          LNbits.api.request('GET', '/dca_admin/api/v1/clients', this.adminkey()),
+          LNbits.api.request(
+            'GET',
+            '/dca_admin/api/v1/transactions?limit=10',
+            this.adminkey()
+          )
+        ])
+        this.metrics = metrics.data
+        this.lastTransactionTime = metrics.data.last_transaction_time
+        this.transactionsProcessedToday =
+          metrics.data.transactions_processed_today
+        this.clientSummary = clients.data
+        this.recentTransactions = transactions.data
+      } catch (error) {
+        LNbits.utils.notifyApiError(error)
+      } finally {
+        this.loading = false
       }
-      this.formDialog.show = true
-    },
-    async createSatoshiMachine(wallet, data) {
-      data.wallet = wallet.id
-      await LNbits.api
-        .request('POST', '/dca_admin/api/v1/myex', wallet.adminkey, data)
-        .then(response => {
-          this.myex.push(response.data)
-          this.closeFormDialog()
-        })
-        .catch(error => {
-          LNbits.utils.notifyApiError(error)
-        })
     },
 
-    async updateSatoshiMachine(wallet, data) {
-      data.wallet = wallet.id
-      await LNbits.api
-        .request(
-          'PUT',
-          `/dca_admin/api/v1/myex/${data.id}`,
-          wallet.adminkey,
-          data
+    async connectUpdates() {
+      // The channel is only readable with an admin key, deltas are never
+      // sent to the public client ids
+      try {
+        const {data} = await LNbits.api.request(
+          'GET',
+          '/dca_admin/api/v1/config',
+          this.adminkey()
         )
-        .then(response => {
-          this.myex = _.reject(this.myex, obj => obj.id == data.id)
-          this.myex.push(response.data)
-          this.closeFormDialog()
-        })
-        .catch(error => {
-          LNbits.utils.notifyApiError(error)
-        })
-    },
-    async deleteSatoshiMachine(tempId) {
-      var dca_admin = _.findWhere(this.myex, {id: tempId})
-      const wallet = _.findWhere(this.g.user.wallets, {
-        id: dca_admin.wallet
-      })
-      await LNbits.utils
-        .confirmDialog('Are you sure you want to delete this SatoshiMachine?')
-        .onOk(function () {
-          LNbits.api
-            .request(
-              'DELETE',
-              '/dca_admin/api/v1/myex/' + tempId,
-              wallet.adminkey
-            )
-            .then(() => {
-              this.myex = _.reject(this.myex, function (obj) {
-                return obj.id === dca_admin.id
-              })
-            })
-            .catch(error => {
-              LNbits.utils.notifyApiError(error)
-            })
-        })
-    },
-
-    async exportCSV() {
-      await LNbits.utils.exportCSV(this.myexTable.columns, this.myex)
-    },
-    async itemsArray(tempId) {
-      const dca_admin = _.findWhere(this.myex, {id: tempId})
-      return [...dca_admin.itemsMap.values()]
-    },
-    async openformDialog(id) {
-      const [tempId, itemId] = id.split(':')
-      const dca_admin = _.findWhere(this.myex, {id: tempId})
-      if (itemId) {
-        const item = dca_admin.itemsMap.get(id)
-        this.formDialog.data = {
-          ...item,
-          dca_admin: tempId
+        this.processingEnabled = data.processing_enabled
+        if (!data.updates_channel) return
+        const protocol = location.protocol === 'http:' ? 'ws://' : 'wss://'
+        this.connection = new WebSocket(
+          protocol +
+            location.host +
+            '/api/v1/ws/' +
+            encodeURIComponent(data.updates_channel)
+        )
+        this.connection.onmessage = event => {
+          this.applyDelta(JSON.parse(event.data))
         }
-      } else {
-        this.formDialog.data.dca_admin = tempId
+      } catch (error) {
+        LNbits.utils.notifyApiError(error)
       }
-      this.formDialog.data.currency = dca_admin.currency
-      this.formDialog.show = true
     },
-    async openUrlDialog(tempid) {
-      this.urlDialog.data = _.findWhere(this.myex, {id: tempid})
-      this.qrValue = this.urlDialog.data.lnurlpay
 
-      // Connecting to our websocket fired in tasks.py
-      this.connectWebocket(this.urlDialog.data.id)
-
-      this.urlDialog.show = true
-    },
-    async closeformDialog() {
-      this.formDialog.show = false
-      this.formDialog.data = {}
-    },
-    async createInvoice(tempid) {
-      ///////////////////////////////////////////////////
-      ///Simple call to the api to create an invoice/////
-      ///////////////////////////////////////////////////
-      myex = _.findWhere(this.myex, {id: tempid})
-      const wallet = _.findWhere(this.g.user.wallets, {id: myex.wallet})
-      const data = {
-        dca_admin_id: tempid,
-        amount: this.invoiceAmount,
-        memo: 'SatoshiMachine - ' + myex.name
-      }
-      await LNbits.api
-        .request('POST', `/dca_admin/api/v1/myex/payment`, wallet.inkey, data)
-        .then(response => {
-          this.qrValue = response.data.payment_request
-          this.connectWebocket(wallet.inkey)
-        })
-        .catch(error => {
-          LNbits.utils.notifyApiError(error)
-        })
+    addAmount(value, delta) {
+      return (Number(value || 0) + Number(delta)).toFixed(2)
     },
-    connectWebocket(dca_admin_id) {
-      //////////////////////////////////////////////////
-      ///wait for pay action to happen and do a thing////
-      ///////////////////////////////////////////////////
-      if (location.protocol !== 'http:') {
-        localUrl =
-          'wss://' +
-          document.domain +
-          ':' +
-          location.port +
-          '/api/v1/ws/' +
-          dca_admin_id
-      } else {
-        localUrl =
-          'ws://' +
-          document.domain +
-          ':' +
-          location.port +
-          '/api/v1/ws/' +
-          dca_admin_id
-      }
-      this.connection = new WebSocket(localUrl)
-      this.connection.onmessage = () => {
-        this.urlDialog.show = false
+
+    applyDelta(delta) {
+      const client = this.clientSummary.find(c => c.id === delta.client_id)
+      if (client) {
+        client.current_balance = this.addAmount(
+          client.current_balance,
+          delta.current_balance_delta
+        )
+        client.total_distributed = this.addAmount(
+          client.total_distributed,
+          delta.total_distributed_delta
+        )
+        client.total_satoshis += delta.total_satoshis_delta
       }
+      this.metrics.total_distributed = this.addAmount(
+        this.metrics.total_distributed,
+        delta.total_distributed_delta
+      )
+      this.metrics.total_satoshis_distributed =
+        (this.metrics.total_satoshis_distributed || 0) +
+        delta.total_satoshis_delta
     }
   },
-  ///////////////////////////////////////////////////
-  //////LIFECYCLE FUNCTIONS RUNNING ON PAGE LOAD/////
-  ///////////////////////////////////////////////////
+
   async created() {
-    await this.getSatoshiMachines()
+    await this.loadDashboard()
+    await this.connectUpdates()
+  },
+
+  beforeUnmount() {
+    if (this.connection) this.connection.close()
   }
 })
@@ -1,17 +1,19 @@
 import asyncio
+from datetime import datetime
 
 from lnbits.core.models import Payment
-from lnbits.core.services import websocket_updater
 from lnbits.tasks import register_invoice_listener
 
-from .crud import get_dca_admin, update_dca_admin
-from .models import CreateSatoshiMachineData
+from .crud import complete_distribution, get_distribution_by_payment_hash
+from .updates import publish_payout
 
 #######################################
 ########## RUN YOUR TASKS HERE ########
 #######################################
 
-# The usual task is to listen to invoices related to this extension
+# Payouts are invoices on the client's wallet tagged "dca_admin". The
+# listener learns about them the moment they are paid, instead of anything
+# polling the payout queue for it.
 
 
 async def wait_for_paid_invoices():
@@ -22,35 +24,17 @@ async def wait_for_paid_invoices():
         await on_invoice_paid(payment)
 
 
-# Do somethhing when an invoice related top this extension is paid
-
-
 async def on_invoice_paid(payment: Payment) -> None:
-    if payment.extra.get("tag") != "SatoshiMachine":
+    if payment.extra.get("tag") != "dca_admin":
         return
 
-    dca_admin_id = payment.extra.get("dca_adminId")
-    assert dca_admin_id, "dca_adminId not set in invoice"
-    dca_admin = await get_dca_admin(dca_admin_id)
-    assert dca_admin, "SatoshiMachine does not exist"
-
-    # update something in the db
-    if payment.extra.get("lnurlwithdraw"):
-        total = dca_admin.total - payment.amount
-    else:
-        total = dca_admin.total + payment.amount
-
-    dca_admin.total = total
-    await update_dca_admin(CreateSatoshiMachineData(**dca_admin.dict()))
-
-    # here we could send some data to a websocket on
-    # wss://<your-lnbits>/api/v1/ws/<dca_admin_id> and then listen to it on
+    distribution = await get_distribution_by_payment_hash(payment.payment_hash)
+    if not distribution:
+        return
 
-    some_payment_data = {
-        "name": dca_admin.name,
-        "amount": payment.amount,
-        "fee": payment.fee,
-        "checking_id": payment.checking_id,
-    }
+    # The payout worker may have marked it already after paying
+    if distribution.status != "completed":
+        await complete_distribution(distribution.id, datetime.utcnow())
+        distribution.status = "completed"
 
-    await websocket_updater(dca_admin_id, str(some_payment_data))
+    await publish_payout(distribution)
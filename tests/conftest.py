@@ -0,0 +1,136 @@
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+import pytest_asyncio
+from lnbits.db import SQLITE, Database
+from lnbits.settings import settings
+
+from .. import crud, migrations
+from ..allocation import flow_index
+from ..dedup import processed_ids
+
+
+async def run_migrations(database: Database) -> None:
+    """Create the tables the way LNbits does, running every migration in order."""
+    for name, migrate in sorted(vars(migrations).items()):
+        if re.match(r"m\d{3}_", name):
+            await migrate(database)
+
+
+@pytest_asyncio.fixture
+async def database(tmp_path, monkeypatch):
+    """A throwaway SQLite dca_admin database behind crud.db."""
+    monkeypatch.setattr(settings, "lnbits_data_folder", str(tmp_path))
+    database = Database("ext_dca_admin")
+    if database.type != SQLITE:
+        pytest.skip("uses a throwaway SQLite database")
+    await run_migrations(database)
+    monkeypatch.setattr(crud, "db", database)
+    processed_ids.clear()
+    flow_index.clear()
+    crud.invalidate_system_config()
+    yield database
+    processed_ids.clear()
+    flow_index.clear()
+    crud.invalidate_system_config()
+    await database.engine.dispose()
+
+
+# ssh and scp for the fetcher tests and benchmarks. Opening a connection
+# costs STANDIN_HANDSHAKE seconds unless the ControlPath socket exists, which
+# a ControlMaster with ControlPersist leaves behind. The "server" runs remote
+# commands through the local shell with the export-* commands on its PATH.
+STANDIN = """#!{python}
+import json, os, shutil, subprocess, sys, time
+
+tool = os.path.basename(sys.argv[0])
+args, options, control_command = sys.argv[1:], {{}}, None
+while args and args[0].startswith("-"):
+    flag = args.pop(0)
+    if flag == "-o":
+        key, _, value = args.pop(0).partition("=")
+        options[key] = value
+    elif flag == "-O":
+        control_command = args.pop(0)
+control_path = options.get("ControlPath")
+reused = bool(control_path) and os.path.exists(control_path)
+with open(os.environ["STANDIN_LOG"], "a") as log:
+    log.write(json.dumps(dict(
+        tool=tool, options=options, control=control_command, reused=reused,
+        args=args,
+    )) + "\\n")
+
+if control_command == "exit":
+    if not reused:
+        sys.exit(255)
+    os.unlink(control_path)
+    sys.exit(0)
+if not reused:
+    time.sleep(float(os.environ["STANDIN_HANDSHAKE"]))
+    if options.get("ControlMaster") == "auto" and options.get("ControlPersist"):
+        open(control_path, "w").close()
+
+if tool == "ssh":
+    env = dict(os.environ, PATH=os.environ["STANDIN_BIN"] + ":" + os.environ["PATH"])
+    sys.exit(subprocess.run(["sh", "-c", args[1]], env=env).returncode)
+*sources, target = args
+for source in sources:
+    shutil.copy(source.split(":", 1)[1], target)
+"""
+
+EXPORTS = {
+    "export-cash-out": "cash_out_txs.csv",
+    "export-cash-in": "cash_in_txs.csv",
+    "export-out-actions": "cash_out_actions.csv",
+}
+
+
+class SshStandin:
+    """A fake Lamassu server reachable through the ssh/scp stand-ins."""
+
+    def __init__(self, root: Path):
+        self.bin = root / "bin"
+        self.server_bin = root / "server_bin"
+        self.remote_dir = root / "server_tmp"
+        self.tables = root / "tables"
+        self.log_path = root / "ssh.log"
+        for folder in (self.bin, self.server_bin, self.remote_dir, self.tables):
+            folder.mkdir(parents=True)
+        script = STANDIN.format(python=sys.executable)
+        for tool in ("ssh", "scp"):
+            (self.bin / tool).write_text(script)
+            (self.bin / tool).chmod(0o755)
+        for command, filename in EXPORTS.items():
+            (self.tables / filename).write_text("")
+            export = self.server_bin / command
+            export.write_text(
+                f"#!/bin/sh\ncp {self.tables / filename} {self.remote_dir / filename}\n"
+            )
+            export.chmod(0o755)
+
+    def set_cash_out(self, content: str) -> None:
+        """What the next export-cash-out writes on the server."""
+        (self.tables / EXPORTS["export-cash-out"]).write_text(content)
+
+    def calls(self) -> List[Dict]:
+        if not self.log_path.exists():
+            return []
+        return [json.loads(line) for line in self.log_path.read_text().splitlines()]
+
+    def clear(self) -> None:
+        self.log_path.unlink(missing_ok=True)
+
+
+@pytest.fixture
+def ssh_standin(tmp_path, monkeypatch) -> SshStandin:
+    standin = SshStandin(tmp_path / "ssh_standin")
+    monkeypatch.setenv("PATH", f"{standin.bin}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("STANDIN_BIN", str(standin.server_bin))
+    monkeypatch.setenv("STANDIN_LOG", str(standin.log_path))
+    monkeypatch.setenv("STANDIN_HANDSHAKE", "0")
+    return standin
@@ -0,0 +1,203 @@
+import random
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+import pytest
+
+from ..allocation import (
+    CommissionSplitPlan,
+    FlowAllocationIndex,
+    largest_remainder,
+    to_cents,
+)
+from ..models import CommissionRecipient
+from ..services import compute_flow_cycle
+from ..transaction_fetcher import LamassuTransactionFetcher, add_commission_fields
+
+
+def _plan(*percentages: str) -> CommissionSplitPlan:
+    plan = CommissionSplitPlan()
+    plan.load(
+        CommissionRecipient(
+            id=f"recipient-{i}",
+            wallet_id=f"wallet-{i}",
+            wallet_name=f"recipient {i}",
+            allocation_percentage=Decimal(percentage),
+            created_at=datetime(2025, 1, 1),
+        )
+        for i, percentage in enumerate(percentages)
+    )
+    return plan
+
+
+def _index(balances) -> FlowAllocationIndex:
+    index = FlowAllocationIndex()
+    index.loaded = True
+    for i, balance in enumerate(balances):
+        index.upsert(f"client-{i}", balance)
+    return index
+
+
+def test_largest_remainder_sums_exactly():
+    assert largest_remainder(100, [1, 1, 1]) == [34, 33, 33]
+    assert largest_remainder(10, [6000, 4000], 10_000) == [6, 4]
+    # recipients configured below 100% only get their part
+    assert sum(largest_remainder(999, [3333, 3333], 10_000)) == 999 * 6666 // 10_000
+
+    rng = random.Random(1)
+    for _ in range(200):
+        weights = [rng.randint(1, 10**6) for _ in range(rng.randint(1, 50))]
+        amount = rng.randint(1, 10**7)
+        shares = largest_remainder(amount, weights)
+        assert sum(shares) == amount
+        assert all(
+            share >= weight * amount // sum(weights)
+            for share, weight in zip(shares, weights)
+        )
+
+
+def test_allocation_never_drifts():
+    rng = random.Random(2)
+    index = _index([rng.randint(1, 500_000) for _ in range(1000)])
+
+    for _ in range(100):
+        amount = rng.randint(1, 400_000)
+        assert sum(share for _, share in index.allocate(amount)) == amount
+
+    # more than the clients hold pays out every balance exactly
+    shares = index.allocate(index.total + 1)
+    assert all(share == index.balance(cid) for cid, share in shares)
+
+
+def test_commission_plan_splits_exactly():
+    plan = _plan("10", "60", "30")
+    assert [r.id for r in plan.recipients] == [
+        "recipient-1",
+        "recipient-2",
+        "recipient-0",
+    ]
+    assert plan.split([100, 7, 0]) == [[60, 30, 10], [4, 2, 1], [0, 0, 0]]
+
+    rng = random.Random(4)
+    plan = _plan("33.33", "33.33", "33.34")
+    amounts = [rng.randint(0, 10**7) for _ in range(500)]
+    for amount, shares in zip(amounts, plan.split(amounts)):
+        assert sum(shares) == amount
+        for share, bp in zip(shares, plan.basis_points):
+            assert abs(share * 10_000 - amount * bp) < 10_000
+
+    # recipients configured below 100% only get their part
+    assert sum(_plan("33.33", "33.33").split([999])[0]) == 999 * 6666 // 10_000
+    with pytest.raises(ValueError):
+        _plan("60", "50")
+
+
+def test_flow_cycle_rows_add_up():
+    rng = random.Random(3)
+    index = _index([rng.randint(100, 500_000) for _ in range(500)])
+    transactions = [
+        add_commission_fields(
+            {
+                "id": f"tx-{i}",
+                "fiat_amount": float(rng.choice([100, 500, 4000])),
+                "crypto_atoms": rng.randint(10_000, 600_000),
+                "commission_percentage": 0.055,
+                "discount_percentage": float(rng.choice([0, 25])),
+            }
+        )
+        for i in range(50)
+    ]
+
+    processed, distributions, commissions = compute_flow_cycle(
+        transactions, index, _plan("33.33", "66.67")
+    )
+    distributed = sum(tx["distribution_cents"] for tx in transactions)
+    commission = sum(tx["commission_cents"] for tx in transactions)
+    assert sum(to_cents(d.amount_fiat) for d in distributions) == distributed
+    assert sum(to_cents(p.flow_distribution_amount) for p in processed) == distributed
+    assert sum(to_cents(c.amount_fiat) for c in commissions) == commission
+    assert sum(d.amount_satoshis for d in distributions) == sum(
+        tx["distribution_cents"] * tx["crypto_atoms"] // tx["fiat_cents"]
+        for tx in transactions
+    )
+
+
+def test_flow_cycle_rows_share_the_cycle_id():
+    transactions = [
+        add_commission_fields(
+            {
+                "id": f"tx-{i}",
+                "fiat_amount": 100.0,
+                "crypto_atoms": 120_000,
+                "commission_percentage": 0.055,
+                "discount_percentage": 0.0,
+            }
+        )
+        for i in range(3)
+    ]
+    processed, distributions, commissions = compute_flow_cycle(
+        transactions, _index([50_000, 50_000]), _plan("40", "60")
+    )
+    [cycle_id] = {p.cycle_id for p in processed}
+    assert cycle_id
+    assert {d.cycle_id for d in distributions} == {cycle_id}
+    assert {c.cycle_id for c in commissions} == {cycle_id}
+    assert all(d.transaction_id is None for d in distributions)
+    assert {c.transaction_id for c in commissions} == {processed[0].id}
+
+    # a single transaction keeps the direct link too
+    processed, distributions, _ = compute_flow_cycle(
+        transactions[:1], _index([50_000]), _plan("100")
+    )
+    assert [d.transaction_id for d in distributions] == [processed[0].id]
+
+
+def _reference_commission(fiat, commission, discount) -> Decimal:
+    value = (
+        Decimal(str(fiat))
+        * Decimal(str(commission))
+        * (1 - Decimal(str(discount)) / 100)
+    )
+    return value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def test_commission_matches_decimal_math():
+    rng = random.Random(3)
+    for _ in range(2000):
+        fiat = float(rng.choice([50, 100, 200, 1000, 4000, 1234.5]))
+        commission = rng.choice([0.03, 0.045, 0.055, 0.06, 0.07])
+        discount = float(rng.choice([0, 10, 25, 50, 90, 100]))
+        tx = add_commission_fields(
+            {
+                "fiat_amount": fiat,
+                "commission_percentage": commission,
+                "discount_percentage": discount,
+            }
+        )
+        expected = _reference_commission(fiat, commission, discount)
+        assert tx["commission_cents"] == int(expected * 100)
+        assert tx["commission_cents"] + tx["distribution_cents"] == tx["fiat_cents"]
+
+
+def test_vectorized_path_matches_streaming(tmp_path):
+    pytest.importorskip("pandas")
+    from ..benchmarks.synthetic import write_synthetic_csv
+
+    write_synthetic_csv(tmp_path / "cash_out_txs.csv", 2000)
+    fetcher = LamassuTransactionFetcher(
+        {
+            "server_ip": "localhost",
+            "server_log_dir": str(tmp_path),
+            "old_server_log_dir": str(tmp_path / "old"),
+        }
+    )
+    keys = ("fiat_cents", "commission_cents", "distribution_cents")
+    streamed = {
+        tx["id"]: tuple(tx[k] for k in keys)
+        for tx in fetcher.collect_dca_transactions()
+    }
+    vectorized = {
+        tx["id"]: tuple(int(tx[k]) for k in keys)
+        for tx in fetcher.vectorized_dca_transactions()
+    }
+    assert streamed and streamed == vectorized
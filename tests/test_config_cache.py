@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import pytest
+
+from .. import crud
+from ..models import UpdateSystemConfigData
+
+
+class CountingDatabase:
+    """Counts the statements reaching the wrapped database."""
+
+    def __init__(self, database):
+        self.database = database
+        self.queries = 0
+
+    async def fetchone(self, *args, **kwargs):
+        self.queries += 1
+        return await self.database.fetchone(*args, **kwargs)
+
+    async def execute(self, *args, **kwargs):
+        self.queries += 1
+        return await self.database.execute(*args, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_reads_are_served_from_memory(database, monkeypatch):
+    await crud.update_system_config(
+        UpdateSystemConfigData(lamassu_server_ip="10.0.0.5")
+    )
+    counting = CountingDatabase(database)
+    monkeypatch.setattr(crud, "db", counting)
+
+    for _ in range(100):
+        config = await crud.get_system_config()
+        assert config and config.lamassu_server_ip == "10.0.0.5"
+    assert counting.queries == 0
+
+
+@pytest.mark.asyncio
+async def test_writes_swap_the_cached_config(database):
+    first = await crud.update_system_config(
+        UpdateSystemConfigData(nostr_relay="wss://a")
+    )
+    second = await crud.update_system_config(
+        UpdateSystemConfigData(payout_concurrency=4)
+    )
+    assert second.version == first.version + 1
+    # fields left out of the update keep their value
+    assert second.nostr_relay == "wss://a"
+    assert await crud.get_system_config() is second
+
+    assert await crud.claim_fixed_slot(None, datetime(2026, 10, 18, 9, 0))
+    config = await crud.get_system_config()
+    assert config.last_fixed_run_at.replace(tzinfo=None) == datetime(2026, 10, 18, 9, 0)
+    assert config.version == second.version + 1
+
+
+@pytest.mark.asyncio
+async def test_other_workers_writes_are_picked_up(database, monkeypatch):
+    cached = await crud.update_system_config(
+        UpdateSystemConfigData(nostr_relay="wss://a")
+    )
+    # another worker updates the row behind this process' back
+    await database.execute(
+        """
+        UPDATE dca_admin.system_config
+        SET nostr_relay = 'wss://b', version = version + 1
+        """
+    )
+    assert await crud.get_system_config() is cached
+
+    # once the check interval has passed, an unchanged version costs one
+    # lookup and a bumped one reloads the row
+    monkeypatch.setattr(crud, "CONFIG_VERSION_CHECK_SECONDS", 0)
+    config = await crud.get_system_config()
+    assert config.nostr_relay == "wss://b"
+    counting = CountingDatabase(database)
+    monkeypatch.setattr(crud, "db", counting)
+    assert await crud.get_system_config() is config
+    assert counting.queries == 1
@@ -0,0 +1,213 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+import pytest_asyncio
+from lnbits.db import Database
+from sqlalchemy.exc import IntegrityError
+
+from .. import crud, services
+from ..dedup import ProcessedIdIndex, processed_ids
+from ..models import CreateDCAClientData
+
+
+def _tx(lamassu_id: str) -> dict:
+    return {
+        "id": lamassu_id,
+        "fiat_amount": 100.0,
+        "crypto_atoms": 120000,
+        "distribution_amount": 99.0,
+        "actual_commission": 1.0,
+    }
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def funded_client(database):
+    """A flow client able to take every transaction the tests process."""
+    return await crud.create_dca_client(
+        CreateDCAClientData(
+            user_id="user", wallet_id="wallet", initial_deposit=Decimal(100_000)
+        ),
+        "admin",
+    )
+
+
+async def _count(database: Database) -> int:
+    row: dict = await database.fetchone(
+        "SELECT COUNT(*) AS c FROM dca_admin.processed_transactions"
+    )
+    return row["c"]
+
+
+@pytest.mark.asyncio
+async def test_known_ids_are_rejected_without_a_query(database, monkeypatch):
+    await services.process_flow_cycle([_tx("a"), _tx("b"), _tx("a")])
+    assert await _count(database) == 2
+    assert "a" in processed_ids and "b" in processed_ids
+
+    async def no_query(lamassu_ids=None):
+        raise AssertionError(f"unexpected lookup of {lamassu_ids}")
+
+    monkeypatch.setattr(services, "get_processed_lamassu_ids", no_query)
+    assert await services.process_flow_cycle([_tx("a"), _tx("b")]) == []
+
+
+@pytest.mark.asyncio
+async def test_restart_warms_index_from_database(database):
+    await services.process_flow_cycle([_tx("a"), _tx("b")])
+
+    # a restarted process starts with an empty index
+    processed_ids.clear()
+    await services.warm_caches()
+    assert len(processed_ids) == 2
+
+    processed = await services.process_flow_cycle([_tx("a"), _tx("b"), _tx("c")])
+    assert [p.lamassu_transaction_id for p in processed] == ["c"]
+    assert await _count(database) == 3
+
+
+@pytest.mark.asyncio
+async def test_stale_index_is_caught_by_database_check(database):
+    other_worker = ProcessedIdIndex()
+    other_worker.load([])
+
+    await services.process_flow_cycle([_tx("a")])
+    assert "a" not in other_worker
+
+    assert await services.process_flow_cycle([_tx("a")], other_worker) == []
+    assert "a" in other_worker
+    assert await _count(database) == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_workers_process_each_id_once(database):
+    workers = [ProcessedIdIndex() for _ in range(4)]
+    for worker in workers:
+        worker.load([])
+
+    batch = [_tx(f"tx-{i}") for i in range(20)]
+    results = await asyncio.gather(
+        *(services.process_flow_cycle(batch, worker) for worker in workers)
+    )
+
+    processed = [p.lamassu_transaction_id for result in results for p in result]
+    assert sorted(processed) == sorted(tx["id"] for tx in batch)
+    assert await _count(database) == 20
+
+
+@pytest.mark.asyncio
+async def test_claimed_transaction_writes_nothing_else(database, funded_client):
+    client = funded_client
+    await services.process_flow_cycle([_tx("a")])
+    before = await crud.get_dca_client(client.id)
+
+    # another worker allocated "a" from a stale index and persists it late
+    flow = await services.get_flow_index()
+    plan = await services.get_commission_plan()
+    late = services.compute_flow_cycle([_tx("a")], flow, plan)
+    with pytest.raises(IntegrityError):
+        await crud.create_flow_cycle(*late)
+
+    after = await crud.get_dca_client(client.id)
+    assert after.current_balance == before.current_balance
+    row = await database.fetchone("SELECT COUNT(*) AS c FROM dca_admin.distributions")
+    assert row["c"] == 1
+
+
+@pytest.mark.asyncio
+async def test_undistributable_cash_is_recorded_as_partial(database):
+    # the client holds 100000.00, the third transaction only fits in part
+    transactions = [
+        {**_tx(f"tx-{i}"), "distribution_amount": amount}
+        for i, amount in enumerate([60_000.0, 39_000.0, 2_500.0, 10.0])
+    ]
+    processed = await services.process_flow_cycle(transactions)
+    assert [(p.status, p.flow_distribution_amount) for p in processed] == [
+        ("completed", Decimal("60000.00")),
+        ("completed", Decimal("39000.00")),
+        ("partial", Decimal("1000.00")),
+        ("partial", Decimal("0.00")),
+    ]
+    assert [p.undistributed_amount for p in processed] == [
+        Decimal("0.00"),
+        Decimal("0.00"),
+        Decimal("1500.00"),
+        Decimal("10.00"),
+    ]
+    rows = await database.fetchall(
+        "SELECT status, undistributed_amount FROM dca_admin.processed_transactions"
+        " ORDER BY lamassu_transaction_id"
+    )
+    assert [(r["status"], r["undistributed_amount"]) for r in rows] == [
+        ("completed", 0),
+        ("completed", 0),
+        ("partial", 1500),
+        ("partial", 10),
+    ]
+
+
+async def _cycle_rows(database: Database) -> dict:
+    counts = {}
+    for table in (
+        "processed_transactions",
+        "distributions",
+        "commission_distributions",
+        "daily_rollups",
+        "daily_transaction_rollups",
+    ):
+        row: dict = await database.fetchone(
+            f"SELECT COUNT(*) AS c FROM dca_admin.{table}"
+        )
+        counts[table] = row["c"]
+    return counts
+
+
+@pytest.mark.asyncio
+async def test_failed_cycle_writes_nothing_and_can_be_retried(
+    database, funded_client, monkeypatch
+):
+    client = funded_client
+    empty = await _cycle_rows(database)
+    execute = crud._execute_in_transaction
+    calls = []
+
+    async def fail_after_first(conn, query, values):
+        calls.append(query)
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        return await execute(conn, query, values)
+
+    monkeypatch.setattr(crud, "_execute_in_transaction", fail_after_first)
+    with pytest.raises(RuntimeError):
+        await services.process_flow_cycle([_tx("a"), _tx("b")])
+    assert "processed_transactions" in calls[0]
+    assert await _cycle_rows(database) == empty
+    after = await crud.get_dca_client(client.id)
+    assert after.current_balance == client.current_balance
+
+    # nothing was marked processed, so the retry distributes the cash
+    monkeypatch.setattr(crud, "_execute_in_transaction", execute)
+    assert len(await services.process_flow_cycle([_tx("a"), _tx("b")])) == 2
+    after = await crud.get_dca_client(client.id)
+    assert after.current_balance == client.current_balance - 198
+
+
+@pytest.mark.asyncio
+async def test_conflict_in_a_later_chunk_keeps_earlier_chunks_out(database):
+    transactions = [_tx(f"tx-{i}") for i in range(crud.WRITE_BATCH_SIZE + 1)]
+    flow = await services.get_flow_index()
+    plan = await services.get_commission_plan()
+    cycle = services.compute_flow_cycle(transactions, flow, plan)
+
+    # another worker already wrote the last transaction, in the second chunk
+    flow = await services.get_flow_index()
+    await crud.create_flow_cycle(
+        *services.compute_flow_cycle(transactions[-1:], flow, plan)
+    )
+    with pytest.raises(IntegrityError):
+        await crud.create_flow_cycle(*cycle)
+    assert await _count(database) == 1
+
+    processed = await services.process_flow_cycle(transactions, ProcessedIdIndex())
+    assert len(processed) == crud.WRITE_BATCH_SIZE
+    assert await _count(database) == crud.WRITE_BATCH_SIZE + 1
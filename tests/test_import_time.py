@@ -0,0 +1,47 @@
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+EXTENSION_DIR = Path(__file__).resolve().parent.parent
+
+# Generous enough for slow CI runners, far below what pandas or psycopg2 cost
+IMPORT_BUDGET_US = 100_000
+
+
+def _import_in_subprocess(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def _cumulative_us(stderr: str, module: str) -> int:
+    pattern = rf"import time:\s+\d+ \|\s+(\d+) \|\s*{re.escape(module)}$"
+    match = re.search(pattern, stderr, re.MULTILINE)
+    assert match, f"{module} not found in -X importtime output"
+    return int(match.group(1))
+
+
+def test_extension_does_not_import_heavy_dependencies():
+    code = (
+        f"import sys; sys.path.insert(0, {str(EXTENSION_DIR.parent)!r})\n"
+        f"import {EXTENSION_DIR.name}\n"
+        "heavy = [m for m in ('pandas', 'psycopg2') if m in sys.modules]\n"
+        "assert not heavy, heavy\n"
+    )
+    _import_in_subprocess(code)
+
+
+def test_fetcher_import_time_budget():
+    # The stdlib modules are already loaded inside LNbits, only count our own
+    code = (
+        f"import sys; sys.path.insert(0, {str(EXTENSION_DIR)!r})\n"
+        "import asyncio, csv, json, logging, pathlib, subprocess\n"
+        "import transaction_fetcher, schema_discovery\n"
+    )
+    result = _import_in_subprocess(code)
+    for module in ("transaction_fetcher", "schema_discovery"):
+        assert _cumulative_us(result.stderr, module) < IMPORT_BUDGET_US
@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from .. import services
+from ..instrumentation import Span, StageMetrics, stage_metrics
+
+
+def test_spans_render_as_prometheus_histograms():
+    metrics = StageMetrics()
+    with metrics.span("fetch") as fetching:
+        fetching.bytes = 2048
+    with pytest.raises(ValueError):
+        with metrics.span("fetch"):
+            raise ValueError("scp failed")
+
+    stats = metrics.snapshot()["fetch"]
+    assert stats.count == 2 and stats.errors == 1 and stats.bytes == 2048
+
+    text = metrics.render({"payout_queue_depth": ("Distributions waiting", 7)})
+    assert 'dca_admin_stage_duration_seconds_bucket{stage="fetch",le="+Inf"} 2' in text
+    assert 'dca_admin_stage_duration_seconds_count{stage="fetch"} 2' in text
+    assert 'dca_admin_stage_bytes_total{stage="fetch"} 2048' in text
+    assert 'dca_admin_stage_errors_total{stage="fetch"} 1' in text
+    assert "dca_admin_payout_queue_depth 7" in text
+
+
+def test_timed_attributes_generator_time_to_its_stage():
+    def slow_rows():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+
+    parsing = Span("parse")
+    assert list(StageMetrics().timed(slow_rows(), parsing)) == [0, 1, 2]
+    assert parsing.rows == 3
+    assert parsing.seconds >= 0.03
+
+
+@pytest.mark.asyncio
+async def test_flow_cycle_records_each_stage(database):
+    stage_metrics.clear()
+    tx = {
+        "id": "a",
+        "fiat_amount": 100.0,
+        "crypto_atoms": 120000,
+        "distribution_amount": 99.0,
+        "actual_commission": 1.0,
+    }
+    await services.process_flow_cycle([tx])
+
+    stats = stage_metrics.snapshot()
+    assert {"dedup", "allocate", "persist"} <= set(stats)
+    assert stats["dedup"].rows == 1
+    assert stats["persist"].rows == 1
+    stage_metrics.clear()
@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import List, Optional
+
+import pytest
+
+from .. import crud
+from ..models import (
+    CreateDCAClientData,
+    DCADistribution,
+    DistributionType,
+    ProcessedTransaction,
+)
+
+NOW = datetime(2026, 10, 18, 12, 0)
+CYCLES = 23
+# cycles sharing a timestamp, so pages end in the middle of a tie
+TIE = 4
+
+
+async def _seed() -> None:
+    """CYCLES flow cycles, each paying one client in "wallet" and one in "other"."""
+    clients = [
+        await crud.create_dca_client(
+            CreateDCAClientData(
+                user_id=f"user-{wallet_id}",
+                wallet_id=wallet_id,
+                initial_deposit=Decimal(1000),
+                fixed_daily_limit=None,
+                notes=None,
+            ),
+            "admin",
+        )
+        for wallet_id in ("wallet", "other")
+    ]
+    for i in range(CYCLES):
+        created = NOW - timedelta(seconds=i // TIE)
+        await crud.create_flow_cycle(
+            [
+                ProcessedTransaction(
+                    id=f"pt-{i:02}",
+                    lamassu_transaction_id=f"tx-{i:02}",
+                    processing_timestamp=created,
+                    flow_distribution_amount=Decimal(2),
+                    commission_amount=Decimal(0),
+                    clients_affected=2,
+                    status="completed",
+                )
+            ],
+            [
+                DCADistribution(
+                    id=f"d-{i:02}-{client.wallet_id}",
+                    client_id=client.id,
+                    transaction_id=f"pt-{i:02}",
+                    amount_fiat=Decimal(1),
+                    amount_satoshis=1_200,
+                    exchange_rate=Decimal(833_333),
+                    distribution_type=DistributionType.FLOW,
+                    payment_hash=None,
+                    payment_request=None,
+                    status="pending",
+                    created_at=created,
+                    completed_at=None,
+                    notes=None,
+                )
+                for client in clients
+            ],
+        )
+
+
+async def _walk(get_page, *wallet_id: str, limit: int) -> List[str]:
+    ids: List[str] = []
+    cursor: Optional[str] = ""
+    while cursor is not None:
+        page = await get_page(*wallet_id, limit, cursor)
+        assert len(page.data) <= limit
+        ids.extend(row.id for row in page.data)
+        cursor = page.next_cursor
+    return ids
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limit", [1, 3, TIE, CYCLES, 100])
+async def test_keyset_walk_covers_ties_once(database, limit):
+    await _seed()
+    # newest first, ties broken by descending id
+    expected = sorted(
+        (f"d-{i:02}-wallet" for i in range(CYCLES)),
+        key=lambda d: (-(int(d[2:4]) // TIE), d),
+        reverse=True,
+    )
+
+    walked = await _walk(crud.get_dca_distributions_page, "wallet", limit=limit)
+    assert walked == expected
+
+    processed = await _walk(crud.get_processed_transactions_page, limit=limit)
+    assert sorted(processed) == sorted(f"pt-{i:02}" for i in range(CYCLES))
+    assert len(set(processed)) == CYCLES
+
+
+@pytest.mark.asyncio
+async def test_keyset_page_rejects_a_zero_limit(database):
+    await _seed()
+    with pytest.raises(ValueError):
+        await crud.get_dca_distributions_page("wallet", 0)
+
+
+@pytest.mark.asyncio
+async def test_api_cursor_round_trip(database):
+    httpx = pytest.importorskip("httpx")
+    from fastapi import FastAPI
+    from lnbits.decorators import require_admin_key
+
+    from ..views_api import MAX_PAGE_SIZE, dca_admin_api_router
+
+    await _seed()
+    app = FastAPI()
+    app.include_router(dca_admin_api_router)
+    app.dependency_overrides[require_admin_key] = lambda: SimpleNamespace(
+        wallet=SimpleNamespace(id="wallet")
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        ids, params = [], {"limit": 5, "cursor": ""}
+        while True:
+            response = await client.get("/api/v1/distributions", params=params)
+            assert response.status_code == 200
+            page = response.json()
+            ids.extend(row["id"] for row in page["data"])
+            if page["next_cursor"] is None:
+                break
+            params["cursor"] = page["next_cursor"]
+        assert len(ids) == len(set(ids)) == CYCLES
+        assert all(distribution.endswith("-wallet") for distribution in ids)
+
+        for limit in (0, MAX_PAGE_SIZE + 1):
+            response = await client.get(
+                "/api/v1/distributions", params={"limit": limit, "cursor": ""}
+            )
+            assert response.status_code == 422
+        response = await client.get(
+            "/api/v1/transactions", params={"cursor": "not-a-cursor"}
+        )
+        assert response.status_code == 400
@@ -0,0 +1,323 @@
+import asyncio
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+from lnbits.core.db import db as core_db
+from lnbits.db import Database
+
+from .. import crud, payouts
+from ..models import CreateDCAClientData
+from ..payouts import (
+    InternalPayoutBackend,
+    PayoutBackend,
+    PayoutDispatcher,
+    backoff_delay,
+)
+
+SOURCE_WALLET = "payout-wallet"
+
+
+class MockBackend(PayoutBackend):
+    def __init__(self, latency: float = 0.01, failures=None):
+        self.latency = latency
+        self.failures = dict(failures or {})  # wallet_id -> failures left
+        self.paid: List[Tuple[str, int]] = []  # in payment order
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # payment_hash -> (wallet_id, amount_sats, status)
+        self.invoices: Dict[str, Tuple[str, int, Optional[str]]] = {}
+
+    async def create_invoice(self, wallet_id, amount_sats, memo):
+        payment_hash = f"hash-{len(self.invoices)}"
+        self.invoices[payment_hash] = (wallet_id, amount_sats, None)
+        return payment_hash, f"lnbc-{payment_hash}"
+
+    async def pay(self, wallet_id, payment_request, amount_sats):
+        assert wallet_id == SOURCE_WALLET
+        payment_hash = payment_request[len("lnbc-") :]
+        target, amount, _ = self.invoices[payment_hash]
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.failures.get(target, 0) > 0:
+                self.failures[target] -= 1
+                raise RuntimeError("route not found")
+            self.invoices[payment_hash] = (target, amount, "success")
+            self.paid.append((target, amount))
+        finally:
+            self.in_flight -= 1
+
+    async def payment_status(self, payment_hash, source_wallet):
+        assert source_wallet == SOURCE_WALLET
+        return self.invoices.get(payment_hash, (None, 0, None))[2]
+
+
+async def _client(wallet_id: str) -> str:
+    client = await crud.create_dca_client(
+        CreateDCAClientData(
+            user_id=f"user-{wallet_id}",
+            wallet_id=wallet_id,
+            initial_deposit=Decimal(1000),
+            fixed_daily_limit=None,
+            notes=None,
+        ),
+        "admin",
+    )
+    return client.id
+
+
+async def _distribution(
+    database: Database, client_id: str, sats: int, created_at: datetime
+) -> None:
+    await database.execute(
+        """
+        INSERT INTO dca_admin.distributions (
+            id, client_id, amount_fiat, amount_satoshis, exchange_rate,
+            distribution_type, status, created_at
+        ) VALUES (
+            :id, :client_id, 1, :sats, 1, 'flow', 'pending', :created_at
+        )
+        """,
+        {
+            "id": f"{client_id}-{sats}",
+            "client_id": client_id,
+            "sats": sats,
+            "created_at": created_at,
+        },
+    )
+
+
+async def _statuses(database: Database) -> dict:
+    rows: List[dict] = await database.fetchall(
+        "SELECT id, status, attempts FROM dca_admin.distributions"
+    )
+    return {row["id"]: (row["status"], row["attempts"]) for row in rows}
+
+
+def test_backoff_is_exponential_and_capped():
+    assert [backoff_delay(n).total_seconds() for n in (1, 2, 3)] == [30, 60, 120]
+    assert backoff_delay(20) == timedelta(hours=1)
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded_and_wallets_stay_ordered(database):
+    start = datetime(2025, 6, 1)
+    for w in range(10):
+        client_id = await _client(f"wallet-{w}")
+        for n in range(3):
+            await _distribution(
+                database, client_id, 100 * w + n + 1, start + timedelta(minutes=n)
+            )
+
+    backend = MockBackend(latency=0.05)
+    dispatcher = PayoutDispatcher(backend, SOURCE_WALLET, concurrency=3)
+    assert await dispatcher.run_once() == 30
+    assert 1 < backend.max_in_flight <= 3
+
+    for w in range(10):
+        amounts = [amount for wallet, amount in backend.paid if wallet == f"wallet-{w}"]
+        assert amounts == [100 * w + 1, 100 * w + 2, 100 * w + 3]
+    assert {status for status, _ in (await _statuses(database)).values()} == {
+        "completed"
+    }
+
+
+class MockInternalBackend(MockBackend):
+    def __init__(self, local):
+        super().__init__()
+        self.local = set(local)
+
+    async def local_wallets(self, wallet_ids):
+        return self.local.intersection(wallet_ids)
+
+
+@pytest.mark.asyncio
+async def test_local_wallets_take_the_internal_path(database):
+    start = datetime(2025, 6, 1)
+    for w in range(4):
+        client_id = await _client(f"wallet-{w}")
+        await _distribution(database, client_id, w + 1, start)
+
+    backend = MockBackend()
+    internal = MockInternalBackend({"wallet-0", "wallet-2"})
+    dispatcher = PayoutDispatcher(backend, SOURCE_WALLET, internal_backend=internal)
+    assert await dispatcher.run_once() == 4
+
+    assert sorted(internal.paid) == [("wallet-0", 1), ("wallet-2", 3)]
+    assert sorted(backend.paid) == [("wallet-1", 2), ("wallet-3", 4)]
+    # local wallets are paid side by side too, within the concurrency limit
+    assert internal.max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_internal_path_respects_the_concurrency_limit(database):
+    start = datetime(2025, 6, 1)
+    wallets = {f"wallet-{w}" for w in range(6)}
+    for wallet_id in sorted(wallets):
+        client_id = await _client(wallet_id)
+        await _distribution(database, client_id, 1, start)
+
+    internal = MockInternalBackend(wallets)
+    dispatcher = PayoutDispatcher(
+        MockBackend(), SOURCE_WALLET, concurrency=3, internal_backend=internal
+    )
+    assert await dispatcher.run_once() == 6
+    assert internal.max_in_flight == 3
+
+
+@pytest.mark.asyncio
+async def test_internal_path_leaves_the_core_database_free(database, monkeypatch):
+    start = datetime(2025, 6, 1)
+    for w in range(3):
+        client_id = await _client(f"wallet-{w}")
+        await _distribution(database, client_id, w + 1, start)
+
+    # other LNbits requests can take the core database between payouts
+    calls = []
+
+    async def get_wallet(wallet_id, conn=None):
+        assert conn is None and not core_db.lock.locked()
+        return SimpleNamespace(id=wallet_id)
+
+    async def create_invoice(wallet_id, amount, memo, extra, internal, conn=None):
+        assert internal and conn is None and not core_db.lock.locked()
+        calls.append(("invoice", wallet_id))
+        return SimpleNamespace(payment_hash=f"hash-{wallet_id}", bolt11="lnbc")
+
+    async def pay_invoice(wallet_id, payment_request, conn=None, **kwargs):
+        assert conn is None and not core_db.lock.locked()
+        calls.append(("pay", wallet_id))
+        return SimpleNamespace(success=True)
+
+    monkeypatch.setattr(payouts, "get_wallet", get_wallet)
+    monkeypatch.setattr(payouts, "create_invoice", create_invoice)
+    monkeypatch.setattr(payouts, "pay_invoice", pay_invoice)
+
+    dispatcher = PayoutDispatcher(
+        MockBackend(), SOURCE_WALLET, internal_backend=InternalPayoutBackend()
+    )
+    assert await dispatcher.run_once() == 3
+    assert calls.count(("pay", SOURCE_WALLET)) == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_payouts_retry_after_backoff(database):
+    start = datetime(2025, 6, 1)
+    client_id = await _client("flaky")
+    await _distribution(database, client_id, 1, start)
+    await _distribution(database, client_id, 2, start + timedelta(minutes=1))
+
+    backend = MockBackend(failures={"flaky": 1})
+    dispatcher = PayoutDispatcher(backend, SOURCE_WALLET)
+    now = datetime.utcnow()
+    assert await dispatcher.run_once(now) == 0
+    # the second payout waits behind the failed first one
+    assert await _statuses(database) == {
+        f"{client_id}-1": ("failed", 1),
+        f"{client_id}-2": ("pending", 0),
+    }
+
+    # before the retry is due the later payout keeps waiting
+    assert await dispatcher.run_once(now + timedelta(seconds=10)) == 0
+    assert backend.paid == []
+
+    assert await dispatcher.run_once(now + timedelta(seconds=31)) == 2
+    assert backend.paid == [("flaky", 1), ("flaky", 2)]
+
+
+@pytest.mark.asyncio
+async def test_restart_resumes_from_distribution_status(database):
+    client_id = await _client("resume")
+    await _distribution(database, client_id, 5, datetime(2025, 6, 1))
+
+    # a previous process created and paid the invoice, then died before
+    # recording completion
+    backend = MockBackend()
+    payment_hash, payment_request = await backend.create_invoice("resume", 5, "")
+    await backend.pay(SOURCE_WALLET, payment_request, 5)
+    await crud.mark_distribution_invoiced(
+        f"{client_id}-5", payment_hash, payment_request
+    )
+
+    dispatcher = PayoutDispatcher(backend, SOURCE_WALLET)
+    assert await dispatcher.run_once() == 1
+    assert backend.paid == [("resume", 5)]
+    assert await _statuses(database) == {f"{client_id}-5": ("completed", 0)}
+
+
+@pytest.mark.asyncio
+async def test_payment_in_flight_is_not_paid_again(database):
+    client_id = await _client("inflight")
+    await _distribution(database, client_id, 5, datetime(2025, 6, 1))
+    await _distribution(database, client_id, 6, datetime(2025, 6, 2))
+
+    # a previous attempt timed out while its payment was still pending
+    backend = MockBackend()
+    payment_hash, payment_request = await backend.create_invoice("inflight", 5, "")
+    backend.invoices[payment_hash] = ("inflight", 5, "pending")
+    await crud.mark_distribution_invoiced(
+        f"{client_id}-5", payment_hash, payment_request
+    )
+    await crud.fail_distribution(f"{client_id}-5", 1, datetime(2025, 6, 1))
+
+    dispatcher = PayoutDispatcher(backend, SOURCE_WALLET)
+    now = datetime.utcnow()
+    assert await dispatcher.run_once(now) == 0
+    assert backend.paid == [] and len(backend.invoices) == 1
+    # no attempt is counted, and the later payout keeps waiting
+    assert await _statuses(database) == {
+        f"{client_id}-5": ("failed", 1),
+        f"{client_id}-6": ("pending", 0),
+    }
+
+    # the payment settles, the next run completes it and pays the next one
+    backend.invoices[payment_hash] = ("inflight", 5, "success")
+    assert await dispatcher.run_once(now) == 2
+    assert backend.paid == [("inflight", 6)]
+
+
+@pytest.mark.asyncio
+async def test_two_workers_never_pay_a_distribution_twice(database):
+    start = datetime(2025, 6, 1)
+    for w in range(5):
+        client_id = await _client(f"wallet-{w}")
+        for n in range(2):
+            await _distribution(
+                database, client_id, 10 * w + n + 1, start + timedelta(minutes=n)
+            )
+
+    # both workers read the same due rows before either claims one
+    backend = MockBackend(latency=0.02)
+    first = PayoutDispatcher(backend, SOURCE_WALLET, concurrency=5)
+    second = PayoutDispatcher(backend, SOURCE_WALLET, concurrency=5)
+    completed = await asyncio.gather(first.run_once(), second.run_once())
+
+    assert sum(completed) + await first.run_once() == 10
+    assert sorted(amount for _, amount in backend.paid) == sorted(
+        10 * w + n + 1 for w in range(5) for n in range(2)
+    )
+    assert len(backend.invoices) == 10
+    assert {status for status, _ in (await _statuses(database)).values()} == {
+        "completed"
+    }
+
+
+@pytest.mark.asyncio
+async def test_abandoned_claim_is_taken_over(database):
+    client_id = await _client("abandoned")
+    await _distribution(database, client_id, 5, datetime(2025, 6, 1))
+    now = datetime.utcnow()
+    assert await crud.claim_distribution(f"{client_id}-5", now)
+    assert not await crud.claim_distribution(f"{client_id}-5", now)
+
+    # the worker holding it died before creating an invoice
+    backend = MockBackend()
+    dispatcher = PayoutDispatcher(backend, SOURCE_WALLET)
+    assert await dispatcher.run_once(now + timedelta(seconds=30)) == 0
+    later = now + timedelta(seconds=crud.PAYOUT_CLAIM_TIMEOUT_SECONDS)
+    assert await dispatcher.run_once(later) == 1
+    assert backend.paid == [("abandoned", 5)]
@@ -0,0 +1,128 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+from .. import crud
+from .. import poller as poller_module
+from ..models import CreateDCAClientData, PollerStatus, SystemConfig
+from ..poller import AdaptiveInterval, LamassuPoller
+
+NOW = datetime(2026, 10, 18, 12, 0)
+
+
+def _tx(lamassu_id: str) -> dict:
+    return {
+        "id": lamassu_id,
+        "fiat_amount": 100.0,
+        "crypto_atoms": 120000,
+        "distribution_amount": 99.0,
+        "actual_commission": 1.0,
+    }
+
+
+class MockFetcher:
+    def __init__(self, config):
+        self.batches = []
+        self.since = []
+        self.watermark = None
+        self.closed = False
+
+    async def fetch_and_process(self, last_processed_time=None):
+        self.since.append(last_processed_time)
+        batch = self.batches.pop(0) if self.batches else []
+        if batch:
+            self.watermark = NOW.replace(tzinfo=timezone.utc)
+        return True, batch
+
+    async def close(self):
+        self.closed = True
+
+
+def test_interval_follows_transaction_rate():
+    interval = AdaptiveInterval(minimum=30, maximum=900, target=2, smoothing=1)
+    assert interval.observe(0, 60) == 900
+    # one transaction a minute -> two minutes per poll
+    assert interval.observe(5, 300) == pytest.approx(120)
+    assert interval.observe(100, 60) == 30
+
+    smoothed = AdaptiveInterval(minimum=30, maximum=900, target=2, smoothing=0.5)
+    assert smoothed.observe(4, 60) == pytest.approx(60)
+    # an empty poll slows down gradually instead of jumping to the maximum
+    assert smoothed.observe(0, 60) == pytest.approx(120)
+
+
+@pytest.mark.asyncio
+async def test_poll_distributes_and_advances_watermark(database, monkeypatch):
+    watermarks = []
+
+    async def set_watermark(timestamp):
+        watermarks.append(timestamp)
+
+    monkeypatch.setattr(poller_module, "set_last_processed_timestamp", set_watermark)
+    status = PollerStatus()
+    poller = LamassuPoller(status, MockFetcher)
+    config = SystemConfig(lamassu_server_ip="10.0.0.1", created_at=NOW, updated_at=NOW)
+
+    fetcher = await poller.get_fetcher(config)
+    fetcher.batches = [[_tx("a"), _tx("b")], [_tx("b"), _tx("c")]]
+    assert await poller.poll_once(config)
+    assert await poller.poll_once(config)
+
+    assert watermarks == [NOW, NOW]
+    assert status.cycles == 2 and status.last_cycle_transactions == 1
+    assert status.last_cycle_seconds is not None
+
+    # new settings replace the fetcher and its SSH connection
+    await poller.get_fetcher(config.copy(update={"lamassu_server_ip": "10.0.0.2"}))
+    assert fetcher.closed and poller.fetcher is not fetcher
+
+
+@pytest.mark.asyncio
+async def test_poll_waits_for_the_previous_cycle_to_be_paid(database, monkeypatch):
+    async def set_watermark(timestamp):
+        pass
+
+    monkeypatch.setattr(poller_module, "set_last_processed_timestamp", set_watermark)
+    client = await crud.create_dca_client(
+        CreateDCAClientData(
+            user_id="user", wallet_id="wallet", initial_deposit=Decimal(10_000)
+        ),
+        "admin",
+    )
+    status = PollerStatus()
+    poller = LamassuPoller(status, MockFetcher)
+    config = SystemConfig(
+        lamassu_server_ip="10.0.0.1",
+        payout_wallet="payouts",
+        created_at=NOW,
+        updated_at=NOW,
+    )
+    fetcher = await poller.get_fetcher(config)
+    fetcher.batches = [[_tx("a")], [_tx("b")]]
+
+    assert await poller.poll_once(config)
+    # the cycle's payout is still queued, the fetcher is left alone
+    assert not await poller.poll_once(config)
+    assert status.skipped_cycles == 1 and len(fetcher.since) == 1
+    # without a payout wallet nothing would ever pay it
+    assert await poller.poll_once(config.copy(update={"payout_wallet": None}))
+    assert len(fetcher.since) == 2
+
+    for distribution in await crud.get_dca_distributions(client.wallet_id):
+        await crud.complete_distribution(distribution.id, NOW)
+    assert await poller.poll_once(config)
+    assert status.skipped_cycles == 1
+
+
+@pytest.mark.asyncio
+async def test_refetched_transactions_do_not_shorten_the_interval(database):
+    poller = LamassuPoller(PollerStatus(), MockFetcher)
+    config = SystemConfig(lamassu_server_ip="10.0.0.1", created_at=NOW, updated_at=NOW)
+    fetcher = await poller.get_fetcher(config)
+    # the overlap behind the watermark returns the same rows every poll
+    fetcher.batches = [[_tx("a"), _tx("b")]] * 3
+    for _ in range(3):
+        assert await poller.poll_once(config)
+    assert poller.interval.rate == 0
+    assert poller.interval.interval == poller.interval.maximum
@@ -0,0 +1,262 @@
+import inspect
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from .. import crud
+from ..models import (
+    CommissionDistribution,
+    CreateCommissionRecipientData,
+    CreateDCAClientData,
+    DCADistribution,
+    DistributionType,
+    ProcessedTransaction,
+    UpdateSystemConfigData,
+)
+
+NOW = datetime(2026, 10, 18, 12, 0)
+
+# Tables that grow with every transaction or client
+LARGE_TABLES = {
+    "clients",
+    "distributions",
+    "processed_transactions",
+    "commission_distributions",
+    "daily_rollups",
+}
+
+# Full scans that are the point of the query
+ALLOWED_SCANS = {
+    ("get_dca_metrics", "clients"),  # system-wide totals
+    ("get_processed_lamassu_ids", "processed_transactions"),  # dedup index load
+}
+
+TABLE_REFERENCE = re.compile(
+    r"(?:FROM|JOIN|UPDATE|INTO)\s+dca_admin\.(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.I
+)
+KEYWORDS = {"where", "set", "join", "on", "order", "group", "limit", "values"}
+
+
+def _tables(statement: str) -> dict:
+    """Alias or table name -> table, for reading SQLite's plan details."""
+    names = {}
+    for table, alias in TABLE_REFERENCE.findall(statement):
+        names[table] = table
+        if alias and alias.lower() not in KEYWORDS:
+            names[alias] = table
+    return names
+
+
+def _full_scans(path: str, statement: str, parameters) -> set:
+    """Tables the statement reads in full, according to EXPLAIN QUERY PLAN."""
+    conn = sqlite3.connect(path)
+    conn.execute("ATTACH DATABASE ? AS dca_admin", (path,))
+    try:
+        plan = [
+            row[-1]
+            for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        ]
+    finally:
+        conn.close()
+    # Walking an index in order stops at the LIMIT, unless the rows still
+    # have to be sorted afterwards
+    sorted_afterwards = "USE TEMP B-TREE FOR ORDER BY" in plan
+    names = _tables(statement)
+    scans = set()
+    for detail in plan:
+        match = re.match(r"SCAN (\S+)( USING (COVERING )?INDEX)?", detail)
+        if match and (not match.group(2) or sorted_afterwards):
+            scans.add(names.get(match.group(1), match.group(1).split(".")[-1]))
+    return scans
+
+
+def _distribution(distribution_id: str, client_id: str, **fields) -> DCADistribution:
+    return DCADistribution(
+        id=distribution_id,
+        client_id=client_id,
+        transaction_id=None,
+        amount_fiat=Decimal(20),
+        amount_satoshis=2_400,
+        exchange_rate=Decimal(833_333),
+        distribution_type=DistributionType.FLOW,
+        status="pending",
+        created_at=NOW,
+        **fields,
+    )
+
+
+def _processed(transaction_id: str, minutes_ago: int = 0) -> ProcessedTransaction:
+    return ProcessedTransaction(
+        id=f"processed-{transaction_id}",
+        lamassu_transaction_id=transaction_id,
+        processing_timestamp=NOW - timedelta(minutes=minutes_ago),
+        flow_distribution_amount=Decimal(10),
+        commission_amount=Decimal(1),
+        clients_affected=1,
+        status="completed",
+    )
+
+
+async def _both_pages(get_page, *wallet_id: str) -> None:
+    page = await get_page(*wallet_id, 1)
+    assert page.next_cursor
+    await get_page(*wallet_id, 1, cursor=page.next_cursor)
+
+
+@pytest.mark.asyncio
+async def test_crud_queries_avoid_full_scans(database):
+    client_data = CreateDCAClientData(
+        user_id="user", wallet_id="wallet", initial_deposit=Decimal(1000)
+    )
+    recipient_data = CreateCommissionRecipientData(
+        wallet_id="operator", wallet_name="operator", allocation_percentage=Decimal(50)
+    )
+    # one active client per user
+    clients = [
+        await crud.create_dca_client(
+            client_data.copy(update={"user_id": f"user-{i}"}), "admin"
+        )
+        for i in range(2)
+    ]
+    recipients = [
+        await crud.create_commission_recipient(recipient_data, "admin")
+        for _ in range(2)
+    ]
+    await crud.create_flow_cycle(
+        [_processed("tx-1", 1), _processed("tx-2", 2)],
+        [_distribution(f"d-{c.id}", c.id) for c in clients],
+        [
+            CommissionDistribution(
+                id=f"c-{r.id}",
+                transaction_id="processed-tx-1",
+                recipient_id=r.id,
+                amount_fiat=Decimal(1),
+                amount_satoshis=120,
+                exchange_rate=Decimal(833_333),
+                status="pending",
+                created_at=NOW,
+            )
+            for r in recipients
+        ],
+    )
+    await crud.update_system_config(UpdateSystemConfigData(nostr_relay="wss://relay"))
+    crud.invalidate_system_config()
+    client, recipient = clients[0], recipients[0]
+    distribution_id = f"d-{client.id}"
+
+    calls = {
+        "create_dca_client": lambda: crud.create_dca_client(
+            client_data.copy(update={"user_id": "user-2"}), "admin"
+        ),
+        "get_dca_client": lambda: crud.get_dca_client(client.id),
+        "get_dca_clients": lambda: crud.get_dca_clients("wallet"),
+        "update_dca_client": lambda: crud.update_dca_client(
+            client.id, client_data.copy(update={"user_id": client.user_id})
+        ),
+        "get_active_flow_clients": crud.get_active_flow_clients,
+        "get_active_fixed_clients": crud.get_active_fixed_clients,
+        "create_commission_recipient": lambda: crud.create_commission_recipient(
+            recipient_data, "admin"
+        ),
+        "get_commission_recipients": lambda: crud.get_commission_recipients("admin"),
+        "get_active_commission_recipients": crud.get_active_commission_recipients,
+        "update_commission_recipient": lambda: crud.update_commission_recipient(
+            recipient.id, recipient_data
+        ),
+        "get_system_config": crud.get_system_config,
+        "claim_fixed_slot": lambda: crud.claim_fixed_slot(None, NOW),
+        "set_last_processed_timestamp": lambda: crud.set_last_processed_timestamp(NOW),
+        "update_system_config": lambda: crud.update_system_config(
+            UpdateSystemConfigData()
+        ),
+        "get_processed_transactions": lambda: crud.get_processed_transactions(
+            "admin", 1, 1
+        ),
+        "get_processed_lamassu_ids": crud.get_processed_lamassu_ids,
+        "get_dca_distributions": lambda: crud.get_dca_distributions("wallet"),
+        "get_commission_distributions": lambda: crud.get_commission_distributions(
+            "operator"
+        ),
+        "get_processed_transactions_page": lambda: _both_pages(
+            crud.get_processed_transactions_page
+        ),
+        "get_dca_distributions_page": lambda: _both_pages(
+            crud.get_dca_distributions_page, "wallet"
+        ),
+        "get_commission_distributions_page": lambda: _both_pages(
+            crud.get_commission_distributions_page, "operator"
+        ),
+        "create_flow_distributions": lambda: crud.create_flow_distributions(
+            _processed("tx-3"), [_distribution("flow", client.id)]
+        ),
+        "create_flow_cycle": lambda: crud.create_flow_cycle(
+            [_processed("tx-4")],
+            [_distribution("cycle", client.id)],
+        ),
+        "create_fixed_distributions": lambda: crud.create_fixed_distributions(
+            [_distribution("fixed", client.id)],
+            NOW,
+            NOW + timedelta(hours=12),
+            NOW,
+            new_day=True,
+        ),
+        "get_due_payouts": lambda: crud.get_due_payouts(NOW),
+        "get_distribution_by_payment_hash": lambda: (
+            crud.get_distribution_by_payment_hash("hash")
+        ),
+        "claim_distribution": lambda: crud.claim_distribution(distribution_id, NOW),
+        "release_distribution": lambda: crud.release_distribution(
+            distribution_id, "pending"
+        ),
+        "mark_distribution_invoiced": lambda: crud.mark_distribution_invoiced(
+            distribution_id, "hash", "lnbc"
+        ),
+        "complete_distribution": lambda: crud.complete_distribution(
+            distribution_id, NOW
+        ),
+        "fail_distribution": lambda: crud.fail_distribution(distribution_id, 1, NOW),
+        "get_payout_queue_depth": crud.get_payout_queue_depth,
+        "get_cycle_unpaid_count": lambda: crud.get_cycle_unpaid_count("cycle"),
+        "get_dca_metrics": lambda: crud.get_dca_metrics("admin"),
+        "get_client_metrics": lambda: crud.get_client_metrics(
+            client.id, Decimal(900_000)
+        ),
+        "get_client_history": lambda: crud.get_client_history(client.id),
+        "delete_commission_recipient": lambda: crud.delete_commission_recipient(
+            recipient.id
+        ),
+        "delete_dca_client": lambda: crud.delete_dca_client(client.id),
+    }
+    public = {
+        name
+        for name, function in inspect.getmembers(crud, inspect.iscoroutinefunction)
+        if not name.startswith("_") and function.__module__ == crud.__name__
+    }
+    assert public == set(calls), "new crud queries need a call here"
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = database.engine.sync_engine
+    event.listen(engine, "before_cursor_execute", capture)
+    full_scans = {}
+    try:
+        for name, call in calls.items():
+            statements.clear()
+            await call()
+            assert statements, f"{name} ran no query"
+            for statement, parameters in statements:
+                if not re.match(r"\s*(SELECT|UPDATE|DELETE|INSERT)", statement, re.I):
+                    continue
+                for table in _full_scans(database.path, statement, parameters):
+                    if table in LARGE_TABLES and (name, table) not in ALLOWED_SCANS:
+                        full_scans.setdefault(name, set()).add(table)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert not full_scans
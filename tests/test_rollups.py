@@ -0,0 +1,251 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+import pytest
+from lnbits.db import Database
+
+from .. import crud, services
+from ..migrations import m009_add_daily_rollups
+from ..models import (
+    CreateDCAClientData,
+    DCADistribution,
+    DCAMode,
+    DistributionType,
+    ProcessedTransaction,
+    UpdateSystemConfigData,
+)
+from ..services import compute_fixed_distributions
+
+DAY = datetime(2026, 10, 17, 9, 0)
+
+
+async def _clients(count: int):
+    clients = []
+    for i in range(count):
+        client = await crud.create_dca_client(
+            CreateDCAClientData(
+                user_id=f"user-{i}",
+                wallet_id=f"wallet-{i}",
+                initial_deposit=Decimal(10_000),
+                dca_mode=DCAMode.FIXED,
+                fixed_daily_limit=None,
+                notes=None,
+            ),
+            "admin",
+        )
+        clients.append(client)
+    return clients
+
+
+def _fiat(value) -> Decimal:
+    return Decimal(str(value)).quantize(Decimal("0.01"))
+
+
+async def _rollups(database: Database):
+    rows: List[dict] = await database.fetchall(
+        """
+        SELECT client_id, day, amount_fiat, amount_satoshis, distribution_count
+        FROM dca_admin.daily_rollups ORDER BY client_id, day
+        """
+    )
+    return [
+        # SQLite keeps DECIMAL columns as floats
+        (
+            r["client_id"],
+            r["day"],
+            _fiat(r["amount_fiat"]),
+            r["amount_satoshis"],
+            r["distribution_count"],
+        )
+        for r in rows
+    ]
+
+
+async def _transaction_rollups(database: Database):
+    rows: List[dict] = await database.fetchall(
+        "SELECT * FROM dca_admin.daily_transaction_rollups ORDER BY day"
+    )
+    return [
+        (r["day"], r["transaction_count"], _fiat(r["flow_distribution_amount"]))
+        for r in rows
+    ]
+
+
+async def _run_days(clients, days: int):
+    await crud.update_system_config(UpdateSystemConfigData(payout_concurrency=None))
+    previous = None
+    for day in range(days):
+        for slot in range(2):
+            now = DAY + timedelta(days=day, hours=12 * slot)
+            distributions = compute_fixed_distributions(
+                clients, Decimal(2000), 2, Decimal(800_000 + 10_000 * day), now
+            )
+            assert await crud.create_fixed_distributions(
+                distributions, now, now, previous
+            )
+            previous = now
+
+
+@pytest.mark.asyncio
+async def test_rollups_follow_distribution_writes(database):
+    clients = await _clients(3)
+    await _run_days(clients, 3)
+
+    rollups = await _rollups(database)
+    assert len(rollups) == 9
+    assert all(count == 2 for *_, count in rollups)
+    assert sum(fiat for _, _, fiat, _, _ in rollups) == Decimal(18_000)
+
+    metrics = await crud.get_client_metrics(clients[0].id, spot_price=Decimal(900_000))
+    client = await crud.get_dca_client(clients[0].id)
+    assert metrics.distribution_count == 6
+    assert metrics.total_satoshis == client.total_satoshis
+    assert metrics.average_rate == (
+        Decimal(6000) * 100_000_000 / client.total_satoshis
+    ).quantize(Decimal("0.01"))
+    assert metrics.performance_vs_spot > 0
+    assert metrics.last_distribution.replace(tzinfo=None) == DAY + timedelta(
+        days=2, hours=12
+    )
+
+    history = await crud.get_client_history(clients[0].id, days=2)
+    assert [r.day for r in history] == ["2026-10-19", "2026-10-18"]
+    assert history[0].average_rate > history[1].average_rate
+
+
+@pytest.mark.asyncio
+async def test_backfill_matches_incremental_rollups(database):
+    clients = await _clients(2)
+    await _run_days(clients, 2)
+    await crud.create_flow_cycle(
+        [
+            ProcessedTransaction(
+                id=f"processed-{i}",
+                lamassu_transaction_id=f"tx-{i}",
+                processing_timestamp=DAY + timedelta(minutes=i),
+                flow_distribution_amount=Decimal("12.34"),
+                commission_amount=Decimal("0.66"),
+                clients_affected=1,
+                status="completed",
+            )
+            for i in range(2)
+        ],
+        [
+            DCADistribution(
+                id="late",
+                client_id=clients[1].id,
+                transaction_id=None,
+                amount_fiat=Decimal("12.34"),
+                amount_satoshis=1_500,
+                exchange_rate=Decimal(822_666),
+                distribution_type=DistributionType.FLOW,
+                status="pending",
+                created_at=DAY,
+            )
+        ],
+    )
+    incremental = await _rollups(database)
+    transactions = await _transaction_rollups(database)
+    assert transactions == [("2026-10-17", 2, Decimal("24.68"))]
+    # the flow distribution was added onto the fixed mode ones of that day
+    assert [r[4] for r in incremental if r[:2] == (clients[1].id, "2026-10-17")] == [3]
+
+    await database.execute("DROP TABLE dca_admin.daily_rollups")
+    await database.execute("DROP TABLE dca_admin.daily_transaction_rollups")
+    await m009_add_daily_rollups(database)
+    assert await _rollups(database) == incremental
+    assert await _transaction_rollups(database) == transactions
+
+
+async def _distribution_sums(database: Database):
+    """Per client per day totals, summed from the distributions themselves."""
+    distributions: List[DCADistribution] = await database.fetchall(
+        "SELECT * FROM dca_admin.distributions", model=DCADistribution
+    )
+    sums: dict = {}
+    for d in distributions:
+        key = (d.client_id, crud._day(d.created_at))
+        fiat, sats, count = sums.get(key, (Decimal(0), 0, 0))
+        sums[key] = (fiat + d.amount_fiat, sats + d.amount_satoshis, count + 1)
+    return [
+        (*key, _fiat(fiat), sats, count)
+        for key, (fiat, sats, count) in sorted(sums.items())
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rollups_reconcile_with_distributions_after_failed_writes(
+    database, monkeypatch
+):
+    clients = await _clients(3)
+    await _run_days(clients, 2)
+
+    # a slot whose write dies halfway adds to neither table
+    execute = crud._execute_in_transaction
+    calls = []
+
+    async def fail_on_rollup(conn, query, values):
+        calls.append(query)
+        if "daily_rollups" in query:
+            raise RuntimeError("connection lost")
+        return await execute(conn, query, values)
+
+    monkeypatch.setattr(crud, "_execute_in_transaction", fail_on_rollup)
+    config = await crud.get_system_config()
+    assert config
+    slot = DAY + timedelta(days=2)
+    with pytest.raises(RuntimeError):
+        await crud.create_fixed_distributions(
+            compute_fixed_distributions(
+                clients, Decimal(2000), 2, Decimal(800_000), slot
+            ),
+            slot,
+            slot,
+            config.last_fixed_run_at,
+        )
+    assert any("INSERT INTO dca_admin.distributions" in q for q in calls)
+    monkeypatch.setattr(crud, "_execute_in_transaction", execute)
+
+    rollups = await _rollups(database)
+    assert rollups == await _distribution_sums(database)
+    assert len(rollups) == 6
+
+
+@pytest.fixture
+def price_feed(monkeypatch):
+    """btc_price calls, answered from `prices` in order."""
+    calls: List[str] = []
+    prices: List = []
+
+    async def btc_price(currency):
+        calls.append(currency)
+        price = prices.pop(0)
+        if isinstance(price, Exception):
+            raise price
+        return price
+
+    monkeypatch.setattr(services, "btc_price", btc_price)
+    monkeypatch.setattr(services, "_spot_prices", {})
+    return calls, prices
+
+
+@pytest.mark.asyncio
+async def test_spot_price_is_cached_and_a_failing_feed_degrades(
+    price_feed, monkeypatch
+):
+    calls, prices = price_feed
+    prices.extend([900_000.5, RuntimeError("feed down"), 950_000])
+    assert await services.get_spot_price("GTQ") == Decimal("900000.5")
+    assert await services.get_spot_price("GTQ") == Decimal("900000.5")
+    assert calls == ["GTQ"]
+
+    monkeypatch.setattr(services, "SPOT_PRICE_TTL", 0.0)
+    assert await services.get_spot_price("GTQ") is None
+    monkeypatch.setattr(services, "SPOT_PRICE_TTL", 60.0)
+    # the failure is remembered too, the feed isn't asked on every request
+    assert await services.get_spot_price("GTQ") is None
+    assert len(calls) == 2
+
+    monkeypatch.setattr(services, "SPOT_PRICE_TTL", 0.0)
+    assert await services.get_spot_price("GTQ") == Decimal(950_000)
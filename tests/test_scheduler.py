@@ -0,0 +1,133 @@
+import asyncio
+from datetime import datetime, time
+from decimal import Decimal
+
+import pytest
+
+from .. import crud, scheduler
+from ..models import (
+    CreateDCAClientData,
+    DCAClient,
+    DCAMode,
+    SystemConfig,
+    UpdateSystemConfigData,
+)
+from ..scheduler import next_slot, run_due_slots, schedule_times, slots_between
+from ..services import compute_fixed_distributions
+
+NOW = datetime(2026, 10, 18, 12, 0)
+
+
+def _config(schedule: str, times: str) -> SystemConfig:
+    return SystemConfig(
+        fixed_mode_schedule=schedule,
+        fixed_mode_time=times,
+        created_at=NOW,
+        updated_at=NOW,
+    )
+
+
+def _client(client_id: str, balance: str, limit=None, today: str = "0") -> DCAClient:
+    return DCAClient(
+        id=client_id,
+        user_id=client_id,
+        wallet_id=client_id,
+        initial_deposit=Decimal(balance),
+        current_balance=Decimal(balance),
+        total_distributed=Decimal(0),
+        total_satoshis=0,
+        dca_mode=DCAMode.FIXED,
+        fixed_daily_limit=Decimal(limit) if limit else None,
+        daily_distributed_today=Decimal(today),
+        last_distribution=None,
+        notes=None,
+        created_at=NOW,
+        updated_at=NOW,
+    )
+
+
+def test_schedule_times():
+    assert schedule_times(_config("daily", "09:00")) == [time(9, 0)]
+    assert schedule_times(_config("twice_daily", "15:30")) == [
+        time(3, 30),
+        time(15, 30),
+    ]
+    assert schedule_times(_config("custom", "18:00, 06:00,12:00")) == [
+        time(6, 0),
+        time(12, 0),
+        time(18, 0),
+    ]
+
+
+def test_missed_slots_are_caught_up_in_order():
+    times = [time(9, 0), time(21, 0)]
+    slots = slots_between(datetime(2026, 10, 16, 21, 0), NOW, times)
+    assert slots == [
+        datetime(2026, 10, 17, 9, 0),
+        datetime(2026, 10, 17, 21, 0),
+        datetime(2026, 10, 18, 9, 0),
+    ]
+    assert next_slot(NOW, times) == datetime(2026, 10, 18, 21, 0)
+    assert next_slot(datetime(2026, 10, 18, 21, 0), times) == datetime(
+        2026, 10, 19, 9, 0
+    )
+
+
+def test_fixed_amounts_are_capped():
+    clients = [
+        _client("default-limit", "5000"),
+        _client("own-limit", "5000", limit="600"),
+        _client("above-max", "5000", limit="3000"),
+        _client("low-balance", "150.25"),
+        _client("nearly-done", "5000", limit="600", today="500"),
+        _client("done", "5000", limit="600", today="600"),
+    ]
+    distributions = compute_fixed_distributions(
+        clients, Decimal(2000), 2, Decimal(800000), NOW
+    )
+    amounts = {d.client_id: d.amount_fiat for d in distributions}
+    assert amounts == {
+        "default-limit": Decimal("1000.00"),
+        "own-limit": Decimal("300.00"),
+        "above-max": Decimal("1000.00"),
+        "low-balance": Decimal("150.25"),
+        "nearly-done": Decimal("100.00"),
+    }
+    assert distributions[0].amount_satoshis == 125_000
+
+
+@pytest.mark.asyncio
+async def test_a_slot_is_paid_once(database, monkeypatch):
+    async def btc_price(currency):
+        return 850_000
+
+    monkeypatch.setattr(scheduler, "btc_price", btc_price)
+    await crud.update_system_config(
+        UpdateSystemConfigData(fixed_mode_schedule="daily", fixed_mode_time="09:00")
+    )
+    await crud.create_dca_client(
+        CreateDCAClientData(
+            user_id="user",
+            wallet_id="wallet",
+            initial_deposit=Decimal(5000),
+            dca_mode=DCAMode.FIXED,
+            fixed_daily_limit=None,
+            notes=None,
+        ),
+        "admin",
+    )
+    assert await crud.claim_fixed_slot(None, datetime(2026, 10, 16, 10, 0))
+    stale = await crud.get_system_config()
+    assert stale
+
+    # two workers waking on the same stale configuration
+    ran = await asyncio.gather(run_due_slots(stale, NOW), run_due_slots(stale, NOW))
+    assert sorted(ran) == [0, 2]
+    # and one still holding it after they finished
+    assert await run_due_slots(stale, NOW) == 0
+
+    rows = await database.fetchall("SELECT created_at FROM dca_admin.distributions")
+    assert len(rows) == 2
+    config = await crud.get_system_config()
+    assert config and config.last_fixed_run_at
+    assert config.last_fixed_run_at.replace(tzinfo=None) == datetime(2026, 10, 18, 9, 0)
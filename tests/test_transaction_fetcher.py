@@ -0,0 +1,335 @@
+import csv
+import io
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from ..transaction_fetcher import (
+    PENDING_HOLD,
+    AsyncLamassuTransactionFetcher,
+    LamassuTransactionFetcher,
+    next_watermark,
+    parse_lamassu_timestamp,
+)
+
+WATERMARK = datetime(2025, 6, 9, 12, 0, tzinfo=timezone.utc)
+
+
+def _row(
+    tx_id: str,
+    created: str,
+    status: str = "confirmed",
+    send: str = "t",
+    error: str = "",
+    note: str = "",
+) -> List[str]:
+    """A positional cash-out export row, `note` goes in an unused text column."""
+    row = [""] * 33
+    row[:13] = [
+        tx_id,
+        "device",
+        "bc1qaddress",
+        "120000",
+        "BTC",
+        "100.00",
+        "GTQ",
+        status,
+        send,
+        "f",
+        note,
+        error,
+        created,
+    ]
+    row[29:32] = ["0.05500", "826091.28", "120000"]
+    return row
+
+
+def _csv(rows: List[List[str]]) -> str:
+    out = io.StringIO()
+    csv.writer(out, lineterminator="\n").writerows(rows)
+    return out.getvalue()
+
+
+def _config(tmp_path: Path, **config) -> Dict[str, str]:
+    return {
+        "server_ip": "10.0.0.1",
+        "server_log_dir": str(tmp_path / "logs"),
+        "old_server_log_dir": str(tmp_path / "logs" / "old"),
+        **config,
+    }
+
+
+def _fetcher(tmp_path: Path, standin=None, **config) -> LamassuTransactionFetcher:
+    fetcher = LamassuTransactionFetcher(_config(tmp_path, **config))
+    if standin is not None:
+        fetcher.remote_dir = str(standin.remote_dir)
+    return fetcher
+
+
+def test_ssh_options_multiplex_one_master_connection(tmp_path):
+    fetcher = _fetcher(
+        tmp_path, ssh_control_dir=str(tmp_path / "ctl"), ssh_control_persist="30"
+    )
+    assert fetcher.ssh_options() == [
+        "-o",
+        "ControlMaster=auto",
+        "-o",
+        f"ControlPath={tmp_path / 'ctl' / '.ssh-root@10.0.0.1'}",
+        "-o",
+        "ControlPersist=30",
+    ]
+    # defaults: the socket lives next to the CSV files for ten minutes
+    fetcher = _fetcher(tmp_path)
+    assert fetcher.ssh_control_path.parent == tmp_path / "logs"
+    assert "ControlPersist=600" in fetcher.ssh_options()
+
+
+def test_fetch_reuses_the_master_connection(tmp_path, ssh_standin):
+    fetcher = _fetcher(tmp_path, ssh_standin, fetch_mode="full")
+    assert fetcher.fetch_remote_data()
+    assert fetcher.fetch_remote_data()
+
+    calls = ssh_standin.calls()
+    # one ssh for all exports and one scp for all files, per fetch
+    assert [call["tool"] for call in calls] == ["ssh", "scp", "ssh", "scp"]
+    assert [call["reused"] for call in calls] == [False, True, True, True]
+    for call in calls:
+        assert call["options"] == {
+            "ControlMaster": "auto",
+            "ControlPath": str(fetcher.ssh_control_path),
+            "ControlPersist": "600",
+        }
+    for filename in fetcher.files.values():
+        assert (fetcher.server_log_dir / filename).exists()
+
+    ssh_standin.clear()
+    fetcher.close()
+    [exit_call] = ssh_standin.calls()
+    assert exit_call["control"] == "exit" and exit_call["reused"]
+    assert not fetcher.ssh_control_path.exists()
+
+
+def test_incremental_export_command(tmp_path):
+    fetcher = _fetcher(tmp_path)
+    command, target = fetcher.incremental_export_command(WATERMARK)
+    assert target == "/tmp/incremental_cash_out_txs.csv"
+    assert command.startswith("export-cash-out && python3 -c ")
+    # a day of margin in whole seconds, the exact cut is made locally
+    assert command.endswith(
+        "'2025-06-08 12:00:00' < /tmp/cash_out_txs.csv"
+        " > /tmp/incremental_cash_out_txs.csv"
+    )
+    # naive watermarks are UTC
+    naive, _ = fetcher.incremental_export_command(WATERMARK.replace(tzinfo=None))
+    assert naive == command
+
+
+def test_incremental_fetch_parses_quoted_commas(tmp_path, ssh_standin):
+    ssh_standin.set_cash_out(
+        _csv(
+            [
+                _row("old", "2025-06-01 10:00:00.5+00", note="a, b, c"),
+                _row("margin", "2025-06-09 02:00:00+00"),
+                _row("at-watermark", "2025-06-09 12:00:00+00"),
+                _row("new", "2025-06-09 12:00:00.000001+00", note="x,y"),
+                _row(
+                    "failed",
+                    "2025-06-09 13:00:00+00",
+                    status="rejected",
+                    error="Invalid address, try again, later",
+                ),
+                _row("newer", "2025-06-09 14:00:00.04+00", note='quoted "," too'),
+            ]
+        )
+    )
+    fetcher = _fetcher(tmp_path, ssh_standin)
+    success, transactions = fetcher.fetch_and_process(WATERMARK)
+    assert success
+    assert [tx["id"] for tx in transactions] == ["new", "newer"]
+    assert all(tx["fiat_amount"] == 100.0 for tx in transactions)
+
+    # the server only sent rows from within the margin on
+    downloaded = (fetcher.server_log_dir / "cash_out_txs.csv").read_text()
+    assert [row[0] for row in csv.reader(io.StringIO(downloaded))] == [
+        "margin",
+        "at-watermark",
+        "new",
+        "failed",
+        "newer",
+    ]
+    [ssh, scp] = ssh_standin.calls()
+    assert scp["args"][0].endswith(
+        ":" + str(ssh_standin.remote_dir / "incremental_cash_out_txs.csv")
+    )
+
+
+def test_full_history_ignores_the_watermark(tmp_path, ssh_standin):
+    ssh_standin.set_cash_out(_csv([_row("old", "2025-06-01 10:00:00+00")]))
+    fetcher = _fetcher(tmp_path, ssh_standin)
+    success, transactions = fetcher.fetch_and_process(None, full_history=True)
+    assert success and [tx["id"] for tx in transactions] == ["old"]
+    [ssh, scp] = ssh_standin.calls()
+    assert ssh["args"][1] == "export-cash-out && export-cash-in && export-out-actions"
+    assert len(scp["args"]) == 4  # three files and the target directory
+
+
+CASH_OUT = [
+    _row("old", "2025-06-01 10:00:00+00"),
+    _row("new", "2025-06-09 13:00:00+00"),
+    _row("pending", "2025-06-09 13:30:00+00", status="authorized"),
+]
+
+
+@pytest.mark.asyncio
+async def test_async_fetch_matches_sync_over_one_connection(tmp_path, ssh_standin):
+    ssh_standin.set_cash_out(_csv(CASH_OUT))
+    sync = _fetcher(tmp_path / "sync", ssh_standin)
+    expected = sync.fetch_and_process(WATERMARK)
+    sync.close()
+    ssh_standin.clear()
+
+    fetcher = AsyncLamassuTransactionFetcher(_config(tmp_path / "async"))
+    fetcher.fetcher.remote_dir = str(ssh_standin.remote_dir)
+    assert not isinstance(fetcher, LamassuTransactionFetcher)
+    assert await fetcher.fetch_and_process(WATERMARK) == expected
+    assert await fetcher.fetch_and_process(WATERMARK) == expected
+    assert [tx["id"] for tx in expected[1]] == ["new"]
+
+    calls = ssh_standin.calls()
+    assert [call["tool"] for call in calls] == ["ssh", "scp", "ssh", "scp"]
+    assert [call["reused"] for call in calls] == [False, True, True, True]
+    await fetcher.close()
+    assert not fetcher.fetcher.ssh_control_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_async_fetch_reports_failed_exports(tmp_path, ssh_standin):
+    (ssh_standin.tables / "cash_out_txs.csv").unlink()
+    fetcher = AsyncLamassuTransactionFetcher(_config(tmp_path))
+    fetcher.fetcher.remote_dir = str(ssh_standin.remote_dir)
+    assert await fetcher.fetch_and_process(WATERMARK) == (False, [])
+    # no download after a failed export
+    assert [call["tool"] for call in ssh_standin.calls()] == ["ssh"]
+    await fetcher.close()
+
+
+def test_pending_transactions_hold_the_watermark_back(tmp_path, ssh_standin):
+    rows = [
+        _row("new", "2025-06-09 13:00:00+00"),
+        _row("pending", "2025-06-09 13:30:00+00", status="authorized"),
+        _row("rejected", "2025-06-09 13:40:00+00", status="rejected", error="x"),
+        _row("newer", "2025-06-09 14:00:00+00"),
+    ]
+    ssh_standin.set_cash_out(_csv(rows))
+    fetcher = _fetcher(tmp_path, ssh_standin)
+    success, transactions = fetcher.fetch_and_process(WATERMARK)
+    assert success and [tx["id"] for tx in transactions] == ["new", "newer"]
+    assert fetcher.last_seen_created == datetime(2025, 6, 9, 14, tzinfo=timezone.utc)
+    assert fetcher.watermark == datetime(
+        2025, 6, 9, 13, 29, 59, 999999, tzinfo=timezone.utc
+    )
+
+    # once confirmed it is picked up, "newer" is fetched again for the dedup
+    rows[1] = _row("pending", "2025-06-09 13:30:00+00")
+    ssh_standin.set_cash_out(_csv(rows))
+    success, transactions = fetcher.fetch_and_process(fetcher.watermark)
+    assert [tx["id"] for tx in transactions] == ["pending", "newer"]
+    assert fetcher.watermark == fetcher.last_seen_created
+
+
+def test_next_watermark():
+    newest = datetime(2025, 6, 9, 14, tzinfo=timezone.utc)
+    pending = newest - timedelta(hours=1)
+    assert next_watermark(None, [pending]) is None
+    assert next_watermark(newest, []) == newest
+    assert next_watermark(newest, [pending, newest]) == pending - timedelta(
+        microseconds=1
+    )
+    # pending before the previous watermark was already given up on
+    assert next_watermark(newest, [pending], pending) == newest
+    # and so are transactions left pending for too long
+    stale = newest - PENDING_HOLD - timedelta(seconds=1)
+    assert next_watermark(newest, [stale]) == newest
+    # a pending row after every qualifying one can't move the watermark past them
+    assert next_watermark(newest, [newest + timedelta(hours=1)]) == newest
+
+
+def test_only_downloads_with_new_transactions_are_archived(tmp_path, ssh_standin):
+    fetcher = _fetcher(tmp_path, ssh_standin)
+    old = fetcher.old_server_log_dir
+    ssh_standin.set_cash_out(_csv([_row("old", "2025-06-01 10:00:00+00")]))
+    for _ in range(3):
+        assert fetcher.fetch_and_process(WATERMARK) == (True, [])
+    assert not list(old.iterdir())
+
+    ssh_standin.set_cash_out(_csv([_row("new", "2025-06-09 13:00:00+00")]))
+    assert fetcher.fetch_and_process(WATERMARK)[0]
+    assert fetcher.fetch_and_process(WATERMARK)[0]
+    # incremental fetches only download the cash-out export
+    assert [path.name[:13] for path in old.iterdir()] == ["cash_out_txs_"]
+
+
+def test_archive_keeps_the_newest_copies(tmp_path):
+    fetcher = _fetcher(tmp_path, archive_keep="2")
+    old = fetcher.old_server_log_dir
+    for second in range(4):
+        for filename in fetcher.files.values():
+            stem = Path(filename).stem
+            (old / f"{stem}_2025-06-09T12:00:{second:02}.csv").write_text("")
+    fetcher.prune_archive()
+    assert sorted(path.name for path in old.glob("cash_out_txs_*.csv")) == [
+        "cash_out_txs_2025-06-09T12:00:02.csv",
+        "cash_out_txs_2025-06-09T12:00:03.csv",
+    ]
+    assert len(list(old.iterdir())) == 2 * len(fetcher.files)
+
+
+def test_row_and_vectorized_paths_agree_on_the_watermark(tmp_path):
+    pytest.importorskip("pandas")
+    fetcher = _fetcher(tmp_path)
+    rows = [
+        _row("equal", "2025-06-09 12:00:00+00"),
+        _row("microsecond-after", "2025-06-09 12:00:00.000001+00"),
+        _row("short-fraction", "2025-06-09 12:00:00.1+00"),
+        _row("microsecond-before", "2025-06-09 11:59:59.999999+00"),
+        # 11:30 UTC, after the watermark as text
+        _row("offset-before", "2025-06-09 17:00:00+05:30"),
+        _row("offset-after", "2025-06-09 17:31:00.5+05:30"),
+        _row("unparseable", "yesterday"),
+    ]
+    (fetcher.server_log_dir / "cash_out_txs.csv").write_text(_csv(rows))
+
+    parsed = fetcher.parse_cash_out_transactions()
+    by_row = fetcher.filter_dca_transactions(parsed, WATERMARK)
+    vectorized = fetcher.vectorized_dca_transactions(WATERMARK)
+    expected = ["microsecond-after", "short-fraction", "offset-after"]
+    assert [tx["id"] for tx in by_row] == expected
+    assert [tx["id"] for tx in vectorized] == expected
+    assert [tx["distribution_cents"] for tx in vectorized] == [
+        tx["distribution_cents"] for tx in by_row
+    ]
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2025-06-10 01:12:42.04+00",
+        "2025-06-10 01:12:42.040000+00:00",
+        # Lamassu servers west of UTC, and the Postgres fetcher's isoformat
+        "2025-06-09 19:12:42.040000-06:00",
+        "2025-06-09 19:12:42.04-06",
+        "2025-06-09 18:42:42.04-0630",
+        "2025-06-10 06:42:42.04+0530",
+    ],
+)
+def test_parse_lamassu_timestamp_offsets(value):
+    expected = datetime(2025, 6, 10, 1, 12, 42, 40000, tzinfo=timezone.utc)
+    assert parse_lamassu_timestamp(value) == expected
+
+
+def test_parse_lamassu_timestamp_without_offset_is_utc():
+    assert parse_lamassu_timestamp("2025-06-09") == datetime(
+        2025, 6, 9, tzinfo=timezone.utc
+    )
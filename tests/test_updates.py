@@ -0,0 +1,103 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from .. import crud, updates
+from ..allocation import to_cents
+from ..models import CreateDCAClientData, DCAMode, UpdateSystemConfigData
+from ..services import process_fixed_slot
+from ..tasks import on_invoice_paid
+
+SLOT = datetime(2026, 10, 18, 9, 0)
+
+
+class NoDatabase:
+    def __getattr__(self, name):
+        raise AssertionError(f"database used: {name}")
+
+
+@pytest.fixture
+def pushed(monkeypatch):
+    """Websocket messages sent, as (channel, delta)."""
+    messages = []
+
+    async def websocket_updater(item_id, data):
+        messages.append((item_id, json.loads(data)))
+
+    monkeypatch.setattr(updates, "websocket_updater", websocket_updater)
+    return messages
+
+
+async def _fixed_clients(count: int):
+    await crud.update_system_config(UpdateSystemConfigData(payout_concurrency=None))
+    return [
+        await crud.create_dca_client(
+            CreateDCAClientData(
+                user_id=f"user-{i}",
+                wallet_id=f"wallet-{i}",
+                initial_deposit=Decimal("1000.50"),
+                dca_mode=DCAMode.FIXED,
+                fixed_daily_limit=None,
+                notes=None,
+            ),
+            "admin",
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_distribution_deltas_match_balances(database, pushed, monkeypatch):
+    clients = await _fixed_clients(3)
+    distributions = await process_fixed_slot(
+        Decimal(2000), 3, Decimal(850_000), SLOT, None
+    )
+    assert len(pushed) == len(distributions) == 3
+
+    config = await crud.get_system_config()
+    assert config and config.updates_channel
+    assert {channel for channel, _ in pushed} == {config.updates_channel}
+    for client in clients:
+        [delta] = [d for _, d in pushed if d["client_id"] == client.id]
+        after = await crud.get_dca_client(client.id)
+        assert delta["event"] == "distributed"
+        assert to_cents(client.current_balance) + to_cents(
+            delta["current_balance_delta"]
+        ) == to_cents(after.current_balance)
+        assert delta["total_satoshis_delta"] == after.total_satoshis
+
+    # publishing is built from the written rows and the cached configuration
+    monkeypatch.setattr(crud, "db", NoDatabase())
+    await updates.publish_distributions(distributions)
+
+
+@pytest.mark.asyncio
+async def test_paid_payout_is_completed_and_announced(database, pushed):
+    [client] = await _fixed_clients(1)
+    [distribution] = await process_fixed_slot(
+        Decimal(2000), 1, Decimal(850_000), SLOT, None
+    )
+    await crud.mark_distribution_invoiced(distribution.id, "hash", "lnbc")
+    pushed.clear()
+
+    await on_invoice_paid(SimpleNamespace(extra={"tag": "other"}, payment_hash="hash"))
+    await on_invoice_paid(
+        SimpleNamespace(extra={"tag": "dca_admin"}, payment_hash="nope")
+    )
+    assert not pushed
+
+    await on_invoice_paid(
+        SimpleNamespace(extra={"tag": "dca_admin"}, payment_hash="hash")
+    )
+    [(channel, delta)] = pushed
+    assert channel not in (client.id, client.wallet_id, client.user_id)
+    assert delta["client_id"] == client.id
+    assert delta["event"] == "paid"
+    assert delta["status"] == "completed"
+    assert delta["total_satoshis_delta"] == 0
+    assert Decimal(delta["current_balance_delta"]) == 0
+    paid = await crud.get_distribution_by_payment_hash("hash")
+    assert paid.status == "completed"
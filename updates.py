@@ -0,0 +1,64 @@
+# Description: DCA Admin Extension - Live client updates
+#
+# Every change to a client's balance is pushed as a JSON delta to the LNbits
+# websocket /api/v1/ws/<updates_channel> when it happens: distributions when
+# they are written, payouts when the client's invoice is paid. A dashboard
+# keeps its numbers current from these instead of polling the clients and
+# metrics endpoints.
+#
+# LNbits lets anyone who knows a websocket id listen on it, and client ids
+# show up in URLs and logs, so deltas never go out on those. updates_channel
+# is a random id kept in the system configuration, which only admin key
+# holders can read from /api/v1/config.
+
+import json
+from typing import Dict, Iterable
+
+from lnbits.core.services import websocket_updater
+from loguru import logger
+
+from .allocation import from_cents, to_cents
+from .crud import get_system_config
+from .models import DCADistribution
+
+
+def distribution_delta(distribution: DCADistribution, event: str) -> Dict:
+    """
+    The change a distribution event makes to its client. Balances move when
+    the distribution is written, its payout only changes the status.
+    """
+    distributed = event == "distributed"
+    fiat = to_cents(distribution.amount_fiat) if distributed else 0
+    return {
+        "event": event,
+        "client_id": distribution.client_id,
+        "distribution_id": distribution.id,
+        "status": distribution.status,
+        "amount_fiat": str(distribution.amount_fiat),
+        "amount_satoshis": distribution.amount_satoshis,
+        "current_balance_delta": str(from_cents(-fiat)),
+        "total_distributed_delta": str(from_cents(fiat)),
+        "total_satoshis_delta": distribution.amount_satoshis if distributed else 0,
+    }
+
+
+async def publish(deltas: Iterable[Dict]) -> None:
+    """Push deltas to the admin updates channel, never failing the caller."""
+    try:
+        config = await get_system_config()
+        if not config or not config.updates_channel:
+            return
+        for delta in deltas:
+            await websocket_updater(config.updates_channel, json.dumps(delta))
+    except Exception as exc:
+        logger.warning(f"DCA updates not sent: {exc}")
+
+
+async def publish_distributions(distributions: Iterable[DCADistribution]) -> None:
+    """Announce freshly written distributions."""
+    await publish(distribution_delta(d, "distributed") for d in distributions)
+
+
+async def publish_payout(distribution: DCADistribution) -> None:
+    """Announce that a distribution's payout reached the client's wallet."""
+    await publish([distribution_delta(distribution, "paid")])
@@ -1,9 +1,10 @@
 # Description: This file contains the extensions API endpoints.
 
 from http import HTTPStatus
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import PlainTextResponse
 from lnbits.core.crud import get_user
 from lnbits.core.models import WalletTypeInfo
 from lnbits.core.services import create_invoice
@@ -22,19 +23,29 @@ from .crud import (
     update_dca_client,
     delete_dca_client,
     create_commission_recipient,
+    get_active_commission_recipients,
     get_commission_recipients,
     update_commission_recipient,
     delete_commission_recipient,
     get_system_config,
     update_system_config,
     get_processed_transactions,
+    get_processed_transactions_page,
     get_dca_distributions,
+    get_dca_distributions_page,
     get_commission_distributions,
+    get_commission_distributions_page,
     get_dca_metrics,
     get_client_metrics,
+    get_client_history,
+    get_payout_queue_depth,
 )
 from .helpers import lnurler
-from .models import CreateSatoshiMachineData, CreatePayment, SatoshiMachine, CreateDCAClientData, DCAClient, CreateCommissionRecipientData, CommissionRecipient, UpdateSystemConfigData, SystemConfig, DCAMetrics, ClientMetrics
+from .instrumentation import stage_metrics
+from .models import CreateSatoshiMachineData, CreatePayment, SatoshiMachine, CreateDCAClientData, DCAClient, CreateCommissionRecipientData, CommissionRecipient, UpdateSystemConfigData, SystemConfig, DCAMetrics, ClientMetrics, DailyRollup, PollerStatus
+from .poller import poller_status
+from .scheduler import FIAT_CURRENCY
+from .services import get_spot_price
 
 dca_admin_api_router = APIRouter()
 
@@ -259,6 +270,20 @@ async def api_delete_client(
 ##### COMMISSION RECIPIENT ENDPOINTS ##
 #######################################
 
+async def check_commission_allocation(
+    data: CreateCommissionRecipientData, recipient_id: Optional[str] = None
+) -> None:
+    """Refuse a recipient write that would split out more than 100% of commissions."""
+    others = await get_active_commission_recipients()
+    total = data.allocation_percentage + sum(
+        r.allocation_percentage for r in others if r.id != recipient_id
+    )
+    if total > 100:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f"Commission allocations would total {total}%, more than 100%.",
+        )
+
 @dca_admin_api_router.get("/api/v1/commission-recipients")
 async def api_get_commission_recipients(
     wallet: WalletTypeInfo = Depends(require_admin_key),
@@ -272,6 +297,7 @@ async def api_create_commission_recipient(
     wallet: WalletTypeInfo = Depends(require_admin_key),
 ) -> CommissionRecipient:
     """Create a new commission recipient."""
+    await check_commission_allocation(data)
     return await create_commission_recipient(data, wallet.wallet.id)
 
 @dca_admin_api_router.put("/api/v1/commission-recipients/{recipient_id}")
@@ -281,6 +307,7 @@ async def api_update_commission_recipient(
     wallet: WalletTypeInfo = Depends(require_admin_key),
 ) -> CommissionRecipient:
     """Update a commission recipient."""
+    await check_commission_allocation(data, recipient_id)
     return await update_commission_recipient(recipient_id, data)
 
 @dca_admin_api_router.delete("/api/v1/commission-recipients/{recipient_id}")
@@ -316,35 +343,72 @@ async def api_update_config(
     """Update system configuration."""
     return await update_system_config(data)
 
+@dca_admin_api_router.get("/api/v1/poller")
+async def api_get_poller_status(
+    wallet: WalletTypeInfo = Depends(require_admin_key),
+) -> PollerStatus:
+    """Get the Lamassu polling task's interval, cycle duration and payout queue depth."""
+    return poller_status.copy(update={"queue_depth": await get_payout_queue_depth()})
+
 #######################################
 ##### TRANSACTION ENDPOINTS ##########
 #######################################
 
+# Listings support two pagination modes. Without `cursor` they keep the
+# original limit/offset behaviour and return a plain list. Passing `cursor`
+# (empty for the first page) switches to keyset pagination and returns a
+# CursorPage whose `next_cursor` fetches the following page.
+MAX_PAGE_SIZE = 1000
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(
+        status_code=HTTPStatus.BAD_REQUEST,
+        detail="Invalid pagination cursor."
+    )
+
 @dca_admin_api_router.get("/api/v1/transactions")
 async def api_get_transactions(
     wallet: WalletTypeInfo = Depends(require_admin_key),
-    limit: int = 100,
-    offset: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
 ):
     """Get processed transactions."""
+    if cursor is not None:
+        try:
+            return await get_processed_transactions_page(limit, cursor)
+        except ValueError:
+            raise _invalid_cursor()
     return await get_processed_transactions(wallet.wallet.id, limit, offset)
 
 @dca_admin_api_router.get("/api/v1/distributions")
 async def api_get_distributions(
     wallet: WalletTypeInfo = Depends(require_admin_key),
-    limit: int = 100,
-    offset: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
 ):
     """Get DCA distributions."""
+    if cursor is not None:
+        try:
+            return await get_dca_distributions_page(wallet.wallet.id, limit, cursor)
+        except ValueError:
+            raise _invalid_cursor()
     return await get_dca_distributions(wallet.wallet.id, limit, offset)
 
 @dca_admin_api_router.get("/api/v1/commission-distributions")
 async def api_get_commission_distributions(
     wallet: WalletTypeInfo = Depends(require_admin_key),
-    limit: int = 100,
-    offset: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
 ):
     """Get commission distributions."""
+    if cursor is not None:
+        try:
+            return await get_commission_distributions_page(wallet.wallet.id, limit, cursor)
+        except ValueError:
+            raise _invalid_cursor()
     return await get_commission_distributions(wallet.wallet.id, limit, offset)
 
 #######################################
@@ -364,4 +428,32 @@ async def api_get_client_metrics(
     wallet: WalletTypeInfo = Depends(require_admin_key),
 ) -> ClientMetrics:
     """Get metrics for a specific client."""
-    return await get_client_metrics(client_id)
+    return await get_client_metrics(client_id, await get_spot_price(FIAT_CURRENCY))
+
+@dca_admin_api_router.get("/api/v1/clients/{client_id}/history")
+async def api_get_client_history(
+    client_id: str,
+    days: int = Query(90, ge=1, le=3650),
+    wallet: WalletTypeInfo = Depends(require_admin_key),
+) -> List[DailyRollup]:
+    """Get a client's daily distribution totals, newest day first."""
+    return await get_client_history(client_id, days)
+
+#######################################
+##### INTERNAL ENDPOINTS #############
+#######################################
+
+@dca_admin_api_router.get("/api/v1/internal/metrics", response_class=PlainTextResponse)
+async def api_get_internal_metrics(
+    wallet: WalletTypeInfo = Depends(require_admin_key),
+) -> PlainTextResponse:
+    """Per-stage processing timings in the Prometheus text format."""
+    gauges = {
+        "payout_queue_depth": ("Distributions waiting for payout", await get_payout_queue_depth()),
+        "poll_interval_seconds": ("Wait before the next Lamassu poll", poller_status.interval_seconds),
+        "poll_transaction_rate": ("Smoothed DCA transactions per hour", poller_status.transaction_rate),
+        "poll_last_cycle_seconds": ("Duration of the last poll cycle", poller_status.last_cycle_seconds or 0),
+    }
+    return PlainTextResponse(
+        stage_metrics.render(gauges), media_type="text/plain; version=0.0.4"
+    )